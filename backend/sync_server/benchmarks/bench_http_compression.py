@@ -0,0 +1,69 @@
+"""HTTP 压缩基准：代表性快照在 identity/gzip/zstd 下的传输字节与端到端耗时估算。
+
+    python benchmarks/bench_http_compression.py [--tasks 200 2000 10000] [--mbps 10]
+
+耗时 = 服务端压缩 + 按 `--mbps` 估算的传输时间 + 客户端解压。
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fixtures import build_tools_data
+
+from sync_server.http_compression import compress_body, supported_encodings, zstandard
+
+
+def _decompress(payload: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(payload)
+    return zstandard.ZstdDecompressor().decompress(payload)
+
+
+def _best_of(repeat: int, func: Callable[..., bytes], *args: Any) -> tuple[bytes, float]:
+    best = float("inf")
+    result = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, nargs="+", default=[200, 2000, 10000])
+    parser.add_argument("--mbps", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bytes_per_ms = args.mbps * 1_000_000 / 8 / 1000
+    print(f"{'tasks':>7}{'encoding':>10}{'KiB':>10}{'ratio':>8}{'enc ms':>9}{'dec ms':>9}{'total ms':>10}")
+    for task_count in args.tasks:
+        body = json.dumps(
+            {"tools_data": build_tools_data(task_count=task_count)},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        print(
+            f"{task_count:>7}{'identity':>10}{len(body) / 1024:>10.1f}{1.0:>8.2f}{0:>9.1f}{0:>9.1f}"
+            f"{len(body) / bytes_per_ms:>10.1f}"
+        )
+        for encoding in supported_encodings():
+            payload, encode_s = _best_of(args.repeat, compress_body, body, encoding)
+            restored, decode_s = _best_of(args.repeat, _decompress, payload, encoding)
+            assert restored == body
+            total_ms = encode_s * 1000 + len(payload) / bytes_per_ms + decode_s * 1000
+            print(
+                f"{task_count:>7}{encoding:>10}{len(payload) / 1024:>10.1f}{len(body) / len(payload):>8.2f}"
+                f"{encode_s * 1000:>9.1f}{decode_s * 1000:>9.1f}{total_ms:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""行列表差异基准：按下标比较 vs 按 id 配对（含 Merkle 行 hash）。
+
+    python benchmarks/bench_list_diff.py [--rows 10000] [--rounds 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fixtures import build_tools_data
+
+from sync_server.merkle_index import index_tools_data
+from sync_server.sync_diff import build_tools_diff
+
+
+def _insert_top(tasks: list[dict[str, Any]]) -> None:
+    tasks.insert(0, {**tasks[0], "id": -1, "title": "新任务"})
+
+
+def _modify_five(tasks: list[dict[str, Any]]) -> None:
+    for row in tasks[:: max(1, len(tasks) // 5)][:5]:
+        row["status"] = 9
+
+
+def _delete_middle(tasks: list[dict[str, Any]]) -> None:
+    del tasks[len(tasks) // 2]
+
+
+def _move_last_to_top(tasks: list[dict[str, Any]]) -> None:
+    tasks.insert(0, tasks.pop())
+
+
+_SCENARIOS: dict[str, Callable[[list[dict[str, Any]]], None]] = {
+    "insert top": _insert_top,
+    "modify 5": _modify_five,
+    "delete middle": _delete_middle,
+    "move last->top": _move_last_to_top,
+}
+
+
+def _time(rounds: int, fn: Callable[[], dict[str, Any]]) -> tuple[float, dict[str, Any]]:
+    result = fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    base = {"work_log": build_tools_data(task_count=args.rows, entries_per_task=1)["work_log"]}
+    base_merkle = {tool_id: index for tool_id, (_, index) in index_tools_data(base).items()}
+    print(f"tasks={args.rows} time_entries={len(base['work_log']['data']['time_entries'])}")
+    print(f"{'scenario':<16}{'mode':<12}{'ms':>9}{'items':>7}  changes")
+
+    for name, mutate in _SCENARIOS.items():
+        client = copy.deepcopy(base)
+        mutate(client["work_log"]["data"]["tasks"])
+        client_merkle = {tool_id: index for tool_id, (_, index) in index_tools_data(client).items()}
+        modes: dict[str, Callable[[], dict[str, Any]]] = {
+            "positional": lambda: build_tools_diff(
+                server_tools_data=base, client_tools_data=client, match_rows_by_id=False
+            ),
+            "by id": lambda: build_tools_diff(server_tools_data=base, client_tools_data=client),
+            "by id+hash": lambda: build_tools_diff(
+                server_tools_data=base,
+                client_tools_data=client,
+                server_merkle=base_merkle,
+                client_merkle=client_merkle,
+            ),
+        }
+        for mode, fn in modes.items():
+            ms, result = _time(args.rounds, fn)
+            items = result["tools"]["work_log"]["diff_items"]
+            changes = sorted({item["change"] for item in items})
+            print(f"{name:<16}{mode:<12}{ms:>9.2f}{len(items):>7}  {','.join(changes)}")
+
+
+if __name__ == "__main__":
+    main()
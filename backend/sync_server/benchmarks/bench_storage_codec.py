@@ -0,0 +1,80 @@
+"""存储压缩基准：压缩率与编解码 CPU 成本。
+
+    python benchmarks/bench_storage_codec.py [--users 20] [--tasks 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from fixtures import build_tools_data
+
+from sync_server.storage_codec import StorageCodec, is_algorithm_available, train_dictionary
+from sync_server.sync_diff import hash_tool_snapshot
+
+
+def _bench(codec: StorageCodec, texts: list[str]) -> tuple[int, float, float]:
+    encoded = []
+    started = time.perf_counter()
+    for text in texts:
+        encoded.append(codec.encode(text))
+    encode_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for tag, payload in encoded:
+        codec.decode(tag, payload)
+    decode_s = time.perf_counter() - started
+
+    size = sum(len(payload) if isinstance(payload, bytes) else len(payload.encode("utf-8")) for _, payload in encoded)
+    return size, encode_s, decode_s
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=200)
+    args = parser.parse_args()
+
+    # 与存储层一致：按工具拆成规范化 JSON 块
+    texts = [
+        hash_tool_snapshot(tool)[0]
+        for seed in range(args.users)
+        for tool in build_tools_data(task_count=args.tasks, seed=seed).values()
+    ]
+    raw_size = sum(len(text.encode("utf-8")) for text in texts)
+    train_texts = texts[: len(texts) // 2]
+    eval_texts = texts[len(texts) // 2 :]
+    eval_raw = sum(len(text.encode("utf-8")) for text in eval_texts)
+
+    print(f"blobs={len(texts)} raw={raw_size / 1024:.1f} KiB (eval half: {eval_raw / 1024:.1f} KiB)")
+    print(f"{'codec':<14}{'size KiB':>10}{'ratio':>8}{'enc MB/s':>10}{'dec MB/s':>10}")
+
+    for algorithm in ("zlib", "zstd"):
+        if not is_algorithm_available(algorithm):
+            print(f"{algorithm:<14}  (not installed)")
+            continue
+        dictionary = train_dictionary(algorithm, train_texts)
+        variants = {
+            algorithm: StorageCodec(algorithm=algorithm, dictionary_loader=lambda _id: None),
+            f"{algorithm}+dict": StorageCodec(
+                algorithm=algorithm,
+                dictionary_loader={1: dictionary}.get,
+                active_dictionary_id=1,
+            ),
+        }
+        for name, codec in variants.items():
+            size, encode_s, decode_s = _bench(codec, eval_texts)
+            mb = eval_raw / 1024 / 1024
+            print(
+                f"{name:<14}{size / 1024:>10.1f}{eval_raw / max(size, 1):>8.2f}"
+                f"{mb / max(encode_s, 1e-9):>10.1f}{mb / max(decode_s, 1e-9):>10.1f}"
+            )
+
+    sample = json.dumps(build_tools_data(task_count=args.tasks), ensure_ascii=False)
+    print(f"single full snapshot: {len(sample.encode('utf-8')) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
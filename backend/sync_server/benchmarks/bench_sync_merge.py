@@ -0,0 +1,66 @@
+"""三方合并基准：按 id 逐行合并的耗时应随行数线性增长。
+
+    python benchmarks/bench_sync_merge.py [--tasks 20000] [--entries-per-task 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any
+
+from fixtures import build_tools_data
+
+from sync_server.sync_merge import merge_tools_data
+
+
+def _diverge(base: dict[str, Any], *, step: int, new_id_base: int, marker: str) -> dict[str, Any]:
+    """复制 `base` 并模拟一台设备的离线编辑：改写、删除与新增各占少量行。"""
+
+    tools = json.loads(json.dumps(base))
+    data = tools["work_log"]["data"]
+    entries = data["time_entries"]
+    for row in entries[::step]:
+        row["content"] = f"{row['content']}（{marker}）"
+        row["updated_at"] += step
+    del entries[1 :: step * 10]
+    entries.extend({**entries[0], "id": new_id_base + n, "content": marker} for n in range(len(entries) // step))
+    for row in data["tasks"][::step]:
+        row["title"] = f"{row['title']}（{marker}）"
+        row["updated_at"] += step
+    return tools
+
+
+def _count_rows(tools_data: dict[str, Any]) -> int:
+    return sum(
+        len(rows) for tool in tools_data.values() for rows in tool["data"].values() if isinstance(rows, list)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--entries-per-task", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'lww rows':>10}{'best ms':>10}{'rows/ms':>10}")
+    for scale in (4, 2, 1):
+        base = build_tools_data(task_count=args.tasks // scale, entries_per_task=args.entries_per_task)
+        server = _diverge(base, step=100, new_id_base=10**9, marker="服务端")
+        client = _diverge(base, step=150, new_id_base=2 * 10**9, marker="客户端")
+        rows = _count_rows(base)
+
+        best = float("inf")
+        result = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = merge_tools_data(base=base, server=server, client=client)
+            best = min(best, time.perf_counter() - started)
+        assert result is not None
+        print(f"{rows:>10}{result.lww_rows:>10}{best * 1000:>10.1f}{rows / max(best * 1000, 1e-9):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
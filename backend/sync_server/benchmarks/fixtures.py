@@ -0,0 +1,74 @@
+"""基准测试共用的“代表性”快照生成器（结构对齐客户端各工具的导出格式）。"""
+
+from __future__ import annotations
+
+import os
+import random
+import sys
+from typing import Any
+
+# 让 `python benchmarks/xxx.py` 可以直接 import `sync_server.*`
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+_TITLES = ["整理周报", "需求评审", "修复同步冲突", "准备季度汇报", "客户回访", "代码走查"]
+_CONTENTS = ["产出初稿", "和产品对齐范围", "补充测试用例", "处理线上反馈", "更新文档"]
+_ITEMS = ["大米", "鸡蛋", "牛奶", "洗衣液", "抽纸", "酱油", "苹果"]
+
+
+def build_tools_data(*, task_count: int = 200, entries_per_task: int = 5, seed: int = 0) -> dict[str, Any]:
+    rng = random.Random(seed)
+    base_ms = 1730000000000
+    tasks = [
+        {
+            "id": i,
+            "title": f"{rng.choice(_TITLES)} #{i}",
+            "description": "补齐项目进度与风险说明" if i % 3 else "",
+            "status": rng.randint(0, 3),
+            "estimated_minutes": rng.choice([30, 60, 90, 120]),
+            "is_pinned": 1 if i % 17 == 0 else 0,
+            "sort_index": i,
+            "created_at": base_ms + i * 1000,
+            "updated_at": base_ms + i * 1000 + rng.randint(0, 999),
+        }
+        for i in range(1, task_count + 1)
+    ]
+    time_entries = [
+        {
+            "id": task["id"] * 100 + n,
+            "task_id": task["id"],
+            "work_date": base_ms + n * 86400000,
+            "minutes": rng.choice([15, 30, 45, 60]),
+            "content": rng.choice(_CONTENTS),
+            "created_at": base_ms + n,
+            "updated_at": base_ms + n + rng.randint(0, 999),
+        }
+        for task in tasks
+        for n in range(entries_per_task)
+    ]
+    items = [
+        {
+            "id": i,
+            "name": f"{rng.choice(_ITEMS)}{i}",
+            "quantity": rng.randint(0, 20),
+            "unit": "件",
+            "updated_at": base_ms + i,
+        }
+        for i in range(1, max(2, task_count // 2))
+    ]
+    return {
+        "work_log": {
+            "version": 1,
+            "data": {"tasks": tasks, "time_entries": time_entries, "task_tags": [], "operation_logs": []},
+        },
+        "work_photo": {"version": 1, "data": {"capture_items": []}},
+        "stockpile_assistant": {"version": 1, "data": {"items": items, "consumptions": []}},
+        "overcooked_kitchen": {"version": 1, "data": {"recipes": [], "meals": []}},
+        "tag_manager": {
+            "version": 1,
+            "data": {"tags": [{"id": i, "name": f"标签{i}", "updated_at": base_ms} for i in range(20)]},
+        },
+        "xiao_mi": {"version": 1, "data": {"conversations": []}},
+        "app_config": {"version": 1, "updated_at_ms": base_ms, "data": {"settings": {}, "ai_config": None}},
+    }
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any
+
+from .merkle_index import ToolMerkleIndex, index_tools_data
+from .storage import SqliteSnapshotStore, SyncRecord, UserSnapshot
+from .sync_diff import build_tools_diff
+
+DEFAULT_AUDIT_DIFF_WORKERS = 1
+DEFAULT_AUDIT_DIFF_MAX_PENDING = 256
+# pending 记录超过该时长仍未算完，视为写入它的进程已退出，可由其它进程认领重算
+DEFAULT_AUDIT_DIFF_STALE_AFTER_MS = 5 * 60 * 1000
+
+
+class AuditDiffWorker:
+    """同步记录 diff 的后台计算：请求只提交记录与前后 revision，diff 由有界线程池回填。
+
+    排队任务超过 `max_pending` 时由提交方线程直接计算（背压），内存占用有上限、记录也不会丢；
+    进程退出时仍未算完的记录由 `resume_pending()` 在下次启动时认领，按前后 revision 从历史快照重算。
+    """
+
+    def __init__(
+        self,
+        *,
+        store: SqliteSnapshotStore,
+        max_workers: int = DEFAULT_AUDIT_DIFF_WORKERS,
+        max_pending: int = DEFAULT_AUDIT_DIFF_MAX_PENDING,
+        stale_after_ms: int = DEFAULT_AUDIT_DIFF_STALE_AFTER_MS,
+    ) -> None:
+        self._store = store
+        self._stale_after_ms = max(0, int(stale_after_ms))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="audit-diff")
+        self._max_pending = max(1, int(max_pending))
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._closed = False
+
+    def submit(self, record_id: int, compute_diff: Callable[[], dict[str, Any]]) -> None:
+        with self._idle:
+            # 持锁提交：close() 关闭线程池前一定先看到这里的计数，不会向已关闭的线程池提交
+            queued = not self._closed and self._pending < self._max_pending
+            if queued:
+                self._pending += 1
+                self._executor.submit(self._run, partial(self._store.run_deferred_diff, record_id, compute_diff))
+        if not queued:
+            self._store.run_deferred_diff(record_id, compute_diff)
+
+    def resume_pending(self) -> bool:
+        """在后台逐批认领遗留的 pending 记录并重算，直到没有可认领的记录；已关闭时返回 False。
+
+        只认领超过 `stale_after_ms` 未算完的记录，其它仍在运行的进程刚写入的记录不受影响。
+        """
+
+        with self._idle:
+            if self._closed:
+                return False
+            self._pending += 1
+            self._executor.submit(self._run, self._resume_stale)
+        return True
+
+    def wait_idle(self, timeout_s: float | None = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout_s)
+
+    def close(self) -> None:
+        with self._idle:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+
+    def _resume_stale(self) -> None:
+        while not self._closed:
+            records = self._store.claim_stale_sync_record_diffs(
+                now_ms=int(time.time() * 1000),
+                stale_after_ms=self._stale_after_ms,
+                limit=self._max_pending,
+            )
+            if not records:
+                return
+            for record in records:
+                if self._closed:
+                    # 已认领但未算的记录在认领过期后由下次启动重新认领
+                    return
+                self._store.run_deferred_diff(record.id, partial(diff_from_history, self._store, record))
+
+    def _run(self, task: Callable[[], None]) -> None:
+        try:
+            task()
+        finally:
+            with self._idle:
+                self._pending -= 1
+                self._idle.notify_all()
+
+
+def build_snapshot_diff(
+    store: SqliteSnapshotStore,
+    *,
+    snapshot: UserSnapshot | None,
+    next_tools_data: Mapping[str, Any],
+    next_merkle: Mapping[str, ToolMerkleIndex] | None = None,
+    max_diffs: int = 200,
+    max_list_items: int = 20,
+) -> dict[str, Any]:
+    """当前快照 vs 新内容的 diff；两侧的 Merkle 索引只展开 hash 不同的分段与行。"""
+
+    if next_merkle is None:
+        next_merkle = {tool_id: index for tool_id, (_, index) in index_tools_data(next_tools_data).items()}
+    return build_tools_diff(
+        server_tools_data={} if snapshot is None else snapshot.tools_data,
+        client_tools_data=next_tools_data,
+        server_tool_hashes=None if snapshot is None else snapshot.metadata.tool_hashes,
+        server_merkle={} if snapshot is None else store.get_merkle_indexes(snapshot),
+        client_merkle=next_merkle,
+        max_diffs=max_diffs,
+        max_list_items=max_list_items,
+    )
+
+
+def diff_from_history(store: SqliteSnapshotStore, record: SyncRecord) -> dict[str, Any]:
+    """按记录的前后 revision 从历史快照重算 diff，并保留写入时的占位内容（如 Dashboard 备注）。
+
+    revision 未变化的记录（use_server）比较的是未落库的客户端数据，无法重算：
+    只保留占位内容并以 `unavailable` 说明原因，不记为失败。
+    """
+
+    if record.server_revision_before == record.server_revision_after:
+        return {**record.diff, "unavailable": "revision 未变化，客户端数据未保存，无法重算 diff"}
+    before = None
+    if record.server_revision_before > 0:
+        before = store.get_snapshot_by_revision(record.user_id, record.server_revision_before)
+        if before is None:
+            raise ValueError(f"历史快照 revision {record.server_revision_before} 不存在")
+    after = store.get_snapshot_by_revision(record.user_id, record.server_revision_after)
+    if after is None:
+        raise ValueError(f"历史快照 revision {record.server_revision_after} 不存在")
+    diff = build_snapshot_diff(
+        store,
+        snapshot=before,
+        next_tools_data=after.tools_data,
+        next_merkle=store.get_merkle_indexes(after) or None,
+    )
+    return {**diff, **record.diff}
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Mapping
+from typing import Any
+
+
+def stable_dumps(value: Any) -> str:
+    """规范化 JSON：键排序、紧凑分隔、保留非 ASCII；快照 hash、Merkle 索引与 diff 都以它为准。"""
+
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+        default=str,
+    )
+
+
+def sha256_hex(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def row_ids(rows: Any) -> tuple[Any, ...] | None:
+    """`rows` 是以唯一标量 `id` 标识的对象列表时返回各行 id（空列表为空元组），否则返回 None。
+
+    diff、Merkle 索引与三方合并用它判断哪些列表按 id 逐行处理；布尔值不算 id。
+    """
+
+    if not isinstance(rows, list):
+        return None
+    ids: list[Any] = []
+    seen: set[Any] = set()
+    for row in rows:
+        if not isinstance(row, Mapping):
+            return None
+        row_id = row.get("id")
+        if row_id is None or isinstance(row_id, (bool, dict, list)) or row_id in seen:
+            return None
+        seen.add(row_id)
+        ids.append(row_id)
+    return tuple(ids)
@@ -0,0 +1,59 @@
+"""存储压缩迁移命令。
+
+用法（在 backend/sync_server 下）::
+
+    python -m sync_server.compress_storage --codec zlib --train
+    python -m sync_server.compress_storage --codec none   # 解压回明文
+
+数据库路径默认取 `SYNC_SERVER_DB_PATH`。迁移可以在服务运行时执行（分批短事务），
+但服务进程需要以相同的 `SYNC_SERVER_COMPRESSION` 重启后，新写入才会使用新编码。
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from .config import default_compression, default_db_path
+from .storage import SqliteSnapshotStore
+from .storage_codec import DEFAULT_DICTIONARY_BYTES
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sync_server.compress_storage")
+    parser.add_argument("--db-path", default=default_db_path())
+    parser.add_argument(
+        "--codec",
+        default=default_compression() or "zlib",
+        choices=("zlib", "zstd", "none"),
+        help="目标编码；none 表示解压回明文",
+    )
+    parser.add_argument("--train", action="store_true", help="先用现有快照训练新字典")
+    parser.add_argument("--max-samples", type=int, default=2000)
+    parser.add_argument("--dict-size", type=int, default=DEFAULT_DICTIONARY_BYTES)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    compression = None if args.codec == "none" else args.codec
+    store = SqliteSnapshotStore(db_path=args.db_path, compression=compression)
+    try:
+        if args.train:
+            if compression is None:
+                parser.error("--train 需要同时指定压缩算法")
+            dictionary_id = store.train_compression_dictionary(
+                max_samples=args.max_samples,
+                dict_size=args.dict_size,
+                now_ms=int(time.time() * 1000),
+            )
+            print(f"trained dictionary #{dictionary_id}")
+
+        rewritten = store.recompress_rows(batch_size=args.batch_size)
+        for table, count in rewritten.items():
+            print(f"{table}: {count} rows rewritten")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import os
+
+from .audit_diff import DEFAULT_AUDIT_DIFF_WORKERS
+from .http_compression import DEFAULT_MAX_REQUEST_BYTES
+from .snapshot_cache import DEFAULT_SNAPSHOT_CACHE_BYTES
+
+
+def default_db_path() -> str:
+    # 默认把数据放在 backend/sync_server/data/sync.db
+    env_db_path = os.environ.get("SYNC_SERVER_DB_PATH", "").strip()
+    if env_db_path:
+        return env_db_path
+
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    return os.path.join(base_dir, "data", "sync.db")
+
+
+def default_compression() -> str | None:
+    # 存储压缩为显式开启：SYNC_SERVER_COMPRESSION=zlib|zstd
+    value = os.environ.get("SYNC_SERVER_COMPRESSION", "").strip().lower()
+    return value or None
+
+
+def default_snapshot_cache_bytes() -> int:
+    # 最新快照进程内缓存上限（MB），SYNC_SERVER_SNAPSHOT_CACHE_MB=0 关闭缓存
+    value = os.environ.get("SYNC_SERVER_SNAPSHOT_CACHE_MB", "").strip()
+    if not value:
+        return DEFAULT_SNAPSHOT_CACHE_BYTES
+    try:
+        return max(0, int(float(value) * 1024 * 1024))
+    except ValueError:
+        return DEFAULT_SNAPSHOT_CACHE_BYTES
+
+
+def default_max_request_bytes() -> int:
+    # 压缩请求体解压后的大小上限（MB），防止压缩炸弹：SYNC_SERVER_MAX_REQUEST_MB
+    value = os.environ.get("SYNC_SERVER_MAX_REQUEST_MB", "").strip()
+    if not value:
+        return DEFAULT_MAX_REQUEST_BYTES
+    try:
+        return max(1, int(float(value) * 1024 * 1024))
+    except ValueError:
+        return DEFAULT_MAX_REQUEST_BYTES
+
+
+def default_audit_diff_workers() -> int:
+    # 同步记录 diff 的后台计算线程数：SYNC_SERVER_AUDIT_DIFF_WORKERS
+    value = os.environ.get("SYNC_SERVER_AUDIT_DIFF_WORKERS", "").strip()
+    if not value:
+        return DEFAULT_AUDIT_DIFF_WORKERS
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return DEFAULT_AUDIT_DIFF_WORKERS
@@ -2,31 +2,13 @@ from __future__ import annotations
 
 from typing import Any, Mapping
 
-from .storage import UserSnapshot
+from .json_response import RawJson
+from .snapshot_metadata import build_tool_stats, tool_stats_summary
+from .storage import UserSnapshot, UserSnapshotSummary
 
 
 def build_tool_summary(tool_id: str, tool_snapshot: Mapping[str, Any]) -> dict[str, Any]:
-    version = int(tool_snapshot.get("version") or 0)
-    data = tool_snapshot.get("data")
-    section_counts: dict[str, int] = {}
-    total_items = 0
-    if isinstance(data, Mapping):
-        for section_name, section_value in data.items():
-            if isinstance(section_value, list):
-                count = len(section_value)
-            elif section_value is None:
-                count = 0
-            else:
-                count = 1
-            section_counts[str(section_name)] = count
-            total_items += count
-
-    return {
-        "tool_id": tool_id,
-        "version": version,
-        "total_items": total_items,
-        "section_counts": section_counts,
-    }
+    return tool_stats_summary(tool_id, build_tool_stats(tool_snapshot))
 
 
 def build_snapshot_summary(snapshot: UserSnapshot | None) -> dict[str, Any]:
@@ -41,11 +23,10 @@ def build_snapshot_summary(snapshot: UserSnapshot | None) -> dict[str, Any]:
             "tool_summaries": [],
         }
 
-    tool_ids = sorted(snapshot.tools_data.keys())
-    tool_summaries = [
-        build_tool_summary(tool_id, snapshot.tools_data.get(tool_id, {}))
-        for tool_id in tool_ids
-    ]
+    # 只用预计算的元数据，不解析快照正文。
+    tool_stats = snapshot.metadata.tool_stats
+    tool_ids = sorted(tool_stats.keys())
+    tool_summaries = [tool_stats_summary(tool_id, tool_stats[tool_id]) for tool_id in tool_ids]
     return {
         "has_snapshot": True,
         "server_revision": snapshot.server_revision,
@@ -55,3 +36,19 @@ def build_snapshot_summary(snapshot: UserSnapshot | None) -> dict[str, Any]:
         "total_item_count": sum(item["total_items"] for item in tool_summaries),
         "tool_summaries": tool_summaries,
     }
+
+
+def build_materialized_snapshot_summary(summary: UserSnapshotSummary | None) -> dict[str, Any]:
+    """与 `build_snapshot_summary` 同结构，直接取物化摘要表的数据，列表字段原样拼接。"""
+
+    if summary is None:
+        return build_snapshot_summary(None)
+    return {
+        "has_snapshot": True,
+        "server_revision": summary.server_revision,
+        "updated_at_ms": summary.updated_at_ms,
+        "tool_count": summary.tool_count,
+        "tool_ids": RawJson(summary.tool_ids_json),
+        "total_item_count": summary.total_item_count,
+        "tool_summaries": RawJson(summary.tool_summaries_json),
+    }
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from fastapi.responses import Response
+
+from .canonical_json import sha256_hex
+
+# Dashboard 读接口：允许缓存但每次都要带 If-None-Match 回源校验
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+# 历史 revision 写入后内容不再变化
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def make_etag(*parts: object) -> str:
+    """由版本信息派生强 ETag；各部分相同即代表响应内容逐字节相同。"""
+
+    text = "\0".join("" if part is None else str(part) for part in parts)
+    return '"' + sha256_hex(text)[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """按 RFC 9110 对 If-None-Match 做弱比较（忽略 `W/` 前缀）。"""
+
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str, *, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def cache_headers(etag: str, *, cache_control: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control}
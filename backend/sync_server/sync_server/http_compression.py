@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import zlib
+from collections.abc import Callable
+from typing import Any
+
+import anyio
+
+try:  # zstd 为可选依赖：未安装时只协商 gzip。
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# 小于该长度的响应压缩收益不明显，直接原样返回
+MIN_RESPONSE_COMPRESS_BYTES = 1024
+
+_GZIP_LEVEL = 6
+_ZSTD_LEVEL = 3
+_READ_CHUNK_BYTES = 64 * 1024
+_COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/")
+
+Scope = dict[str, Any]
+Message = dict[str, Any]
+Receive = Callable[[], Any]
+Send = Callable[[Message], Any]
+
+
+class RequestDecodeError(ValueError):
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def supported_encodings() -> tuple[str, ...]:
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def choose_response_encoding(accept_encoding: str | None) -> str | None:
+    """按 `Accept-Encoding`（含 q 值）选出响应编码；同权重时优先 zstd。"""
+
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best: str | None = None
+    best_weight = 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=_GZIP_LEVEL, mtime=0)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(body)
+    raise ValueError(f"不支持的编码：{encoding}")
+
+
+class _StreamDecoder:
+    """逐块解压并在输出超过 `max_bytes` 时立即中止，压缩炸弹不会先在内存里展开。"""
+
+    def __init__(self, encoding: str, *, max_bytes: int) -> None:
+        self._encoding = "gzip" if encoding == "x-gzip" else encoding
+        if self._encoding not in supported_encodings():
+            raise RequestDecodeError(415, f"不支持的 Content-Encoding：{encoding}")
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._parts: list[bytes] = []
+        self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # zstd 的增量解压对象不支持限长输出：先收集压缩数据，结束时按块流式读出
+        self._zstd_input: list[bytes] = []
+        self._zstd_input_size = 0
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if self._encoding == "zstd":
+            self._zstd_input_size += len(chunk)
+            if self._zstd_input_size > self._max_bytes:
+                raise RequestDecodeError(413, "解压后的请求体超过大小上限")
+            self._zstd_input.append(chunk)
+            return
+        try:
+            data = chunk
+            while data:
+                self._append(self._zlib.decompress(data, self._max_bytes - self._size + 1))
+                data = self._zlib.unconsumed_tail
+        except zlib.error as exc:
+            raise RequestDecodeError(400, "请求体解压失败") from exc
+
+    def finish(self) -> bytes:
+        if self._encoding == "zstd":
+            self._finish_zstd()
+        elif not self._zlib.eof:
+            raise RequestDecodeError(400, "请求体解压失败")
+        return b"".join(self._parts)
+
+    def _finish_zstd(self) -> None:
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(b"".join(self._zstd_input)))
+        try:
+            while True:
+                out = reader.read(_READ_CHUNK_BYTES)
+                if not out:
+                    break
+                self._append(out)
+        except zstandard.ZstdError as exc:
+            raise RequestDecodeError(400, "请求体解压失败") from exc
+
+    def _append(self, out: bytes) -> None:
+        if not out:
+            return
+        self._size += len(out)
+        if self._size > self._max_bytes:
+            raise RequestDecodeError(413, "解压后的请求体超过大小上限")
+        self._parts.append(out)
+
+
+class ContentEncodingMiddleware:
+    """请求体按 `Content-Encoding` 解压，响应体按 `Accept-Encoding` 压缩（纯 ASGI 中间件）。
+
+    - 请求：gzip（安装 zstandard 时还有 zstd）逐块解压，解压后超过 `max_request_bytes` 返回 413；
+    - 响应：只处理一次性发送的 JSON/文本响应，压缩放到工作线程里做，不阻塞事件循环；
+      分块/流式响应原样透传。压缩后的强 ETag 改为弱 ETag，304 判定不受影响。
+    """
+
+    def __init__(self, app: Any, *, max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES) -> None:
+        self.app = app
+        self.max_request_bytes = max(1, int(max_request_bytes))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = _header_map(scope)
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            try:
+                body = await self._read_decoded_body(receive, content_encoding)
+            except RequestDecodeError as exc:
+                await _send_error(send, exc.status_code, exc.message)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, value)
+                for name, value in scope["headers"]
+                if name.lower() not in (b"content-encoding", b"content-length")
+            ] + [(b"content-length", str(len(body)).encode("latin-1"))]
+            receive = _replay_body(body, receive)
+
+        encoding = choose_response_encoding(headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding))
+
+    async def _read_decoded_body(self, receive: Receive, encoding: str) -> bytes:
+        decoder = _StreamDecoder(encoding, max_bytes=self.max_request_bytes)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise RequestDecodeError(400, "请求体不完整")
+            decoder.feed(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        return decoder.finish()
+
+
+class _CompressingSend:
+    def __init__(self, send: Send, encoding: str) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._start: Message | None = None
+        self._passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if self._passthrough:
+            await self._send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+
+        if message["type"] != "http.response.body" or self._start is None:
+            await self._send(message)
+            return
+
+        start, self._start = self._start, None
+        body: bytes = message.get("body", b"")
+        if message.get("more_body", False) or not _should_compress(start, body):
+            self._passthrough = True
+            await self._send(start)
+            await self._send(message)
+            return
+
+        compressed = await anyio.to_thread.run_sync(compress_body, body, self._encoding)
+        vary = [value for name, value in start.get("headers", []) if name.lower() == b"vary"]
+        headers = [
+            (name, _weak_etag(value) if name.lower() == b"etag" else value)
+            for name, value in start.get("headers", [])
+            if name.lower() not in (b"content-length", b"vary")
+        ]
+        headers += [
+            (b"content-encoding", self._encoding.encode("latin-1")),
+            (b"content-length", str(len(compressed)).encode("latin-1")),
+            (b"vary", b", ".join([*vary, b"Accept-Encoding"])),
+        ]
+        await self._send({**start, "headers": headers})
+        await self._send({"type": "http.response.body", "body": compressed})
+
+
+def _should_compress(start: Message, body: bytes) -> bool:
+    if len(body) < MIN_RESPONSE_COMPRESS_BYTES:
+        return False
+    content_type = b""
+    for name, value in start.get("headers", []):
+        lowered = name.lower()
+        if lowered == b"content-encoding":
+            return False
+        if lowered == b"content-type":
+            content_type = value
+    return any(content_type.decode("latin-1").startswith(prefix) for prefix in _COMPRESSIBLE_TYPES)
+
+
+def _weak_etag(value: bytes) -> bytes:
+    # 压缩后的字节与未压缩表示不同，强 ETag 不能原样沿用
+    return value if value.startswith(b"W/") else b"W/" + value
+
+
+def _header_map(scope: Scope) -> dict[str, str]:
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+
+
+def _replay_body(body: bytes, downstream: Receive) -> Receive:
+    # 解压后的请求体一次性交给应用，之后的 receive（断连检测）交回原始通道
+    sent = False
+
+    async def receive() -> Message:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await downstream()
+
+    return receive
+
+
+async def _send_error(send: Send, status_code: int, message: str) -> None:
+    body = json.dumps({"message": message}, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from typing import Any
+
+JsonPatch = list[dict[str, Any]]
+
+
+class JsonPatchError(ValueError):
+    """补丁无法应用到目标文档（路径不存在、test 失败、操作非法等）。"""
+
+
+def make_patch(source: Any, target: Any, *, base_path: str = "") -> JsonPatch:
+    """生成把 `source` 变成 `target` 的 RFC 6902 补丁（仅使用 add/remove/replace）。
+
+    列表先裁掉公共前后缀再逐项比较，因此在列表头部插入/删除一行只产生一条操作。
+    `base_path` 用于为子文档生成补丁时给所有路径加前缀。
+    """
+
+    ops: JsonPatch = []
+    _diff(source, target, base_path, ops)
+    return ops
+
+
+def apply_patch(doc: Any, patch: Sequence[Mapping[str, Any]]) -> Any:
+    """把 RFC 6902 补丁应用到 `doc` 上并返回结果。
+
+    注意：会原地修改 `doc` 内的容器；调用方需要保留原文档时请先自行拷贝。
+    """
+
+    for op in patch:
+        if not isinstance(op, Mapping):
+            raise JsonPatchError("patch 操作必须是对象")
+        name = op.get("op")
+        path = op.get("path")
+        if not isinstance(path, str):
+            raise JsonPatchError("patch 操作缺少 path")
+
+        if name == "add":
+            doc = _add(doc, path, _require_value(op))
+        elif name == "remove":
+            doc, _ = _remove(doc, path)
+        elif name == "replace":
+            doc, _ = _remove(doc, path)
+            doc = _add(doc, path, _require_value(op))
+        elif name == "move":
+            from_path = _require_from(op)
+            if path.startswith(from_path + "/"):
+                raise JsonPatchError("move 不能把节点移动到自身子路径下")
+            doc, value = _remove(doc, from_path)
+            doc = _add(doc, path, value)
+        elif name == "copy":
+            value = _get(doc, _require_from(op))
+            doc = _add(doc, path, _deep_copy(value))
+        elif name == "test":
+            if not _same(_get(doc, path), _require_value(op)):
+                raise JsonPatchError(f"test 失败：{path}")
+        else:
+            raise JsonPatchError(f"不支持的 patch 操作：{name!r}")
+    return doc
+
+
+def touched_root_keys(patch: Sequence[Mapping[str, Any]]) -> set[str]:
+    """返回补丁会读写的顶层键（path 与 from 的第一段）；整文档操作会被拒绝。"""
+
+    keys: set[str] = set()
+    for op in patch:
+        if not isinstance(op, Mapping):
+            raise JsonPatchError("patch 操作必须是对象")
+        for field_name in ("path", "from"):
+            pointer = op.get(field_name)
+            if pointer is None and field_name == "from":
+                continue
+            if not isinstance(pointer, str):
+                raise JsonPatchError(f"patch 操作缺少 {field_name}")
+            tokens = _split_pointer(pointer)
+            if not tokens:
+                raise JsonPatchError("不支持替换整个文档的 patch 操作")
+            keys.add(tokens[0])
+    return keys
+
+
+def escape_pointer_token(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape_pointer_token(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _split_pointer(path: str) -> list[str]:
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise JsonPatchError(f"非法 JSON Pointer：{path!r}")
+    return [_unescape_pointer_token(token) for token in path[1:].split("/")]
+
+
+def _require_value(op: Mapping[str, Any]) -> Any:
+    if "value" not in op:
+        raise JsonPatchError(f"{op.get('op')} 操作缺少 value")
+    return op["value"]
+
+
+def _require_from(op: Mapping[str, Any]) -> str:
+    from_path = op.get("from")
+    if not isinstance(from_path, str):
+        raise JsonPatchError(f"{op.get('op')} 操作缺少 from")
+    return from_path
+
+
+def _list_index(container: list[Any], token: str, *, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    # RFC 6901 只允许 ASCII 数字；str.isdigit() 还会接受 "²" 等字符，随后 int() 抛出 ValueError
+    if not (token.isascii() and token.isdigit()) or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"非法数组下标：{token!r}")
+    index = int(token)
+    upper = len(container) if allow_end else len(container) - 1
+    if index > upper:
+        raise JsonPatchError(f"数组下标越界：{token}")
+    return index
+
+
+def _resolve_parent(doc: Any, tokens: list[str]) -> Any:
+    current = doc
+    for token in tokens[:-1]:
+        if isinstance(current, dict):
+            if token not in current:
+                raise JsonPatchError(f"路径不存在：{token!r}")
+            current = current[token]
+        elif isinstance(current, list):
+            current = current[_list_index(current, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"路径穿过了标量节点：{token!r}")
+    return current
+
+
+def _get(doc: Any, path: str) -> Any:
+    tokens = _split_pointer(path)
+    if not tokens:
+        return doc
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise JsonPatchError(f"路径不存在：{path}")
+        return parent[last]
+    if isinstance(parent, list):
+        return parent[_list_index(parent, last, allow_end=False)]
+    raise JsonPatchError(f"路径不存在：{path}")
+
+
+def _add(doc: Any, path: str, value: Any) -> Any:
+    tokens = _split_pointer(path)
+    if not tokens:
+        return value
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        parent[last] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, last, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"无法在标量节点下添加：{path}")
+    return doc
+
+
+def _remove(doc: Any, path: str) -> tuple[Any, Any]:
+    tokens = _split_pointer(path)
+    if not tokens:
+        return None, doc
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise JsonPatchError(f"路径不存在：{path}")
+        return doc, parent.pop(last)
+    if isinstance(parent, list):
+        return doc, parent.pop(_list_index(parent, last, allow_end=False))
+    raise JsonPatchError(f"路径不存在：{path}")
+
+
+def _deep_copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _deep_copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_deep_copy(v) for v in value]
+    return value
+
+
+def _same(a: Any, b: Any) -> bool:
+    # JSON 语义下的相等：区分 bool 与数字，避免 `1 == True` 漏掉变更。
+    if type(a) is not type(b):
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            if isinstance(a, bool) or isinstance(b, bool):
+                return False
+            return a == b
+        return False
+    if isinstance(a, dict):
+        if a.keys() != b.keys():
+            return False
+        return all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        if len(a) != len(b):
+            return False
+        return all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _diff(a: Any, b: Any, path: str, ops: JsonPatch) -> None:
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in a:
+            if key not in b:
+                ops.append({"op": "remove", "path": f"{path}/{escape_pointer_token(str(key))}"})
+        for key, b_value in b.items():
+            child = f"{path}/{escape_pointer_token(str(key))}"
+            if key not in a:
+                ops.append({"op": "add", "path": child, "value": b_value})
+            else:
+                _diff(a[key], b_value, child, ops)
+        return
+
+    if isinstance(a, list) and isinstance(b, list):
+        _diff_list(a, b, path, ops)
+        return
+
+    if not _same(a, b):
+        ops.append({"op": "replace", "path": path, "value": b})
+
+
+def _diff_list(a: list[Any], b: list[Any], path: str, ops: JsonPatch) -> None:
+    len_a = len(a)
+    len_b = len(b)
+    prefix = 0
+    while prefix < len_a and prefix < len_b and _same(a[prefix], b[prefix]):
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < len_a - prefix
+        and suffix < len_b - prefix
+        and _same(a[len_a - 1 - suffix], b[len_b - 1 - suffix])
+    ):
+        suffix += 1
+
+    middle_a = len_a - prefix - suffix
+    middle_b = len_b - prefix - suffix
+    paired = min(middle_a, middle_b)
+    for offset in range(paired):
+        index = prefix + offset
+        _diff(a[index], b[index], f"{path}/{index}", ops)
+
+    start = prefix + paired
+    for _ in range(middle_a - paired):
+        ops.append({"op": "remove", "path": f"{path}/{start}"})
+    for offset in range(middle_b - paired):
+        index = start + offset
+        ops.append({"op": "add", "path": f"{path}/{index}", "value": b[index]})
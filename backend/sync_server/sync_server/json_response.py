@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Mapping
+from typing import Any
+
+from fastapi.responses import Response
+
+
+class RawJson:
+    """一段已经序列化好的 JSON 文本，输出响应时原样拼接，不再解析/重编码。"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"RawJson({len(self.text)} chars)"
+
+
+def encode_json(value: Any) -> str:
+    """序列化响应体；遇到 `RawJson` 直接拼接其文本。
+
+    外层元数据体积很小，逐层拼接的成本可以忽略；真正大的 tools_data 始终走 `RawJson`。
+    """
+
+    if isinstance(value, RawJson):
+        return value.text
+    if isinstance(value, Mapping):
+        return "{" + ",".join(
+            f"{_dumps(str(key))}:{encode_json(item)}" for key, item in value.items()
+        ) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(encode_json(item) for item in value) + "]"
+    return _dumps(value)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class RawJsonResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, content: Any, *args: Any, **kwargs: Any) -> None:
+        # 保留未序列化的内容，供幂等记录等需要读取字段的调用方使用
+        self.content = content
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content).encode("utf-8")
@@ -1,38 +1,112 @@
 from __future__ import annotations
 
-import os
+import base64
+import binascii
+import json
 import time
-from typing import Any
+from collections.abc import AsyncIterator, Callable, Mapping
+from contextlib import asynccontextmanager
+from typing import Any, TypeVar
 
-from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi import FastAPI, Header, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 
-from .dashboard_utils import build_snapshot_summary, build_tool_summary
+from .config import (
+    default_audit_diff_workers,
+    default_compression,
+    default_db_path,
+    default_max_request_bytes,
+    default_snapshot_cache_bytes,
+)
+from .dashboard_utils import (
+    build_materialized_snapshot_summary,
+    build_snapshot_summary,
+    build_tool_summary,
+)
 from .dashboard_work_log import apply_dashboard_work_log_rules
+from .http_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    cache_headers,
+    etag_matches,
+    make_etag,
+    not_modified,
+)
+from .audit_diff import AuditDiffWorker, build_snapshot_diff
+from .http_compression import ContentEncodingMiddleware
+from .json_patch import JsonPatchError, apply_patch, touched_root_keys
+from .json_response import RawJson, RawJsonResponse
+from .revision_diff import RevisionDiffCache, compute_revision_diff
+from .revision_watcher import RevisionWatcher
 from .schemas import (
     DashboardSnapshotUpdateRequest,
     DashboardToolUpdateRequest,
     DashboardUserCreateRequest,
     DashboardUserUpdateRequest,
     RollbackRequest,
+    SyncPatchRequest,
     SyncRequestV2,
+    SyncRequestV3,
     SyncResponseV2,
+    SyncResponseV3,
+    SyncToolsResponseV2,
+)
+from .storage import (
+    DIFF_STATUS_PENDING,
+    DashboardUser,
+    DashboardUserCursor,
+    IdempotentResponse,
+    RevisionConflictError,
+    SqliteSnapshotStore,
+    SyncRecord,
+    SyncUnitOfWork,
+    UserSnapshot,
 )
-from .storage import DashboardUser, SqliteSnapshotStore, SyncRecord, UserSnapshot
-from .sync_diff import build_tools_diff
+from .snapshot_metadata import SnapshotAnalysis, analyze_tool_snapshot, analyze_tools_data
+from .sync_diff import build_tools_diff, build_tools_hash_diff
+from .sync_merge import MergeConflictError, MergeResult, merge_tools_data
 from .sync_logic import (
-    compute_latest_updated_at_ms,
     decide_sync_v2_by_revision,
-    is_all_tools_empty,
+    decide_tool_sync_by_revision,
 )
+from .wire_format import NegotiatedRoute
+
+_T = TypeVar("_T")
+
+# 多个 worker 同时写同一用户时，提交前的 revision 校验失败后整体重做的次数
+_MAX_CONFLICT_ATTEMPTS = 3
+# Dashboard 用户详情附带的最近同步记录条数
+DASHBOARD_RECENT_RECORDS = 20
 
 
 def _now_ms() -> int:
     return int(time.time() * 1000)
 
 
+def _run_unit_of_work(
+    store: SqliteSnapshotStore,
+    *,
+    user_id: str,
+    work: Callable[[SyncUnitOfWork], _T],
+) -> _T:
+    """在用户级工作单元里执行 `work`；乐观并发冲突时用新的工作单元重读重试，仍冲突返回 409。"""
+
+    conflict: RevisionConflictError | None = None
+    for _ in range(_MAX_CONFLICT_ATTEMPTS):
+        try:
+            with store.unit_of_work(user_id) as uow:
+                return work(uow)
+        except RevisionConflictError as exc:
+            conflict = exc
+    assert conflict is not None
+    raise HTTPException(
+        status_code=409,
+        detail={"message": "并发写入冲突，请重试", "server_revision": conflict.actual_revision},
+    )
+
+
 def _normalize_force_decision(value: str | None) -> str | None:
     if value is None:
         return None
@@ -69,6 +143,7 @@ def _serialize_sync_record(record: SyncRecord, *, include_diff: bool) -> dict[st
         "server_updated_at_ms_after": record.server_updated_at_ms_after,
         "server_revision_before": record.server_revision_before,
         "server_revision_after": record.server_revision_after,
+        "diff_status": record.diff_status,
         "diff_summary": summary or {},
     }
     if include_diff:
@@ -76,11 +151,89 @@ def _serialize_sync_record(record: SyncRecord, *, include_diff: bool) -> dict[st
     return payload
 
 
+def _use_server_response(
+    *,
+    message: str,
+    snapshot: UserSnapshot,
+    server_time: int,
+) -> RawJsonResponse:
+    # 字段与 SyncResponseV2 一致；tools_data 直接拼接存储里的 JSON 文本，
+    # 跳过 Pydantic 校验与 FastAPI 再序列化这两次全量遍历。
+    return RawJsonResponse(
+        {
+            "success": True,
+            "decision": "use_server",
+            "message": message,
+            "tools_data": RawJson(snapshot.tools_data_json),
+            "server_time": server_time,
+            "server_revision": snapshot.server_revision,
+        }
+    )
+
+
+def _deferred_snapshot_diff(
+    store: SqliteSnapshotStore,
+    *,
+    snapshot: UserSnapshot | None,
+    next_tools_data: Mapping[str, Any],
+    next_analysis: SnapshotAnalysis | None = None,
+    extra: Mapping[str, Any] | None = None,
+) -> Callable[[], dict[str, Any]]:
+    # 同步记录的 diff 只有 Dashboard 查看，提交后交给后台计算，不计入同步延迟；
+    # 新内容的分析结果一并带过去，写入时已生成的 Merkle 索引直接复用。
+    def compute() -> dict[str, Any]:
+        next_merkle = (
+            None
+            if next_analysis is None
+            else {tool_id: tool.indexed[1] for tool_id, tool in next_analysis.tools.items()}
+        )
+        diff = build_snapshot_diff(store, snapshot=snapshot, next_tools_data=next_tools_data, next_merkle=next_merkle)
+        return diff if not extra else {**diff, **extra}
+
+    return compute
+
+
+def _merge_with_server(
+    uow: SyncUnitOfWork,
+    *,
+    snapshot: UserSnapshot,
+    client_tools_data: dict[str, Any],
+    client_last_server_revision: int | None,
+) -> MergeResult | None:
+    """客户端与服务端都有改动时按行三方合并；无法合并或客户端没有改动时返回 None。"""
+
+    base_revision = int(client_last_server_revision or 0)
+    if base_revision <= 0 or base_revision >= snapshot.server_revision:
+        return None
+    base = uow.get_snapshot_by_revision(snapshot.user_id, base_revision)
+    if base is None:
+        return None
+    try:
+        merged = merge_tools_data(
+            base=base.tools_data,
+            server=snapshot.tools_data,
+            client=client_tools_data,
+        )
+    except MergeConflictError:
+        return None
+    # 合并结果就是服务端快照时（客户端没有新改动）按普通 use_server 处理
+    if merged.tools_data == snapshot.tools_data:
+        return None
+    return merged
+
+
 def _serialize_dashboard_user(
     *,
     profile: DashboardUser,
     snapshot: UserSnapshot | None,
 ) -> dict[str, Any]:
+    return {
+        **_serialize_dashboard_profile(profile),
+        "snapshot": build_snapshot_summary(snapshot),
+    }
+
+
+def _serialize_dashboard_profile(profile: DashboardUser) -> dict[str, Any]:
     return {
         "user_id": profile.user_id,
         "display_name": profile.display_name,
@@ -89,10 +242,31 @@ def _serialize_dashboard_user(
         "created_at_ms": profile.created_at_ms,
         "updated_at_ms": profile.updated_at_ms,
         "last_seen_at_ms": profile.last_seen_at_ms,
-        "snapshot": build_snapshot_summary(snapshot),
     }
 
 
+def _encode_users_cursor(profile: DashboardUser) -> str:
+    raw = json.dumps(
+        [profile.last_seen_at_ms, profile.updated_at_ms, profile.user_id],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_users_cursor(value: str) -> DashboardUserCursor:
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        last_seen, updated_at, user_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if last_seen is not None and not isinstance(last_seen, int):
+            raise ValueError(last_seen)
+        if not isinstance(updated_at, int) or not isinstance(user_id, str):
+            raise ValueError(updated_at)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail={"message": "cursor 无效"}) from None
+    return DashboardUserCursor(last_seen_at_ms=last_seen, updated_at_ms=updated_at, user_id=user_id)
+
+
 def _normalize_dashboard_tools_data(
     tools_data: dict[str, dict[str, Any]],
 ) -> dict[str, dict[str, Any]]:
@@ -137,20 +311,381 @@ def _resolve_dashboard_user(
     return profile, snapshot
 
 
-def create_app(*, db_path: str) -> FastAPI:
-    app = FastAPI(title="life_tools sync server", version="0.1.0")
+def _apply_sync_v2(
+    uow: SyncUnitOfWork,
+    *,
+    store: SqliteSnapshotStore,
+    request: SyncRequestV2,
+    user_id: str,
+    server_time: int,
+    client_analysis: SnapshotAnalysis,
+) -> SyncResponseV2 | RawJsonResponse:
+    client_tools_data: dict[str, Any] = request.tools_data
+    client_is_empty = bool(request.client_state.client_is_empty)
+    client_updated_at_ms = client_analysis.max_updated_at_ms
+
+    snapshot = uow.get_snapshot(user_id)
+    force = _normalize_force_decision(request.force_decision)
+    decision = decide_sync_v2_by_revision(
+        client_has_snapshot=bool(client_tools_data),
+        client_is_empty=client_is_empty,
+        client_last_server_revision=request.client_state.last_server_revision,
+        client_updated_at_ms=client_updated_at_ms,
+        server_has_snapshot=snapshot is not None,
+        # 走写入时预计算的元数据，决策本身不解析快照正文。
+        server_is_empty=True if snapshot is None else snapshot.is_empty,
+        server_revision=0 if snapshot is None else snapshot.server_revision,
+        server_updated_at_ms=0 if snapshot is None else snapshot.updated_at_ms,
+    )
+
+    if force == "use_client":
+        server_revision_before = snapshot.server_revision if snapshot else 0
+        server_updated_at_before = snapshot.updated_at_ms if snapshot else 0
+        new_revision = uow.save_client_snapshot(
+            user_id=user_id,
+            tools_data=client_tools_data,
+            updated_at_ms=client_updated_at_ms,
+            server_time_ms=server_time,
+            client_time_ms=request.client_time,
+            analysis=client_analysis,
+        )
+        uow.add_sync_record(
+            user_id=user_id,
+            protocol_version=2,
+            decision="use_client",
+            server_time_ms=server_time,
+            client_time_ms=request.client_time,
+            client_updated_at_ms=client_updated_at_ms,
+            server_updated_at_ms_before=server_updated_at_before,
+            server_updated_at_ms_after=client_updated_at_ms,
+            server_revision_before=server_revision_before,
+            server_revision_after=new_revision,
+            compute_diff=_deferred_snapshot_diff(
+                store,
+                snapshot=snapshot,
+                next_tools_data=client_tools_data,
+                next_analysis=client_analysis,
+            ),
+        )
+        return SyncResponseV2(
+            success=True,
+            decision="use_client",
+            message="forced use_client",
+            server_time=server_time,
+            server_revision=new_revision,
+        )
+
+    if force == "use_server":
+        if snapshot is None:
+            return SyncResponseV2(
+                success=True,
+                decision="noop",
+                message="no snapshot",
+                server_time=server_time,
+                server_revision=0,
+            )
+
+        uow.add_sync_record(
+            user_id=user_id,
+            protocol_version=2,
+            decision="use_server",
+            server_time_ms=server_time,
+            client_time_ms=request.client_time,
+            client_updated_at_ms=client_updated_at_ms,
+            server_updated_at_ms_before=snapshot.updated_at_ms,
+            server_updated_at_ms_after=snapshot.updated_at_ms,
+            server_revision_before=snapshot.server_revision,
+            server_revision_after=snapshot.server_revision,
+            compute_diff=_deferred_snapshot_diff(
+                store,
+                snapshot=snapshot,
+                next_tools_data=client_tools_data,
+            ),
+        )
+        return _use_server_response(
+            message="forced use_server",
+            snapshot=snapshot,
+            server_time=server_time,
+        )
 
-    store = SqliteSnapshotStore(db_path=db_path)
+    if snapshot is None:
+        if decision == "use_client":
+            new_revision = uow.save_client_snapshot(
+                user_id=user_id,
+                tools_data=client_tools_data,
+                updated_at_ms=client_updated_at_ms,
+                server_time_ms=server_time,
+                client_time_ms=request.client_time,
+                analysis=client_analysis,
+            )
+            uow.add_sync_record(
+                user_id=user_id,
+                protocol_version=2,
+                decision="use_client",
+                server_time_ms=server_time,
+                client_time_ms=request.client_time,
+                client_updated_at_ms=client_updated_at_ms,
+                server_updated_at_ms_before=0,
+                server_updated_at_ms_after=client_updated_at_ms,
+                server_revision_before=0,
+                server_revision_after=new_revision,
+                compute_diff=_deferred_snapshot_diff(
+                    store,
+                    snapshot=None,
+                    next_tools_data=client_tools_data,
+                    next_analysis=client_analysis,
+                ),
+            )
+            return SyncResponseV2(
+                success=True,
+                decision="use_client",
+                server_time=server_time,
+                server_revision=new_revision,
+            )
+
+        return SyncResponseV2(
+            success=True,
+            decision="noop",
+            server_time=server_time,
+            server_revision=0,
+        )
+
+    if decision == "use_server":
+        if request.preview_server_update:
+            return _use_server_response(
+                message="server newer than client",
+                snapshot=snapshot,
+                server_time=server_time,
+            )
+
+        merged = (
+            _merge_with_server(
+                uow,
+                snapshot=snapshot,
+                client_tools_data=client_tools_data,
+                client_last_server_revision=request.client_state.last_server_revision,
+            )
+            if request.allow_merge and not client_is_empty
+            else None
+        )
+        if merged is not None:
+            merged_analysis = analyze_tools_data(merged.tools_data)
+            merged_updated_at_ms = max(snapshot.updated_at_ms, merged_analysis.max_updated_at_ms)
+            new_revision = uow.save_client_snapshot(
+                user_id=user_id,
+                tools_data=merged.tools_data,
+                updated_at_ms=merged_updated_at_ms,
+                server_time_ms=server_time,
+                client_time_ms=request.client_time,
+                analysis=merged_analysis,
+            )
+            uow.add_sync_record(
+                user_id=user_id,
+                protocol_version=2,
+                decision="merge",
+                server_time_ms=server_time,
+                client_time_ms=request.client_time,
+                client_updated_at_ms=client_updated_at_ms,
+                server_updated_at_ms_before=snapshot.updated_at_ms,
+                server_updated_at_ms_after=merged_updated_at_ms,
+                server_revision_before=snapshot.server_revision,
+                server_revision_after=new_revision,
+                compute_diff=_deferred_snapshot_diff(
+                    store,
+                    snapshot=snapshot,
+                    next_tools_data=merged.tools_data,
+                    next_analysis=merged_analysis,
+                ),
+            )
+            return SyncResponseV2(
+                success=True,
+                decision="merge",
+                message=f"merged, {merged.lww_rows} rows resolved by updated_at",
+                tools_data=merged.tools_data,
+                server_time=server_time,
+                server_revision=new_revision,
+            )
+
+        uow.add_sync_record(
+            user_id=user_id,
+            protocol_version=2,
+            decision="use_server",
+            server_time_ms=server_time,
+            client_time_ms=request.client_time,
+            client_updated_at_ms=client_updated_at_ms,
+            server_updated_at_ms_before=snapshot.updated_at_ms,
+            server_updated_at_ms_after=snapshot.updated_at_ms,
+            server_revision_before=snapshot.server_revision,
+            server_revision_after=snapshot.server_revision,
+            compute_diff=_deferred_snapshot_diff(
+                store,
+                snapshot=snapshot,
+                next_tools_data=client_tools_data,
+            ),
+        )
+        return _use_server_response(
+            message="server newer than client",
+            snapshot=snapshot,
+            server_time=server_time,
+        )
+
+    if decision == "use_client":
+        new_revision = uow.save_client_snapshot(
+            user_id=user_id,
+            tools_data=client_tools_data,
+            updated_at_ms=client_updated_at_ms,
+            server_time_ms=server_time,
+            client_time_ms=request.client_time,
+            analysis=client_analysis,
+        )
+        uow.add_sync_record(
+            user_id=user_id,
+            protocol_version=2,
+            decision="use_client",
+            server_time_ms=server_time,
+            client_time_ms=request.client_time,
+            client_updated_at_ms=client_updated_at_ms,
+            server_updated_at_ms_before=snapshot.updated_at_ms,
+            server_updated_at_ms_after=client_updated_at_ms,
+            server_revision_before=snapshot.server_revision,
+            server_revision_after=new_revision,
+            compute_diff=_deferred_snapshot_diff(
+                store,
+                snapshot=snapshot,
+                next_tools_data=client_tools_data,
+                next_analysis=client_analysis,
+            ),
+        )
+        return SyncResponseV2(
+            success=True,
+            decision="use_client",
+            message="client newer than server",
+            server_time=server_time,
+            server_revision=new_revision,
+        )
+
+    return SyncResponseV2(
+        success=True,
+        decision="noop",
+        message="no changes",
+        server_time=server_time,
+        server_revision=snapshot.server_revision,
+    )
+
+
+def _sync_v2_fingerprint(request: SyncRequestV2, *, tool_hashes: dict[str, str]) -> str:
+    # 快照正文用分析时已算好的逐工具 hash 代表，不必为比对再序列化整包快照
+    return json.dumps(
+        [
+            request.user_id,
+            request.client_time,
+            request.client_state.last_server_revision,
+            request.client_state.client_is_empty,
+            request.force_decision,
+            request.preview_server_update,
+            request.allow_merge,
+            sorted(tool_hashes.items()),
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def _idempotent_response_payload(response: SyncResponseV2 | RawJsonResponse) -> tuple[str, int | None]:
+    """把响应拆成可落库的元数据与 tools_data 所在的 revision（快照正文不重复保存）。"""
+
+    fields = response.model_dump() if isinstance(response, SyncResponseV2) else dict(response.content)
+    tools_data_revision = None
+    if fields.get("tools_data") is not None:
+        # 带 tools_data 的响应（use_server / merge）返回的都是该 revision 的完整快照
+        tools_data_revision = int(fields["server_revision"])
+        fields["tools_data"] = None
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":")), tools_data_revision
+
+
+def _replay_idempotent_response(
+    uow: SyncUnitOfWork,
+    *,
+    user_id: str,
+    cached: IdempotentResponse,
+) -> RawJsonResponse:
+    fields: dict[str, Any] = json.loads(cached.response_json)
+    if cached.tools_data_revision is not None:
+        snapshot = uow.get_snapshot_by_revision(user_id, cached.tools_data_revision)
+        if snapshot is not None:
+            fields["tools_data"] = RawJson(snapshot.tools_data_json)
+    return RawJsonResponse(fields, headers={"Idempotent-Replayed": "true"})
+
+
+def _dashboard_user_etag(
+    user_id: str,
+    *,
+    server_revision: int,
+    profile: DashboardUser | None,
+    latest_record_id: int,
+    pending_diffs: int,
+) -> str:
+    profile_part = None if profile is None else json.dumps(_serialize_dashboard_profile(profile), sort_keys=True)
+    return make_etag(user_id, server_revision, profile_part, latest_record_id, pending_diffs)
+
+
+def create_app(
+    *,
+    db_path: str,
+    compression: str | None = None,
+    snapshot_cache_bytes: int | None = None,
+    max_request_bytes: int | None = None,
+    audit_diff_workers: int | None = None,
+) -> FastAPI:
+    store = SqliteSnapshotStore(
+        db_path=db_path,
+        compression=compression,
+        snapshot_cache_bytes=(
+            default_snapshot_cache_bytes() if snapshot_cache_bytes is None else snapshot_cache_bytes
+        ),
+    )
+
+    watcher = RevisionWatcher(db_path=db_path, read_revisions=store.get_snapshot_revisions)
+    # 本进程的写入提交后直接唤醒该用户的长轮询，其它进程的写入由 watcher 轮询发现
+    store.set_revision_listener(watcher.publish)
+    audit_diffs = AuditDiffWorker(
+        store=store,
+        max_workers=default_audit_diff_workers() if audit_diff_workers is None else audit_diff_workers,
+    )
+    store.set_deferred_diff_handler(audit_diffs.submit)
+    revision_diffs = RevisionDiffCache()
+
+    @asynccontextmanager
+    async def _lifespan(_app: FastAPI) -> AsyncIterator[None]:
+        # 上次退出时尚未算完的同步记录 diff
+        audit_diffs.resume_pending()
+        try:
+            yield
+        finally:
+            watcher.close()
+            audit_diffs.close()
+            store.close()
+
+    app = FastAPI(title="life_tools sync server", version="0.1.0", lifespan=_lifespan)
     app.state.store = store
+    app.state.audit_diffs = audit_diffs
+    app.state.revision_diffs = revision_diffs
+    # 所有路由都支持 MessagePack 请求/响应协商，JSON 仍是默认格式
+    app.router.route_class = NegotiatedRoute
 
+    # 后添加的中间件在外层：CORS 包住解压/压缩，413 等错误响应也带跨域头
+    app.add_middleware(
+        ContentEncodingMiddleware,
+        max_request_bytes=default_max_request_bytes() if max_request_bytes is None else max_request_bytes,
+    )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
         allow_credentials=False,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "Idempotent-Replayed"],
     )
-
     @app.exception_handler(HTTPException)
     async def _handle_http_exception(
         _request: Request,
@@ -179,8 +714,41 @@ def create_app(*, db_path: str) -> FastAPI:
     def healthz() -> dict[str, str]:
         return {"status": "ok"}
 
+    @app.get("/dashboard/cache-stats")
+    def get_cache_stats() -> dict[str, Any]:
+        stats = store.snapshot_cache_stats()
+        lookups = stats.hits + stats.misses
+        diff_stats = revision_diffs.stats()
+        diff_lookups = diff_stats.hits + diff_stats.misses
+        return {
+            "success": True,
+            "snapshot_cache": {
+                "hits": stats.hits,
+                "misses": stats.misses,
+                "evictions": stats.evictions,
+                "hit_rate": 0.0 if lookups == 0 else stats.hits / lookups,
+                "entries": stats.entries,
+                "size_bytes": stats.size_bytes,
+                "max_bytes": stats.max_bytes,
+            },
+            "revision_diff_cache": {
+                "hits": diff_stats.hits,
+                "misses": diff_stats.misses,
+                "evictions": diff_stats.evictions,
+                "hit_rate": 0.0 if diff_lookups == 0 else diff_stats.hits / diff_lookups,
+                "entries": diff_stats.entries,
+                "items": diff_stats.items,
+                "max_items": diff_stats.max_items,
+            },
+        }
+
     @app.post("/sync/v2", response_model=SyncResponseV2)
-    def sync_v2(request: SyncRequestV2) -> SyncResponseV2:
+    def sync_v2(
+        request: SyncRequestV2,
+        idempotency_key: str | None = Header(default=None, min_length=1, max_length=200),
+    ) -> SyncResponseV2 | RawJsonResponse:
+        """v2 全量同步；带 `Idempotency-Key` 的重试在有效期内直接重放首次提交的结果。"""
+
         if request.protocol_version != 2:
             raise HTTPException(
                 status_code=400,
@@ -192,243 +760,485 @@ def create_app(*, db_path: str) -> FastAPI:
             raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
 
         server_time = _now_ms()
-        store.touch_user(user_id=user_id, now_ms=server_time)
+        # 客户端快照只分析一次：决策、落库、工具状态、diff 与幂等指纹共用同一份结果（冲突重试也不重算）
+        client_analysis = analyze_tools_data(request.tools_data)
 
-        client_tools_data: dict[str, Any] = request.tools_data
-        client_is_empty = bool(request.client_state.client_is_empty)
-        client_updated_at_ms = compute_latest_updated_at_ms(client_tools_data)
+        def work(uow: SyncUnitOfWork) -> SyncResponseV2 | RawJsonResponse:
+            uow.touch_user(user_id=user_id, now_ms=server_time)
 
-        snapshot = store.get_snapshot(user_id)
-        force = _normalize_force_decision(request.force_decision)
-        decision = decide_sync_v2_by_revision(
-            client_has_snapshot=bool(client_tools_data),
-            client_is_empty=client_is_empty,
-            client_last_server_revision=request.client_state.last_server_revision,
-            client_updated_at_ms=client_updated_at_ms,
-            server_has_snapshot=snapshot is not None,
-            server_is_empty=True if snapshot is None else is_all_tools_empty(snapshot.tools_data),
-            server_revision=0 if snapshot is None else snapshot.server_revision,
-            server_updated_at_ms=0 if snapshot is None else snapshot.updated_at_ms,
-        )
+            if idempotency_key is None:
+                return _apply_sync_v2(
+                    uow,
+                    store=store,
+                    request=request,
+                    user_id=user_id,
+                    server_time=server_time,
+                    client_analysis=client_analysis,
+                )
 
-        if force == "use_client":
-            server_revision_before = snapshot.server_revision if snapshot else 0
-            server_updated_at_before = snapshot.updated_at_ms if snapshot else 0
-            server_tools_before: dict[str, Any] = snapshot.tools_data if snapshot else {}
-            diff = build_tools_diff(
-                server_tools_data=server_tools_before,
-                client_tools_data=client_tools_data,
-            )
-            new_revision = store.save_client_snapshot(
+            # 同一用户的工作单元串行执行（跨 worker 时提交前会再校验该键）：并发的重复请求会在这里看到先到者已提交的结果
+            fingerprint = _sync_v2_fingerprint(request, tool_hashes=client_analysis.tool_hashes)
+            cached = uow.get_idempotent_response(user_id=user_id, key=idempotency_key, now_ms=server_time)
+            if cached is not None:
+                if cached.fingerprint != fingerprint:
+                    raise HTTPException(
+                        status_code=422,
+                        detail={"message": "Idempotency-Key 已用于不同的请求"},
+                    )
+                return _replay_idempotent_response(uow, user_id=user_id, cached=cached)
+
+            response = _apply_sync_v2(
+                uow,
+                store=store,
+                request=request,
                 user_id=user_id,
-                tools_data=client_tools_data,
-                updated_at_ms=client_updated_at_ms,
-                server_time_ms=server_time,
-                client_time_ms=request.client_time,
+                server_time=server_time,
+                client_analysis=client_analysis,
             )
-            store.add_sync_record(
+            response_json, tools_data_revision = _idempotent_response_payload(response)
+            uow.save_idempotent_response(
                 user_id=user_id,
-                protocol_version=2,
-                decision="use_client",
-                server_time_ms=server_time,
-                client_time_ms=request.client_time,
-                client_updated_at_ms=client_updated_at_ms,
-                server_updated_at_ms_before=server_updated_at_before,
-                server_updated_at_ms_after=client_updated_at_ms,
-                server_revision_before=server_revision_before,
-                server_revision_after=new_revision,
-                diff=diff,
-            )
-            return SyncResponseV2(
-                success=True,
-                decision="use_client",
-                message="forced use_client",
-                server_time=server_time,
-                server_revision=new_revision,
+                key=idempotency_key,
+                fingerprint=fingerprint,
+                response_json=response_json,
+                tools_data_revision=tools_data_revision,
+                now_ms=server_time,
             )
+            return response
 
-        if force == "use_server":
-            if snapshot is None:
-                return SyncResponseV2(
-                    success=True,
-                    decision="noop",
-                    message="no snapshot",
-                    server_time=server_time,
-                    server_revision=0,
-                )
+        return _run_unit_of_work(store, user_id=user_id, work=work)
 
-            diff = build_tools_diff(
-                server_tools_data=snapshot.tools_data,
-                client_tools_data=client_tools_data,
-            )
-            store.add_sync_record(
-                user_id=user_id,
-                protocol_version=2,
-                decision="use_server",
-                server_time_ms=server_time,
-                client_time_ms=request.client_time,
-                client_updated_at_ms=client_updated_at_ms,
-                server_updated_at_ms_before=snapshot.updated_at_ms,
-                server_updated_at_ms_after=snapshot.updated_at_ms,
-                server_revision_before=snapshot.server_revision,
-                server_revision_after=snapshot.server_revision,
-                diff=diff,
-            )
-            return SyncResponseV2(
-                success=True,
-                decision="use_server",
-                message="forced use_server",
-                tools_data=snapshot.tools_data,
-                server_time=server_time,
-                server_revision=snapshot.server_revision,
+    @app.post("/sync/v2/tools", response_model=SyncToolsResponseV2)
+    def sync_v2_tools(request: SyncRequestV2) -> RawJsonResponse:
+        """逐工具决策的 v2 同步：各工具独立判断方向，只提交客户端胜出的工具。
+
+        请求体与 `/sync/v2` 相同；服务端胜出的工具在响应中返回（或列入 `removed_tool_ids`），
+        客户端应用后其本地快照即等于新的服务端快照。
+        """
+
+        if request.protocol_version != 2:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "protocol_version 必须为 2"},
             )
 
-        if snapshot is None:
-            if decision == "use_client":
-                diff = build_tools_diff(
-                    server_tools_data={},
-                    client_tools_data=client_tools_data,
+        user_id = request.user_id.strip()
+        if not user_id:
+            raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
+
+        server_time = _now_ms()
+
+        def work(uow: SyncUnitOfWork) -> RawJsonResponse:
+            uow.touch_user(user_id=user_id, now_ms=server_time)
+
+            client_tools_data: dict[str, Any] = request.tools_data
+            client_analysis = analyze_tools_data(client_tools_data)
+            client_hashes = client_analysis.tool_hashes
+            last_revision = request.client_state.last_server_revision
+            snapshot = uow.get_snapshot(user_id)
+            states = uow.get_tool_states(snapshot)
+            force = _normalize_force_decision(request.force_decision)
+
+            tool_decisions: dict[str, str] = {}
+            for tool_id in sorted(set(client_tools_data) | set(states)):
+                state = states.get(tool_id)
+                server_has_tool = state is not None and state.content_hash is not None
+                client_tool = client_analysis.tools.get(tool_id)
+                if client_tool is None and not server_has_tool:
+                    continue
+                same_content = server_has_tool and client_hashes.get(tool_id) == state.content_hash
+                if force is not None:
+                    tool_decisions[tool_id] = "noop" if same_content else force
+                    continue
+                tool_decisions[tool_id] = decide_tool_sync_by_revision(
+                    same_content=same_content,
+                    client_has_tool=client_tool is not None,
+                    client_tool_is_empty=client_tool is None or client_tool.is_empty,
+                    client_last_server_revision=last_revision,
+                    client_tool_updated_at_ms=0 if client_tool is None else client_tool.max_updated_at_ms,
+                    server_has_tool=server_has_tool,
+                    server_tool_deleted=state is not None and state.content_hash is None,
+                    server_tool_is_empty=True if state is None else state.is_empty,
+                    server_tool_revision=0 if state is None else state.revision,
+                    server_tool_updated_at_ms=0 if state is None else state.updated_at_ms,
                 )
-                new_revision = store.save_client_snapshot(
+
+            client_won = [tool_id for tool_id, item in tool_decisions.items() if item == "use_client"]
+            server_won = [tool_id for tool_id, item in tool_decisions.items() if item == "use_server"]
+            if client_won and server_won:
+                decision = "mixed"
+            elif client_won:
+                decision = "use_client"
+            elif server_won:
+                decision = "use_server"
+            else:
+                decision = "noop"
+
+            server_tools_before: dict[str, Any] = {} if snapshot is None else snapshot.tools_data
+            server_hashes: dict[str, str] = {} if snapshot is None else snapshot.metadata.tool_hashes
+            server_revision = 0 if snapshot is None else snapshot.server_revision
+            server_updated_at_before = 0 if snapshot is None else snapshot.updated_at_ms
+            server_updated_at_after = server_updated_at_before
+            # 审计 diff 的对比目标：有写入时为实际提交的合并快照（沿用服务端的工具不算变更），
+            # 只有 use_server 时与 `/sync/v2` 一致，记录客户端与服务端的差异
+            diff_tools_data: dict[str, Any] = client_tools_data
+            diff_tool_hashes: dict[str, str] = client_hashes
+            if client_won:
+                # 只写客户端胜出的工具，其余保持服务端现状。
+                merged = dict(server_tools_before)
+                for tool_id in client_won:
+                    if tool_id in client_tools_data:
+                        merged[tool_id] = client_tools_data[tool_id]
+                    else:
+                        merged.pop(tool_id, None)
+                # 客户端胜出的工具复用上面的分析结果，只补算沿用服务端内容的工具
+                merged_analysis = SnapshotAnalysis(
+                    tools={
+                        tool_id: client_analysis.tools[tool_id]
+                        if tool_id in client_won
+                        else analyze_tool_snapshot(tool_snapshot)
+                        for tool_id, tool_snapshot in merged.items()
+                    }
+                )
+                server_updated_at_after = merged_analysis.max_updated_at_ms
+                server_revision = uow.save_client_snapshot(
                     user_id=user_id,
-                    tools_data=client_tools_data,
-                    updated_at_ms=client_updated_at_ms,
+                    tools_data=merged,
+                    updated_at_ms=server_updated_at_after,
                     server_time_ms=server_time,
                     client_time_ms=request.client_time,
+                    analysis=merged_analysis,
                 )
-                store.add_sync_record(
+                diff_tools_data = merged
+                diff_tool_hashes = {
+                    tool_id: client_hashes[tool_id] if tool_id in client_won else server_hashes[tool_id]
+                    for tool_id in merged
+                    if tool_id in client_won or tool_id in server_hashes
+                }
+
+            if client_won or (server_won and not request.preview_server_update):
+                uow.add_sync_record(
                     user_id=user_id,
                     protocol_version=2,
-                    decision="use_client",
+                    decision=decision,
                     server_time_ms=server_time,
                     client_time_ms=request.client_time,
-                    client_updated_at_ms=client_updated_at_ms,
-                    server_updated_at_ms_before=0,
-                    server_updated_at_ms_after=client_updated_at_ms,
-                    server_revision_before=0,
-                    server_revision_after=new_revision,
-                    diff=diff,
-                )
-                return SyncResponseV2(
-                    success=True,
-                    decision="use_client",
-                    server_time=server_time,
-                    server_revision=new_revision,
+                    client_updated_at_ms=client_analysis.max_updated_at_ms,
+                    server_updated_at_ms_before=server_updated_at_before,
+                    server_updated_at_ms_after=server_updated_at_after,
+                    server_revision_before=0 if snapshot is None else snapshot.server_revision,
+                    server_revision_after=server_revision,
+                    compute_diff=lambda: build_tools_diff(
+                        server_tools_data=server_tools_before,
+                        client_tools_data=diff_tools_data,
+                        server_tool_hashes=server_hashes,
+                        client_tool_hashes=diff_tool_hashes,
+                    ),
                 )
 
-            return SyncResponseV2(
-                success=True,
-                decision="noop",
-                server_time=server_time,
-                server_revision=0,
+            server_tool_ids = [tool_id for tool_id in server_won if tool_id in server_hashes]
+            tool_json = {} if snapshot is None else uow.get_tool_json(snapshot, server_tool_ids)
+            return RawJsonResponse(
+                {
+                    "success": True,
+                    "decision": decision,
+                    "message": None,
+                    "tool_decisions": tool_decisions,
+                    "tools_data": {tool_id: RawJson(tool_json[tool_id]) for tool_id in server_tool_ids},
+                    "removed_tool_ids": [tool_id for tool_id in server_won if tool_id not in server_hashes],
+                    "server_time": server_time,
+                    "server_revision": server_revision,
+                }
             )
 
-        server_tools_data = snapshot.tools_data
-        server_is_empty = is_all_tools_empty(server_tools_data)
+        return _run_unit_of_work(store, user_id=user_id, work=work)
 
-        if decision == "use_server":
-            if request.preview_server_update:
-                return SyncResponseV2(
-                    success=True,
-                    decision="use_server",
-                    message="server newer than client",
-                    tools_data=server_tools_data,
-                    server_time=server_time,
-                    server_revision=snapshot.server_revision,
+    @app.post("/sync/v2/patch", response_model=SyncResponseV2)
+    def sync_v2_patch(request: SyncPatchRequest) -> SyncResponseV2:
+        """客户端持有最新基准版本时，只上传 RFC 6902 补丁而非整份 tools_data。
+
+        基准版本落后或应用后的工具 hash 与客户端不一致时返回 409，客户端应回退为 `/sync/v2` 全量同步。
+        """
+
+        if request.protocol_version != 2:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "protocol_version 必须为 2"},
+            )
+
+        user_id = request.user_id.strip()
+        if not user_id:
+            raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
+
+        base_revision = int(request.client_state.last_server_revision or 0)
+        server_time = _now_ms()
+
+        def work(uow: SyncUnitOfWork) -> SyncResponseV2:
+            uow.touch_user(user_id=user_id, now_ms=server_time)
+
+            snapshot = uow.get_snapshot(user_id)
+            if snapshot is None or snapshot.server_revision != base_revision:
+                raise HTTPException(
+                    status_code=409,
+                    detail={
+                        "message": "补丁基准版本不是服务端最新版本",
+                        "server_revision": 0 if snapshot is None else snapshot.server_revision,
+                    },
                 )
 
-            diff = build_tools_diff(
-                server_tools_data=server_tools_data,
-                client_tools_data=client_tools_data,
+            try:
+                touched = touched_root_keys(request.patch)
+                # 只重新解析补丁涉及的工具（apply_patch 会原地修改），其余工具与基准共享对象。
+                tool_json = uow.get_tool_json(snapshot, touched)
+                patched: dict[str, Any] = dict(snapshot.tools_data)
+                for tool_id, body in tool_json.items():
+                    patched[tool_id] = json.loads(body)
+                patched = apply_patch(patched, request.patch)
+            except JsonPatchError as exc:
+                raise HTTPException(status_code=400, detail={"message": f"patch 无法应用：{exc}"}) from None
+
+            for tool_id, tool_snapshot in patched.items():
+                if not isinstance(tool_snapshot, dict):
+                    raise HTTPException(status_code=400, detail={"message": f"工具 {tool_id} 的快照必须是对象"})
+            analysis = analyze_tools_data(patched)
+            result_hashes: dict[str, str] = {}
+            for tool_id in patched:
+                if tool_id in touched:
+                    result_hashes[tool_id] = analysis.tools[tool_id].hash
+                else:
+                    result_hashes[tool_id] = snapshot.metadata.tool_hashes[tool_id]
+            expected_hashes = {tool_id: digest.lower() for tool_id, digest in request.tool_hashes.items()}
+            if result_hashes != expected_hashes:
+                raise HTTPException(
+                    status_code=409,
+                    detail={
+                        "message": "应用补丁后的快照 hash 与客户端不一致",
+                        "server_revision": snapshot.server_revision,
+                    },
+                )
+
+            client_updated_at_ms = analysis.max_updated_at_ms
+            new_revision = uow.save_client_snapshot(
+                user_id=user_id,
+                tools_data=patched,
+                updated_at_ms=client_updated_at_ms,
+                server_time_ms=server_time,
+                client_time_ms=request.client_time,
+                analysis=analysis,
             )
-            store.add_sync_record(
+            uow.add_sync_record(
                 user_id=user_id,
                 protocol_version=2,
-                decision="use_server",
+                decision="use_client",
                 server_time_ms=server_time,
                 client_time_ms=request.client_time,
                 client_updated_at_ms=client_updated_at_ms,
                 server_updated_at_ms_before=snapshot.updated_at_ms,
-                server_updated_at_ms_after=snapshot.updated_at_ms,
+                server_updated_at_ms_after=client_updated_at_ms,
                 server_revision_before=snapshot.server_revision,
-                server_revision_after=snapshot.server_revision,
-                diff=diff,
+                server_revision_after=new_revision,
+                compute_diff=lambda: build_tools_diff(
+                    server_tools_data=snapshot.tools_data,
+                    client_tools_data=patched,
+                    server_tool_hashes=snapshot.metadata.tool_hashes,
+                    client_tool_hashes=result_hashes,
+                ),
             )
             return SyncResponseV2(
                 success=True,
-                decision="use_server",
-                message="server newer than client",
-                tools_data=server_tools_data,
+                decision="use_client",
+                message="patch applied",
                 server_time=server_time,
-                server_revision=snapshot.server_revision,
+                server_revision=new_revision,
             )
 
-        if decision == "use_client":
-            diff = build_tools_diff(
-                server_tools_data=server_tools_data,
-                client_tools_data=client_tools_data,
+        return _run_unit_of_work(store, user_id=user_id, work=work)
+
+    @app.post("/sync/v3", response_model=SyncResponseV3)
+    def sync_v3(request: SyncRequestV3) -> SyncResponseV3 | RawJsonResponse:
+        """按工具 hash 协商的增量同步。
+
+        第一次请求只带各工具 hash：服务端较新时只回传 hash 不同的工具；客户端较新时
+        返回 `need_tools` 点名需要上传的工具，客户端带上这些工具原样重发请求即可提交。
+        服务端不保存会话状态，第二次请求会重新决策，期间服务端有变化时会重新点名。
+        """
+
+        if request.protocol_version != 3:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "protocol_version 必须为 3"},
+            )
+
+        user_id = request.user_id.strip()
+        if not user_id:
+            raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
+
+        client_hashes = {tool_id: digest.hash.lower() for tool_id, digest in request.tools.items()}
+        client_updated_at_ms = max((digest.updated_at_ms for digest in request.tools.values()), default=0)
+        server_time = _now_ms()
+
+        def work(uow: SyncUnitOfWork) -> SyncResponseV3 | RawJsonResponse:
+            uow.touch_user(user_id=user_id, now_ms=server_time)
+
+            snapshot = uow.get_snapshot(user_id)
+            server_hashes: dict[str, str] = {} if snapshot is None else snapshot.metadata.tool_hashes
+            force = _normalize_force_decision(request.force_decision)
+            decision = force or decide_sync_v2_by_revision(
+                client_has_snapshot=bool(client_hashes),
+                client_is_empty=bool(request.client_state.client_is_empty),
+                client_last_server_revision=request.client_state.last_server_revision,
+                client_updated_at_ms=client_updated_at_ms,
+                server_has_snapshot=snapshot is not None,
+                server_is_empty=True if snapshot is None else snapshot.is_empty,
+                server_revision=0 if snapshot is None else snapshot.server_revision,
+                server_updated_at_ms=0 if snapshot is None else snapshot.updated_at_ms,
+            )
+
+            if decision == "use_server" and snapshot is not None:
+                changed_tool_ids = [
+                    tool_id for tool_id, digest in server_hashes.items() if client_hashes.get(tool_id) != digest
+                ]
+                if not request.preview_server_update:
+                    uow.add_sync_record(
+                        user_id=user_id,
+                        protocol_version=3,
+                        decision="use_server",
+                        server_time_ms=server_time,
+                        client_time_ms=request.client_time,
+                        client_updated_at_ms=client_updated_at_ms,
+                        server_updated_at_ms_before=snapshot.updated_at_ms,
+                        server_updated_at_ms_after=snapshot.updated_at_ms,
+                        server_revision_before=snapshot.server_revision,
+                        server_revision_after=snapshot.server_revision,
+                        diff=build_tools_hash_diff(
+                            server_tool_hashes=server_hashes,
+                            client_tool_hashes=client_hashes,
+                        ),
+                    )
+                tool_json = uow.get_tool_json(snapshot, changed_tool_ids)
+                return RawJsonResponse(
+                    {
+                        "success": True,
+                        "decision": "use_server",
+                        "message": "forced use_server" if force else "server newer than client",
+                        "need_tool_ids": None,
+                        "tools_data": {tool_id: RawJson(tool_json[tool_id]) for tool_id in changed_tool_ids},
+                        "removed_tool_ids": [tool_id for tool_id in client_hashes if tool_id not in server_hashes],
+                        "server_time": server_time,
+                        "server_revision": snapshot.server_revision,
+                    }
+                )
+
+            if decision != "use_client":
+                return SyncResponseV3(
+                    success=True,
+                    decision="noop",
+                    message="no snapshot" if snapshot is None else "no changes",
+                    server_time=server_time,
+                    server_revision=0 if snapshot is None else snapshot.server_revision,
+                )
+
+            uploaded = request.tools_data or {}
+            needed_tool_ids = [
+                tool_id for tool_id, digest in client_hashes.items() if server_hashes.get(tool_id) != digest
+            ]
+            missing_tool_ids = [tool_id for tool_id in needed_tool_ids if tool_id not in uploaded]
+            if missing_tool_ids:
+                return SyncResponseV3(
+                    success=True,
+                    decision="need_tools",
+                    message="upload changed tools",
+                    need_tool_ids=missing_tool_ids,
+                    server_time=server_time,
+                    server_revision=0 if snapshot is None else snapshot.server_revision,
+                )
+            uploaded_analysis = {tool_id: analyze_tool_snapshot(uploaded[tool_id]) for tool_id in needed_tool_ids}
+            for tool_id, tool in uploaded_analysis.items():
+                if tool.hash != client_hashes[tool_id]:
+                    raise HTTPException(
+                        status_code=400,
+                        detail={"message": f"工具 {tool_id} 的内容与声明的 hash 不一致"},
+                    )
+
+            # hash 未变的工具直接沿用服务端已存内容，客户端无需重传。
+            server_tools_before: dict[str, Any] = {} if snapshot is None else snapshot.tools_data
+            needed = set(needed_tool_ids)
+            client_tools_data = {
+                tool_id: uploaded[tool_id] if tool_id in needed else server_tools_before[tool_id]
+                for tool_id in client_hashes
+            }
+            analysis = SnapshotAnalysis(
+                tools={
+                    tool_id: uploaded_analysis.get(tool_id) or analyze_tool_snapshot(tool_snapshot)
+                    for tool_id, tool_snapshot in client_tools_data.items()
+                }
             )
-            new_revision = store.save_client_snapshot(
+            saved_updated_at_ms = analysis.max_updated_at_ms
+            new_revision = uow.save_client_snapshot(
                 user_id=user_id,
                 tools_data=client_tools_data,
-                updated_at_ms=client_updated_at_ms,
+                updated_at_ms=saved_updated_at_ms,
                 server_time_ms=server_time,
                 client_time_ms=request.client_time,
+                analysis=analysis,
             )
-            store.add_sync_record(
+            uow.add_sync_record(
                 user_id=user_id,
-                protocol_version=2,
+                protocol_version=3,
                 decision="use_client",
                 server_time_ms=server_time,
                 client_time_ms=request.client_time,
                 client_updated_at_ms=client_updated_at_ms,
-                server_updated_at_ms_before=snapshot.updated_at_ms,
-                server_updated_at_ms_after=client_updated_at_ms,
-                server_revision_before=snapshot.server_revision,
+                server_updated_at_ms_before=0 if snapshot is None else snapshot.updated_at_ms,
+                server_updated_at_ms_after=saved_updated_at_ms,
+                server_revision_before=0 if snapshot is None else snapshot.server_revision,
                 server_revision_after=new_revision,
-                diff=diff,
+                compute_diff=lambda: build_tools_diff(
+                    server_tools_data=server_tools_before,
+                    client_tools_data=client_tools_data,
+                    server_tool_hashes=server_hashes,
+                    client_tool_hashes=client_hashes,
+                ),
             )
-            return SyncResponseV2(
+            return SyncResponseV3(
                 success=True,
                 decision="use_client",
-                message="client newer than server",
+                message="forced use_client" if force else "client newer than server",
                 server_time=server_time,
                 server_revision=new_revision,
             )
 
-        return SyncResponseV2(
-            success=True,
-            decision="noop",
-            message="no changes",
-            server_time=server_time,
-            server_revision=snapshot.server_revision,
-        )
-
+        return _run_unit_of_work(store, user_id=user_id, work=work)
 
     @app.get("/dashboard/users")
-    def list_dashboard_users() -> dict[str, Any]:
-        profile_map = {item.user_id: item for item in store.list_user_profiles()}
-        snapshot_map = {item.user_id: item for item in store.list_snapshots()}
-
-        users: list[tuple[int, int, str, dict[str, Any]]] = []
-        for user_id in sorted(set(profile_map.keys()) | set(snapshot_map.keys())):
-            snapshot = snapshot_map.get(user_id)
-            profile = profile_map.get(user_id)
-            if profile is None:
-                profile = _fallback_dashboard_user(user_id=user_id, snapshot=snapshot)
-            sort_last_seen = profile.last_seen_at_ms or (0 if snapshot is None else snapshot.updated_at_ms)
-            sort_updated = max(profile.updated_at_ms, 0 if snapshot is None else snapshot.updated_at_ms)
-            users.append(
-                (
-                    int(sort_last_seen),
-                    int(sort_updated),
-                    user_id,
-                    _serialize_dashboard_user(profile=profile, snapshot=snapshot),
-                )
-            )
-
-        users.sort(key=lambda item: (-item[0], -item[1], item[2]))
-        return {"success": True, "users": [item[3] for item in users]}
+    def list_dashboard_users(
+        limit: int = Query(default=50, ge=1, le=200),
+        cursor: str | None = Query(default=None),
+        is_enabled: bool | None = Query(default=None),
+        has_snapshot: bool | None = Query(default=None),
+        last_seen_from_ms: int | None = Query(default=None, ge=0),
+        last_seen_to_ms: int | None = Query(default=None, ge=0),
+        q: str | None = Query(default=None),
+    ) -> RawJsonResponse:
+        # 资料与物化摘要由一次按索引分页的查询取回，不读取任何快照正文。
+        entries = store.list_dashboard_entries(
+            limit=limit,
+            after=None if not cursor else _decode_users_cursor(cursor),
+            is_enabled=is_enabled,
+            has_snapshot=has_snapshot,
+            last_seen_from_ms=last_seen_from_ms,
+            last_seen_to_ms=last_seen_to_ms,
+            prefix=(q or "").strip() or None,
+        )
+        users = [
+            {
+                **_serialize_dashboard_profile(profile),
+                "snapshot": build_materialized_snapshot_summary(summary),
+            }
+            for profile, summary in entries
+        ]
+        next_cursor = _encode_users_cursor(entries[-1][0]) if len(entries) == limit else None
+        return RawJsonResponse({"success": True, "users": users, "next_cursor": next_cursor})
 
     @app.post("/dashboard/users")
     def create_dashboard_user(request: DashboardUserCreateRequest) -> dict[str, Any]:
@@ -450,28 +1260,55 @@ def create_app(*, db_path: str) -> FastAPI:
         }
 
     @app.get("/dashboard/users/{user_id}")
-    def get_dashboard_user(user_id: str) -> dict[str, Any]:
+    def get_dashboard_user(
+        user_id: str,
+        if_none_match: str | None = Header(default=None),
+    ) -> Response:
         uid = user_id.strip()
         if not uid:
             raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
 
-        profile, snapshot = _resolve_dashboard_user(store=store, user_id=uid)
-        if profile is None:
+        if if_none_match:
+            # 只读版本信息：快照 revision、用户资料、最新同步记录 id 与待回填 diff 数都没变时不再读取正文
+            version = store.get_dashboard_user_version(uid, recent_records=DASHBOARD_RECENT_RECORDS)
+            if version is not None:
+                etag = _dashboard_user_etag(
+                    uid,
+                    server_revision=version.server_revision,
+                    profile=version.profile,
+                    latest_record_id=version.latest_record_id,
+                    pending_diffs=version.pending_diffs,
+                )
+                if etag_matches(if_none_match, etag):
+                    return not_modified(etag, cache_control=REVALIDATE_CACHE_CONTROL)
+
+        snapshot = store.get_snapshot(uid)
+        stored_profile = store.get_user_profile(uid)
+        if stored_profile is None and snapshot is None:
             raise HTTPException(status_code=404, detail={"message": "用户不存在"})
+        profile = stored_profile or _fallback_dashboard_user(user_id=uid, snapshot=snapshot)
 
-        recent_records = [
-            _serialize_sync_record(record, include_diff=False)
-            for record in store.list_sync_records(user_id=uid, limit=20, before_id=None)
-        ]
-        return {
-            "success": True,
-            "user": _serialize_dashboard_user(profile=profile, snapshot=snapshot),
-            "snapshot": {
-                **build_snapshot_summary(snapshot),
-                "tools_data": {} if snapshot is None else snapshot.tools_data,
+        records = store.list_sync_records(user_id=uid, limit=DASHBOARD_RECENT_RECORDS, before_id=None)
+        # ETag 取自本次实际读到的数据，保证与响应内容一致
+        etag = _dashboard_user_etag(
+            uid,
+            server_revision=0 if snapshot is None else snapshot.server_revision,
+            profile=stored_profile,
+            latest_record_id=records[0].id if records else 0,
+            pending_diffs=sum(1 for record in records if record.diff_status == DIFF_STATUS_PENDING),
+        )
+        return RawJsonResponse(
+            {
+                "success": True,
+                "user": _serialize_dashboard_user(profile=profile, snapshot=snapshot),
+                "snapshot": {
+                    **build_snapshot_summary(snapshot),
+                    "tools_data": RawJson("{}" if snapshot is None else snapshot.tools_data_json),
+                },
+                "recent_records": [_serialize_sync_record(record, include_diff=False) for record in records],
             },
-            "recent_records": recent_records,
-        }
+            headers=cache_headers(etag, cache_control=REVALIDATE_CACHE_CONTROL),
+        )
 
     @app.patch("/dashboard/users/{user_id}")
     def update_dashboard_user(
@@ -499,7 +1336,11 @@ def create_app(*, db_path: str) -> FastAPI:
         }
 
     @app.get("/dashboard/users/{user_id}/tools/{tool_id}")
-    def get_dashboard_tool(user_id: str, tool_id: str) -> dict[str, Any]:
+    def get_dashboard_tool(
+        user_id: str,
+        tool_id: str,
+        if_none_match: str | None = Header(default=None),
+    ) -> Response:
         uid = user_id.strip()
         normalized_tool_id = tool_id.strip()
         if not uid:
@@ -507,7 +1348,14 @@ def create_app(*, db_path: str) -> FastAPI:
         if not normalized_tool_id:
             raise HTTPException(status_code=400, detail={"message": "tool_id 不能为空"})
 
-        _profile, snapshot = _resolve_dashboard_user(store=store, user_id=uid)
+        tool_version = store.get_tool_version(uid, normalized_tool_id)
+        etag = None
+        if tool_version is not None:
+            etag = make_etag(uid, tool_version[0], normalized_tool_id, tool_version[1])
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, cache_control=REVALIDATE_CACHE_CONTROL)
+
+        snapshot = store.get_snapshot(uid)
         if snapshot is None:
             raise HTTPException(status_code=404, detail={"message": "快照不存在"})
 
@@ -515,68 +1363,86 @@ def create_app(*, db_path: str) -> FastAPI:
         if not isinstance(tool_snapshot, dict):
             raise HTTPException(status_code=404, detail={"message": "工具数据不存在"})
 
-        return {
-            "success": True,
-            "tool": {
-                "tool_id": normalized_tool_id,
-                "version": int(tool_snapshot.get("version") or 0),
-                "data": tool_snapshot.get("data") or {},
-                "summary": build_tool_summary(normalized_tool_id, tool_snapshot),
+        # 读版本号与读正文之间有新写入时不下发 ETag，避免旧标签对应新内容
+        headers = (
+            cache_headers(etag, cache_control=REVALIDATE_CACHE_CONTROL)
+            if etag is not None and tool_version is not None and tool_version[0] == snapshot.server_revision
+            else None
+        )
+        return RawJsonResponse(
+            {
+                "success": True,
+                "tool": {
+                    "tool_id": normalized_tool_id,
+                    "version": int(tool_snapshot.get("version") or 0),
+                    "data": tool_snapshot.get("data") or {},
+                    "summary": build_tool_summary(normalized_tool_id, tool_snapshot),
+                },
+                "snapshot": build_snapshot_summary(snapshot),
             },
-            "snapshot": build_snapshot_summary(snapshot),
-        }
+            headers=headers,
+        )
 
     @app.put("/dashboard/users/{user_id}/snapshot")
     def update_dashboard_snapshot(
         user_id: str,
         request: DashboardSnapshotUpdateRequest,
-    ) -> dict[str, Any]:
+    ) -> RawJsonResponse:
         uid = user_id.strip()
         if not uid:
             raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
 
         normalized_tools_data = _normalize_dashboard_tools_data(request.tools_data)
         server_time = _now_ms()
-        store.touch_user(user_id=uid, now_ms=server_time)
-        current = store.get_snapshot(uid)
-        previous_tools_data = {} if current is None else current.tools_data
-        normalized_tools_data = apply_dashboard_work_log_rules(
-            previous_tools_data=previous_tools_data,
-            next_tools_data=normalized_tools_data,
-            now_ms=server_time,
-        )
 
-        saved_updated_at_ms = max(server_time, compute_latest_updated_at_ms(normalized_tools_data))
-        server_revision_before = 0 if current is None else current.server_revision
-        server_updated_at_before = 0 if current is None else current.updated_at_ms
-        diff = build_tools_diff(
-            server_tools_data=previous_tools_data,
-            client_tools_data=normalized_tools_data,
-        )
-        message = (request.message or "").strip()
-        if message:
-            diff = {**diff, "dashboard_message": message}
+        def work(uow: SyncUnitOfWork) -> None:
+            uow.touch_user(user_id=uid, now_ms=server_time)
+            current = uow.get_snapshot(uid)
+            previous_tools_data = {} if current is None else current.tools_data
+            next_tools_data = apply_dashboard_work_log_rules(
+                previous_tools_data=previous_tools_data,
+                next_tools_data=normalized_tools_data,
+                now_ms=server_time,
+            )
 
-        new_revision = store.save_client_snapshot(
-            user_id=uid,
-            tools_data=normalized_tools_data,
-            updated_at_ms=saved_updated_at_ms,
-            server_time_ms=server_time,
-            client_time_ms=None,
-        )
-        store.add_sync_record(
-            user_id=uid,
-            protocol_version=99,
-            decision="dashboard_update",
-            server_time_ms=server_time,
-            client_time_ms=None,
-            client_updated_at_ms=saved_updated_at_ms,
-            server_updated_at_ms_before=server_updated_at_before,
-            server_updated_at_ms_after=saved_updated_at_ms,
-            server_revision_before=server_revision_before,
-            server_revision_after=new_revision,
-            diff=diff,
-        )
+            analysis = analyze_tools_data(next_tools_data)
+            saved_updated_at_ms = max(server_time, analysis.max_updated_at_ms)
+            server_revision_before = 0 if current is None else current.server_revision
+            server_updated_at_before = 0 if current is None else current.updated_at_ms
+            message = (request.message or "").strip()
+            # 备注随记录立即落库，不等后台 diff
+            placeholder = {"dashboard_message": message} if message else None
+
+            new_revision = uow.save_client_snapshot(
+                user_id=uid,
+                tools_data=next_tools_data,
+                updated_at_ms=saved_updated_at_ms,
+                server_time_ms=server_time,
+                client_time_ms=None,
+                analysis=analysis,
+            )
+            uow.add_sync_record(
+                user_id=uid,
+                protocol_version=99,
+                decision="dashboard_update",
+                server_time_ms=server_time,
+                client_time_ms=None,
+                client_updated_at_ms=saved_updated_at_ms,
+                server_updated_at_ms_before=server_updated_at_before,
+                server_updated_at_ms_after=saved_updated_at_ms,
+                server_revision_before=server_revision_before,
+                server_revision_after=new_revision,
+                diff=placeholder,
+                compute_diff=_deferred_snapshot_diff(
+                    store,
+                    snapshot=current,
+                    next_tools_data=next_tools_data,
+                    next_analysis=analysis,
+                    extra=placeholder,
+                ),
+            )
+
+        _run_unit_of_work(store, user_id=uid, work=work)
 
         snapshot = store.get_snapshot(uid)
         if snapshot is None:
@@ -584,18 +1450,20 @@ def create_app(*, db_path: str) -> FastAPI:
         profile, _ = _resolve_dashboard_user(store=store, user_id=uid)
         if profile is None:
             raise HTTPException(status_code=500, detail={"message": "用户资料未找到"})
-        return {
-            "success": True,
-            "user": _serialize_dashboard_user(profile=profile, snapshot=snapshot),
-            "snapshot": {
-                **build_snapshot_summary(snapshot),
-                "tools_data": snapshot.tools_data,
-            },
-            "recent_records": [
-                _serialize_sync_record(record, include_diff=False)
-                for record in store.list_sync_records(user_id=uid, limit=20, before_id=None)
-            ],
-        }
+        return RawJsonResponse(
+            {
+                "success": True,
+                "user": _serialize_dashboard_user(profile=profile, snapshot=snapshot),
+                "snapshot": {
+                    **build_snapshot_summary(snapshot),
+                    "tools_data": RawJson(snapshot.tools_data_json),
+                },
+                "recent_records": [
+                    _serialize_sync_record(record, include_diff=False)
+                    for record in store.list_sync_records(user_id=uid, limit=DASHBOARD_RECENT_RECORDS, before_id=None)
+                ],
+            }
+        )
 
 
     @app.put("/dashboard/users/{user_id}/tools/{tool_id}")
@@ -612,51 +1480,60 @@ def create_app(*, db_path: str) -> FastAPI:
             raise HTTPException(status_code=400, detail={"message": "tool_id 不能为空"})
 
         server_time = _now_ms()
-        store.touch_user(user_id=uid, now_ms=server_time)
-        current = store.get_snapshot(uid)
-        previous_tools_data = {} if current is None else current.tools_data
-        next_tools_data = dict(previous_tools_data)
-        next_tools_data[normalized_tool_id] = {
-            "version": int(request.version),
-            "data": request.data,
-        }
-        next_tools_data = apply_dashboard_work_log_rules(
-            previous_tools_data=previous_tools_data,
-            next_tools_data=next_tools_data,
-            now_ms=server_time,
-        )
 
-        saved_updated_at_ms = max(server_time, compute_latest_updated_at_ms(next_tools_data))
-        server_revision_before = 0 if current is None else current.server_revision
-        server_updated_at_before = 0 if current is None else current.updated_at_ms
-        diff = build_tools_diff(
-            server_tools_data=previous_tools_data,
-            client_tools_data=next_tools_data,
-        )
-        message = (request.message or "").strip()
-        if message:
-            diff = {**diff, "dashboard_message": message}
+        def work(uow: SyncUnitOfWork) -> None:
+            uow.touch_user(user_id=uid, now_ms=server_time)
+            current = uow.get_snapshot(uid)
+            previous_tools_data = {} if current is None else current.tools_data
+            next_tools_data = dict(previous_tools_data)
+            next_tools_data[normalized_tool_id] = {
+                "version": int(request.version),
+                "data": request.data,
+            }
+            next_tools_data = apply_dashboard_work_log_rules(
+                previous_tools_data=previous_tools_data,
+                next_tools_data=next_tools_data,
+                now_ms=server_time,
+            )
 
-        new_revision = store.save_client_snapshot(
-            user_id=uid,
-            tools_data=next_tools_data,
-            updated_at_ms=saved_updated_at_ms,
-            server_time_ms=server_time,
-            client_time_ms=None,
-        )
-        store.add_sync_record(
-            user_id=uid,
-            protocol_version=99,
-            decision="dashboard_update",
-            server_time_ms=server_time,
-            client_time_ms=None,
-            client_updated_at_ms=saved_updated_at_ms,
-            server_updated_at_ms_before=server_updated_at_before,
-            server_updated_at_ms_after=saved_updated_at_ms,
-            server_revision_before=server_revision_before,
-            server_revision_after=new_revision,
-            diff=diff,
-        )
+            analysis = analyze_tools_data(next_tools_data)
+            saved_updated_at_ms = max(server_time, analysis.max_updated_at_ms)
+            server_revision_before = 0 if current is None else current.server_revision
+            server_updated_at_before = 0 if current is None else current.updated_at_ms
+            message = (request.message or "").strip()
+            # 备注随记录立即落库，不等后台 diff
+            placeholder = {"dashboard_message": message} if message else None
+
+            new_revision = uow.save_client_snapshot(
+                user_id=uid,
+                tools_data=next_tools_data,
+                updated_at_ms=saved_updated_at_ms,
+                server_time_ms=server_time,
+                client_time_ms=None,
+                analysis=analysis,
+            )
+            uow.add_sync_record(
+                user_id=uid,
+                protocol_version=99,
+                decision="dashboard_update",
+                server_time_ms=server_time,
+                client_time_ms=None,
+                client_updated_at_ms=saved_updated_at_ms,
+                server_updated_at_ms_before=server_updated_at_before,
+                server_updated_at_ms_after=saved_updated_at_ms,
+                server_revision_before=server_revision_before,
+                server_revision_after=new_revision,
+                diff=placeholder,
+                compute_diff=_deferred_snapshot_diff(
+                    store,
+                    snapshot=current,
+                    next_tools_data=next_tools_data,
+                    next_analysis=analysis,
+                    extra=placeholder,
+                ),
+            )
+
+        _run_unit_of_work(store, user_id=uid, work=work)
 
         snapshot = store.get_snapshot(uid)
         assert snapshot is not None
@@ -675,6 +1552,33 @@ def create_app(*, db_path: str) -> FastAPI:
             },
         }
 
+    @app.get("/sync/watch")
+    async def watch_revision(
+        user_id: str = Query(min_length=1),
+        since_revision: int = Query(default=0, ge=0),
+        timeout_s: float = Query(default=25.0, ge=0, le=60),
+    ) -> dict[str, Any]:
+        """长轮询：该用户的 revision 超过 `since_revision` 时立即返回，否则等到超时。
+
+        客户端收到 `changed=true` 后再走 `/sync/v2`，空闲时只保持一个挂起的连接。
+        """
+
+        uid = user_id.strip()
+        if not uid:
+            raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
+
+        revision = await watcher.wait_for_revision(
+            user_id=uid,
+            read_revision=lambda: store.get_snapshot_revision(uid),
+            since_revision=since_revision,
+            timeout_s=timeout_s,
+        )
+        return {
+            "success": True,
+            "changed": revision > since_revision,
+            "server_revision": revision,
+        }
+
     @app.get("/sync/records")
     def list_sync_records(
         user_id: str = Query(min_length=1),
@@ -713,29 +1617,88 @@ def create_app(*, db_path: str) -> FastAPI:
     def get_snapshot_by_revision(
         revision: int,
         user_id: str = Query(min_length=1),
-    ) -> dict[str, Any]:
+        if_none_match: str | None = Header(default=None),
+    ) -> Response:
         uid = user_id.strip()
         if not uid:
             raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
         if revision <= 0:
             raise HTTPException(status_code=400, detail={"message": "revision 必须大于 0"})
 
+        # 同一 (user_id, revision) 的内容写入后不再变化
+        etag = make_etag(uid, revision)
+        if etag_matches(if_none_match, etag) and store.has_snapshot_revision(uid, revision):
+            return not_modified(etag, cache_control=IMMUTABLE_CACHE_CONTROL)
+
         snapshot = store.get_snapshot_by_revision(uid, revision)
         if snapshot is None:
             raise HTTPException(status_code=404, detail={"message": "快照不存在"})
 
-        return {
-            "success": True,
-            "snapshot": {
-                "user_id": snapshot.user_id,
-                "server_revision": snapshot.server_revision,
-                "updated_at_ms": snapshot.updated_at_ms,
-                "tools_data": snapshot.tools_data,
+        return RawJsonResponse(
+            {
+                "success": True,
+                "snapshot": {
+                    "user_id": snapshot.user_id,
+                    "server_revision": snapshot.server_revision,
+                    "updated_at_ms": snapshot.updated_at_ms,
+                    "tools_data": RawJson(snapshot.tools_data_json),
+                },
             },
-        }
+            headers=cache_headers(etag, cache_control=IMMUTABLE_CACHE_CONTROL),
+        )
+
+    @app.get("/sync/diff")
+    def get_revision_diff(
+        user_id: str = Query(min_length=1),
+        from_revision: int = Query(ge=0),
+        to_revision: int = Query(ge=1),
+        offset: int = Query(default=0, ge=0),
+        limit: int = Query(default=100, ge=1, le=500),
+        if_none_match: str | None = Header(default=None),
+    ) -> Response:
+        """任意两个历史 revision 之间的 diff（`from_revision=0` 为空快照），按需计算并按 revision 对缓存。
+
+        diff 条目不截断，以 `offset`/`limit` 分页，`next_offset` 为空表示最后一页。
+        """
+
+        uid = user_id.strip()
+        if not uid:
+            raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
+
+        # 两个 revision 的内容都不再变化，同一页的响应也不变
+        etag = make_etag(uid, from_revision, to_revision, offset, limit)
+        if (
+            etag_matches(if_none_match, etag)
+            and (from_revision == 0 or store.has_snapshot_revision(uid, from_revision))
+            and store.has_snapshot_revision(uid, to_revision)
+        ):
+            return not_modified(etag, cache_control=IMMUTABLE_CACHE_CONTROL)
+
+        diff = revision_diffs.get(uid, from_revision, to_revision)
+        if diff is None:
+            diff = compute_revision_diff(store, user_id=uid, from_revision=from_revision, to_revision=to_revision)
+            if diff is None:
+                raise HTTPException(status_code=404, detail={"message": "快照不存在"})
+            revision_diffs.put(diff)
+
+        page = diff.items[offset : offset + limit]
+        end = offset + len(page)
+        return RawJsonResponse(
+            {
+                "success": True,
+                "user_id": uid,
+                "from_revision": diff.from_revision,
+                "to_revision": diff.to_revision,
+                "summary": diff.summary,
+                "tools": diff.tools,
+                "diff_items": list(page),
+                "next_offset": end if end < len(diff.items) else None,
+            },
+            headers=cache_headers(etag, cache_control=IMMUTABLE_CACHE_CONTROL),
+        )
 
     @app.post("/sync/rollback")
-    def rollback_to_revision(request: RollbackRequest) -> dict[str, Any]:
+    def rollback_to_revision(request: RollbackRequest) -> RawJsonResponse:
         user_id = request.user_id.strip()
         if not user_id:
             raise HTTPException(status_code=400, detail={"message": "user_id 不能为空"})
@@ -749,59 +1712,62 @@ def create_app(*, db_path: str) -> FastAPI:
             raise HTTPException(status_code=404, detail={"message": "目标快照不存在"})
 
         server_time = _now_ms()
-        store.touch_user(user_id=user_id, now_ms=server_time)
-        current = store.get_snapshot(user_id)
-        server_tools_before: dict[str, Any] = {} if current is None else current.tools_data
-        server_revision_before = 0 if current is None else current.server_revision
-        server_updated_at_before = 0 if current is None else current.updated_at_ms
-
-        # 回退属于一次“变更事件”，updated_at 取服务端当前时间以确保客户端可拉取到该版本。
-        saved_updated_at_ms = max(int(target.updated_at_ms), int(server_time))
-
-        diff = build_tools_diff(
-            server_tools_data=server_tools_before,
-            client_tools_data=target.tools_data,
-        )
-        new_revision = store.save_client_snapshot(
-            user_id=user_id,
-            tools_data=target.tools_data,
-            updated_at_ms=saved_updated_at_ms,
-            server_time_ms=server_time,
-            client_time_ms=None,
-        )
-        store.add_sync_record(
-            user_id=user_id,
-            protocol_version=0,
-            decision="rollback",
-            server_time_ms=server_time,
-            client_time_ms=None,
-            client_updated_at_ms=0,
-            server_updated_at_ms_before=server_updated_at_before,
-            server_updated_at_ms_after=saved_updated_at_ms,
-            server_revision_before=server_revision_before,
-            server_revision_after=new_revision,
-            diff=diff,
-        )
 
-        return {
-            "success": True,
-            "server_time": server_time,
-            "server_revision": new_revision,
-            "restored_from_revision": target_revision,
-            "tools_data": target.tools_data,
-        }
+        def work(uow: SyncUnitOfWork) -> int:
+            uow.touch_user(user_id=user_id, now_ms=server_time)
+            current = uow.get_snapshot(user_id)
+            server_revision_before = 0 if current is None else current.server_revision
+            server_updated_at_before = 0 if current is None else current.updated_at_ms
+
+            # 回退属于一次“变更事件”，updated_at 取服务端当前时间以确保客户端可拉取到该版本。
+            saved_updated_at_ms = max(int(target.updated_at_ms), int(server_time))
+
+            analysis = analyze_tools_data(target.tools_data)
+            new_revision = uow.save_client_snapshot(
+                user_id=user_id,
+                tools_data=target.tools_data,
+                updated_at_ms=saved_updated_at_ms,
+                server_time_ms=server_time,
+                client_time_ms=None,
+                analysis=analysis,
+            )
+            uow.add_sync_record(
+                user_id=user_id,
+                protocol_version=0,
+                decision="rollback",
+                server_time_ms=server_time,
+                client_time_ms=None,
+                client_updated_at_ms=0,
+                server_updated_at_ms_before=server_updated_at_before,
+                server_updated_at_ms_after=saved_updated_at_ms,
+                server_revision_before=server_revision_before,
+                server_revision_after=new_revision,
+                compute_diff=_deferred_snapshot_diff(
+                    store,
+                    snapshot=current,
+                    next_tools_data=target.tools_data,
+                    next_analysis=analysis,
+                ),
+            )
+            return new_revision
+
+        new_revision = _run_unit_of_work(store, user_id=user_id, work=work)
+
+        return RawJsonResponse(
+            {
+                "success": True,
+                "server_time": server_time,
+                "server_revision": new_revision,
+                "restored_from_revision": target_revision,
+                "tools_data": RawJson(target.tools_data_json),
+            }
+        )
 
     return app
 
 
 def create_default_app() -> FastAPI:
-    # 默认把数据放在 backend/sync_server/data/sync.db
-    env_db_path = os.environ.get("SYNC_SERVER_DB_PATH", "").strip()
-    if env_db_path:
-        return create_app(db_path=env_db_path)
-
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    return create_app(db_path=os.path.join(base_dir, "data", "sync.db"))
+    return create_app(db_path=default_db_path(), compression=default_compression())
 
 
 app = create_default_app()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from .canonical_json import row_ids, sha256_hex, stable_dumps
+
+MERKLE_INDEX_VERSION = 1
+# 分段/行节点只用于判等，截断到 128 bit 以控制索引体积；工具 hash 仍为完整 SHA-256。
+_NODE_HASH_CHARS = 32
+
+
+@dataclass(frozen=True)
+class SectionNode:
+    hash: str
+    # 分段是对象列表时的逐行 hash（按位置）；其它值为 None
+    row_hashes: tuple[str, ...] | None = None
+    # 每行都带唯一标量 `id` 时的 id（与 row_hashes 一一对应）
+    row_ids: tuple[Any, ...] | None = None
+
+
+@dataclass(frozen=True)
+class ToolMerkleIndex:
+    """单个工具快照的三层 Merkle 索引：工具 -> 分段 -> 行。
+
+    分段是工具顶层的键；顶层值是对象（如 `data`）时改为取它的各个子键，
+    路径形如 `("version",)`、`("data", "tasks")`。`tool_hash` 与 `hash_tool_snapshot` 同口径。
+    """
+
+    tool_hash: str
+    sections: dict[tuple[str, ...], SectionNode]
+
+
+def index_tool_snapshot(tool_snapshot: Any) -> tuple[str, ToolMerkleIndex]:
+    """一次遍历同时得到工具的规范化 JSON（与 `hash_tool_snapshot` 逐字节相同）与 Merkle 索引。
+
+    规范化 JSON 由各行、各分段的规范化文本拼接而成，行只序列化一次，不额外遍历整棵树。
+    """
+
+    sections: dict[tuple[str, ...], SectionNode] = {}
+    if not _is_plain_object(tool_snapshot):
+        body = stable_dumps(tool_snapshot)
+        return body, ToolMerkleIndex(tool_hash=sha256_hex(body), sections=sections)
+
+    parts: list[str] = []
+    for key, value in sorted(tool_snapshot.items()):
+        if _is_plain_object(value):
+            inner: list[str] = []
+            for child_key, child in sorted(value.items()):
+                text, node = _index_section(child)
+                sections[(key, child_key)] = node
+                inner.append(f"{_dump_key(child_key)}:{text}")
+            text = "{" + ",".join(inner) + "}"
+        else:
+            text, node = _index_section(value)
+            sections[(key,)] = node
+        parts.append(f"{_dump_key(key)}:{text}")
+    body = "{" + ",".join(parts) + "}"
+    return body, ToolMerkleIndex(tool_hash=sha256_hex(body), sections=sections)
+
+
+def index_tools_data(tools_data: Mapping[str, Any]) -> dict[str, tuple[str, ToolMerkleIndex]]:
+    return {tool_id: index_tool_snapshot(tool_snapshot) for tool_id, tool_snapshot in tools_data.items()}
+
+
+def merkle_index_to_json(index: ToolMerkleIndex) -> str:
+    return json.dumps(
+        {
+            "v": MERKLE_INDEX_VERSION,
+            "h": index.tool_hash,
+            "s": [
+                [
+                    list(path),
+                    node.hash,
+                    None if node.row_hashes is None else list(node.row_hashes),
+                    None if node.row_ids is None else list(node.row_ids),
+                ]
+                for path, node in index.sections.items()
+            ],
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def merkle_index_from_json(text: str) -> ToolMerkleIndex | None:
+    """格式版本不匹配时返回 None，调用方回退为全量比较。"""
+
+    raw = json.loads(text)
+    if not isinstance(raw, dict) or raw.get("v") != MERKLE_INDEX_VERSION:
+        return None
+    sections: dict[tuple[str, ...], SectionNode] = {}
+    for path, node_hash, row_hashes, ids in raw.get("s") or []:
+        sections[tuple(path)] = SectionNode(
+            hash=node_hash,
+            row_hashes=None if row_hashes is None else tuple(row_hashes),
+            row_ids=None if ids is None else tuple(ids),
+        )
+    return ToolMerkleIndex(tool_hash=str(raw["h"]), sections=sections)
+
+
+def _index_section(value: Any) -> tuple[str, SectionNode]:
+    if isinstance(value, list) and value and all(_is_plain_object(row) for row in value):
+        row_texts = [stable_dumps(row) for row in value]
+        row_hashes = tuple(_node_hash(text) for text in row_texts)
+        node = SectionNode(
+            hash=_node_hash("rows\0" + "".join(row_hashes)),
+            row_hashes=row_hashes,
+            row_ids=row_ids(value),
+        )
+        return "[" + ",".join(row_texts) + "]", node
+    text = stable_dumps(value)
+    return text, SectionNode(hash=_node_hash(text))
+
+
+def _is_plain_object(value: Any) -> bool:
+    # 只拆分键全为字符串的 dict：与 json.dumps(sort_keys=True) 的排序口径保持一致
+    return isinstance(value, dict) and all(isinstance(key, str) for key in value)
+
+
+def _dump_key(key: str) -> str:
+    return json.dumps(key, ensure_ascii=False)
+
+
+def _node_hash(text: str) -> str:
+    return sha256_hex(text)[:_NODE_HASH_CHARS]
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from .audit_diff import build_snapshot_diff
+from .storage import SqliteSnapshotStore
+
+# 缓存按 diff 条目总数计容量；单个 diff 的条目上限只防止极端快照撑爆内存，分页遍历的是完整结果。
+DEFAULT_REVISION_DIFF_CACHE_ITEMS = 200_000
+MAX_REVISION_DIFF_ITEMS = 100_000
+
+
+@dataclass(frozen=True)
+class RevisionDiff:
+    """两个历史 revision 之间的完整 diff；`items` 已按工具展开并带上 `tool_id`，便于分页。"""
+
+    user_id: str
+    from_revision: int
+    to_revision: int
+    summary: dict[str, Any]
+    tools: dict[str, dict[str, Any]]
+    items: tuple[dict[str, Any], ...]
+
+
+@dataclass(frozen=True)
+class RevisionDiffCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    items: int
+    max_items: int
+
+
+class RevisionDiffCache:
+    """revision 对 -> diff 的进程内 LRU 缓存。
+
+    同一 (user_id, from, to) 的历史内容写入后不再变化，缓存条目无需失效；
+    容量按缓存的 diff 条目总数计算，`max_items <= 0` 表示关闭缓存。
+    """
+
+    def __init__(self, *, max_items: int = DEFAULT_REVISION_DIFF_CACHE_ITEMS) -> None:
+        self._max_items = max(0, int(max_items))
+        self._entries: OrderedDict[tuple[str, int, int], RevisionDiff] = OrderedDict()
+        self._items = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, from_revision: int, to_revision: int) -> RevisionDiff | None:
+        key = (user_id, int(from_revision), int(to_revision))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, diff: RevisionDiff) -> None:
+        size = _entry_size(diff)
+        if size > self._max_items:
+            return
+        key = (diff.user_id, diff.from_revision, diff.to_revision)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._items -= _entry_size(previous)
+            self._entries[key] = diff
+            self._items += size
+            while self._items > self._max_items:
+                _, evicted = self._entries.popitem(last=False)
+                self._items -= _entry_size(evicted)
+                self._evictions += 1
+
+    def stats(self) -> RevisionDiffCacheStats:
+        with self._lock:
+            return RevisionDiffCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                items=self._items,
+                max_items=self._max_items,
+            )
+
+
+def compute_revision_diff(
+    store: SqliteSnapshotStore,
+    *,
+    user_id: str,
+    from_revision: int,
+    to_revision: int,
+) -> RevisionDiff | None:
+    """从历史快照计算 `from_revision` -> `to_revision` 的 diff；`from_revision=0` 表示空快照。
+
+    任一 revision 不存在时返回 None。两侧内容块已存的 Merkle 索引会被复用。
+    """
+
+    before = None
+    if from_revision > 0:
+        before = store.get_snapshot_by_revision(user_id, from_revision)
+        if before is None:
+            return None
+    after = store.get_snapshot_by_revision(user_id, to_revision)
+    if after is None:
+        return None
+
+    raw = build_snapshot_diff(
+        store,
+        snapshot=before,
+        next_tools_data=after.tools_data,
+        next_merkle=store.get_merkle_indexes(after) or None,
+        max_diffs=MAX_REVISION_DIFF_ITEMS,
+        max_list_items=MAX_REVISION_DIFF_ITEMS,
+    )
+    tools: dict[str, dict[str, Any]] = {}
+    items: list[dict[str, Any]] = []
+    for tool_id, tool in raw["tools"].items():
+        tools[tool_id] = {
+            "same": tool["same"],
+            "from_hash": tool["server_hash"],
+            "to_hash": tool["client_hash"],
+            "diff_items": len(tool["diff_items"]),
+        }
+        items.extend({"tool_id": tool_id, **item} for item in tool["diff_items"])
+    return RevisionDiff(
+        user_id=user_id,
+        from_revision=int(from_revision),
+        to_revision=int(to_revision),
+        summary=raw["summary"],
+        tools=tools,
+        items=tuple(items),
+    )
+
+
+def _entry_size(diff: RevisionDiff) -> int:
+    # 没有条目的 diff 也占一个单位，避免空 diff 无限堆积
+    return max(1, len(diff.items))
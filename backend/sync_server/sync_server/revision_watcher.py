@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+
+import anyio
+
+DEFAULT_POLL_INTERVAL_S = 0.1
+
+
+@dataclass(eq=False)
+class _Waiter:
+    loop: asyncio.AbstractEventLoop
+    since_revision: int
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+    # 唤醒方已确认的最新 revision；等待者醒来后直接使用，不再回库点查
+    revision: int = 0
+
+
+class RevisionWatcher:
+    """等待某个用户的快照 revision 前进（`GET /sync/watch` 的长轮询实现）。
+
+    等待者按用户登记，只有该用户的 revision 超过其 `since_revision` 时才被唤醒：
+    - 本进程的写入在提交后由 `publish()` 直接通知（见 `SqliteSnapshotStore.set_revision_listener`）；
+    - 其它 worker 进程的写入靠后台线程轮询 `PRAGMA data_version` 发现，变化时由线程一次性批量
+      读取所有等待中用户的 revision（`read_revisions`），再只唤醒 revision 前进了的用户。
+    只在有等待者时轮询，空闲时线程退出；等待者本身只是挂起的协程，不占用线程池。
+    """
+
+    def __init__(
+        self,
+        *,
+        db_path: str,
+        read_revisions: Callable[[Sequence[str]], dict[str, int]],
+        poll_interval_s: float = DEFAULT_POLL_INTERVAL_S,
+    ) -> None:
+        self._db_path = db_path
+        self._read_revisions = read_revisions
+        self._poll_interval_s = max(0.01, float(poll_interval_s))
+        self._lock = threading.Lock()
+        self._waiters: dict[str, set[_Waiter]] = {}
+        self._thread: threading.Thread | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._data_version = 0
+        self._closed = False
+
+    async def wait_for_revision(
+        self,
+        *,
+        user_id: str,
+        read_revision: Callable[[], int],
+        since_revision: int,
+        timeout_s: float,
+    ) -> int:
+        """revision 超过 `since_revision` 或超时后返回当前 revision（服务关闭时原样返回 `since_revision`）。"""
+
+        deadline = time.monotonic() + max(0.0, float(timeout_s))
+        waiter = _Waiter(loop=asyncio.get_running_loop(), since_revision=since_revision)
+        # 先登记再读取：读取之后的任何提交都一定会通知到这个等待者
+        self._register(user_id, waiter)
+        try:
+            if self._closed:
+                return since_revision
+            # 点查放到线程池执行，慢读不阻塞事件循环
+            revision = await anyio.to_thread.run_sync(read_revision)
+            while True:
+                if self._closed:
+                    return since_revision
+                revision = max(revision, waiter.revision)
+                remaining = deadline - time.monotonic()
+                if revision > since_revision or remaining <= 0:
+                    return revision
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._unregister(user_id, waiter)
+
+    def publish(self, user_id: str, revision: int) -> None:
+        """通知 `user_id` 的 revision 已前进到 `revision`；只唤醒因此满足条件的等待者。"""
+
+        with self._lock:
+            for waiter in self._waiters.get(user_id, ()):
+                if revision > waiter.revision:
+                    waiter.revision = revision
+                if revision > waiter.since_revision:
+                    _wake(waiter)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            waiters = [waiter for user_waiters in self._waiters.values() for waiter in user_waiters]
+        for waiter in waiters:
+            _wake(waiter)
+
+    def _register(self, user_id: str, waiter: _Waiter) -> None:
+        with self._lock:
+            self._waiters.setdefault(user_id, set()).add(waiter)
+            if self._thread is None and not self._closed:
+                # 基线在登记时同步读取，避免线程启动前的提交被当成基线漏掉
+                self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+                self._data_version = self._read_data_version()
+                self._thread = threading.Thread(target=self._run, name="revision-watcher", daemon=True)
+                self._thread.start()
+
+    def _unregister(self, user_id: str, waiter: _Waiter) -> None:
+        with self._lock:
+            user_waiters = self._waiters.get(user_id)
+            if user_waiters is None:
+                return
+            user_waiters.discard(waiter)
+            if not user_waiters:
+                del self._waiters[user_id]
+
+    def _read_data_version(self) -> int:
+        assert self._conn is not None
+        return int(self._conn.execute("PRAGMA data_version").fetchone()[0])
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._poll_interval_s)
+            with self._lock:
+                if not self._waiters or self._closed:
+                    if self._conn is not None:
+                        self._conn.close()
+                    self._conn = None
+                    self._thread = None
+                    return
+                version = self._read_data_version()
+                if version == self._data_version:
+                    continue
+                self._data_version = version
+                user_ids = list(self._waiters)
+            # 任何提交（包括 touch_user、diff 回填）都会改变 data_version：
+            # 这里只做一次批量读取，revision 没变的用户不会被唤醒。
+            try:
+                revisions = self._read_revisions(user_ids)
+            except sqlite3.Error:
+                # 服务关闭过程中连接池已关闭
+                continue
+            for user_id, revision in revisions.items():
+                self.publish(user_id, revision)
+
+
+def _wake(waiter: _Waiter) -> None:
+    try:
+        waiter.loop.call_soon_threadsafe(waiter.event.set)
+    except RuntimeError:
+        # 等待者所在的事件循环已关闭
+        pass
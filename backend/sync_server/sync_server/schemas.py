@@ -17,6 +17,8 @@ class SyncRequestV2(BaseModel):
     client_state: SyncClientState
     force_decision: str | None = None
     preview_server_update: bool = False
+    # 服务端领先时尝试以 last_server_revision 为基准三方合并（决策为 merge）
+    allow_merge: bool = False
     tools_data: dict[str, dict[str, Any]]
 
 
@@ -29,6 +31,60 @@ class SyncResponseV2(BaseModel):
     server_revision: int
 
 
+class SyncToolsResponseV2(BaseModel):
+    success: bool
+    # noop / use_client / use_server；两个方向都有时为 mixed
+    decision: str
+    message: str | None = None
+    tool_decisions: dict[str, str]
+    # 仅包含服务端胜出的工具
+    tools_data: dict[str, dict[str, Any]] | None = None
+    removed_tool_ids: list[str] | None = None
+    server_time: int
+    server_revision: int
+
+
+class SyncPatchRequest(BaseModel):
+    protocol_version: int
+    user_id: str = Field(min_length=1)
+    client_time: int
+    # last_server_revision 为补丁的基准版本，必须等于服务端当前 revision
+    client_state: SyncClientState
+    patch: list[dict[str, Any]]
+    # 应用补丁后每个工具的 hash（口径同 SyncToolDigest.hash），服务端据此校验结果
+    tool_hashes: dict[str, str]
+
+
+class SyncToolDigest(BaseModel):
+    # 与服务端 sync_diff.hash_tool_snapshot 同口径：
+    # sort_keys + 紧凑分隔符 + 保留非 ASCII 字符的 JSON 的 SHA-256（小写 hex）
+    hash: str = Field(min_length=64, max_length=64)
+    updated_at_ms: int = Field(default=0, ge=0)
+
+
+class SyncRequestV3(BaseModel):
+    protocol_version: int
+    user_id: str = Field(min_length=1)
+    client_time: int
+    client_state: SyncClientState
+    force_decision: str | None = None
+    preview_server_update: bool = False
+    tools: dict[str, SyncToolDigest]
+    # 仅在服务端返回 need_tools 后的第二次请求中携带，且只需包含被点名的工具
+    tools_data: dict[str, dict[str, Any]] | None = None
+
+
+class SyncResponseV3(BaseModel):
+    success: bool
+    decision: str
+    message: str | None = None
+    need_tool_ids: list[str] | None = None
+    tools_data: dict[str, dict[str, Any]] | None = None
+    removed_tool_ids: list[str] | None = None
+    server_time: int
+    server_revision: int
+
+
 class RollbackRequest(BaseModel):
     user_id: str = Field(min_length=1)
     target_revision: int = Field(gt=0)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import dataclasses
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .storage import UserSnapshot
+
+DEFAULT_SNAPSHOT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class SnapshotCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+    max_bytes: int
+
+
+class SnapshotCache:
+    """进程内最新快照 LRU 缓存，按 (user_id, server_revision) 寻址。
+
+    同一 revision 的内容写入后不再变化，调用方先用一次主键查询拿到当前 revision
+    再查缓存即可：其它 worker 的写入会推进 revision，旧条目自然失配，无需跨进程失效。
+    容量按 JSON 文本长度近似计算；`max_bytes <= 0` 表示关闭缓存。
+
+    存取时都会复制一份不含已解析 `tools_data` 的实例：调用方可能原地修改解析结果，
+    缓存只保存不可变的 JSON 文本与元数据。
+    """
+
+    def __init__(self, *, max_bytes: int = DEFAULT_SNAPSHOT_CACHE_BYTES) -> None:
+        self._max_bytes = max(0, int(max_bytes))
+        # 每个用户只保留最新 revision 的一份：user_id -> (snapshot, size)
+        self._entries: OrderedDict[str, tuple[UserSnapshot, int]] = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_bytes > 0
+
+    def get(self, user_id: str, server_revision: int) -> UserSnapshot | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0].server_revision != int(server_revision):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return dataclasses.replace(entry[0])
+
+    def put(self, snapshot: UserSnapshot) -> None:
+        size = len(snapshot.tools_data_json)
+        if not self.enabled or size > self._max_bytes:
+            return
+        detached = dataclasses.replace(snapshot)
+        with self._lock:
+            self._drop_user_locked(snapshot.user_id)
+            self._entries[snapshot.user_id] = (detached, size)
+            self._size_bytes += size
+            while self._size_bytes > self._max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_size
+                self._evictions += 1
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._drop_user_locked(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> SnapshotCacheStats:
+        with self._lock:
+            return SnapshotCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                size_bytes=self._size_bytes,
+                max_bytes=self._max_bytes,
+            )
+
+    def _drop_user_locked(self, user_id: str) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._size_bytes -= entry[1]
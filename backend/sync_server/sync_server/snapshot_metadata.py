@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any
+
+from .merkle_index import ToolMerkleIndex, index_tool_snapshot
+from .sync_logic import scan_tool_snapshot
+
+
+@dataclass(frozen=True)
+class ToolStats:
+    version: int
+    section_counts: dict[str, int]
+    total_items: int
+
+
+@dataclass(frozen=True)
+class SnapshotMetadata:
+    """写入时预先算好的快照派生信息，决策与 Dashboard 摘要无需再解析快照正文。"""
+
+    is_empty: bool
+    max_updated_at_ms: int
+    tool_hashes: dict[str, str]
+    tool_stats: dict[str, ToolStats]
+
+
+def build_tool_stats(tool_snapshot: Mapping[str, Any]) -> ToolStats:
+    version = int(tool_snapshot.get("version") or 0)
+    data = tool_snapshot.get("data")
+    section_counts: dict[str, int] = {}
+    total_items = 0
+    if isinstance(data, Mapping):
+        for section_name, section_value in data.items():
+            if isinstance(section_value, list):
+                count = len(section_value)
+            elif section_value is None:
+                count = 0
+            else:
+                count = 1
+            section_counts[str(section_name)] = count
+            total_items += count
+    return ToolStats(version=version, section_counts=section_counts, total_items=total_items)
+
+
+@dataclass(frozen=True)
+class ToolAnalysis:
+    """单个工具快照的派生信息。
+
+    更新时间与是否为空在构造时由同一轮遍历算出，分段计数只看 `data` 的顶层分段；
+    规范化 JSON、Merkle 索引与字节数另需一次序列化，在第一次用到时生成并缓存，
+    同一请求里的决策、落库与 diff 共用这一份结果。
+    """
+
+    max_updated_at_ms: int
+    is_empty: bool
+    stats: ToolStats
+    tool_snapshot: Any = field(repr=False, compare=False)
+
+    @cached_property
+    def indexed(self) -> tuple[str, ToolMerkleIndex]:
+        return index_tool_snapshot(self.tool_snapshot)
+
+    @property
+    def hash(self) -> str:
+        return self.indexed[1].tool_hash
+
+    @cached_property
+    def size_bytes(self) -> int:
+        return len(self.indexed[0].encode("utf-8"))
+
+
+@dataclass(frozen=True)
+class SnapshotAnalysis:
+    """整份 tools_data 的派生信息，由各工具的 `ToolAnalysis` 汇总，不再另行遍历快照。"""
+
+    tools: dict[str, ToolAnalysis]
+
+    @property
+    def is_empty(self) -> bool:
+        return all(tool.is_empty for tool in self.tools.values())
+
+    @property
+    def max_updated_at_ms(self) -> int:
+        return max((tool.max_updated_at_ms for tool in self.tools.values()), default=0)
+
+    @property
+    def tool_hashes(self) -> dict[str, str]:
+        return {tool_id: tool.hash for tool_id, tool in self.tools.items()}
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(tool.size_bytes for tool in self.tools.values())
+
+    def to_metadata(self, *, tool_hashes: Mapping[str, str] | None = None) -> SnapshotMetadata:
+        """`tool_hashes` 为已知的工具 hash（如已落库的清单），传入后不再序列化快照。"""
+
+        return SnapshotMetadata(
+            is_empty=self.is_empty,
+            max_updated_at_ms=self.max_updated_at_ms,
+            tool_hashes=dict(tool_hashes) if tool_hashes is not None else self.tool_hashes,
+            tool_stats={tool_id: tool.stats for tool_id, tool in self.tools.items()},
+        )
+
+
+def analyze_tool_snapshot(tool_snapshot: Any) -> ToolAnalysis:
+    max_updated_at_ms, is_empty = scan_tool_snapshot(tool_snapshot)
+    return ToolAnalysis(
+        max_updated_at_ms=max_updated_at_ms,
+        is_empty=is_empty,
+        stats=build_tool_stats(tool_snapshot if isinstance(tool_snapshot, Mapping) else {}),
+        tool_snapshot=tool_snapshot,
+    )
+
+
+def analyze_tools_data(tools_data: Mapping[str, Any]) -> SnapshotAnalysis:
+    return SnapshotAnalysis(
+        tools={tool_id: analyze_tool_snapshot(tool_snapshot) for tool_id, tool_snapshot in tools_data.items()}
+    )
+
+
+def build_snapshot_metadata(
+    tools_data: Mapping[str, Any],
+    *,
+    tool_hashes: Mapping[str, str] | None = None,
+) -> SnapshotMetadata:
+    return analyze_tools_data(tools_data).to_metadata(tool_hashes=tool_hashes)
+
+
+def tool_stats_summary(tool_id: str, stats: ToolStats) -> dict[str, Any]:
+    """Dashboard 展示用的单工具摘要。"""
+
+    return {
+        "tool_id": tool_id,
+        "version": stats.version,
+        "total_items": stats.total_items,
+        "section_counts": dict(stats.section_counts),
+    }
+
+
+def tool_stats_to_json(tool_stats: Mapping[str, ToolStats]) -> str:
+    return json.dumps(
+        {
+            tool_id: {
+                "version": stats.version,
+                "section_counts": stats.section_counts,
+                "total_items": stats.total_items,
+            }
+            for tool_id, stats in tool_stats.items()
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def tool_stats_from_json(text: str) -> dict[str, ToolStats]:
+    raw: dict[str, Any] = json.loads(text) if text else {}
+    return {
+        str(tool_id): ToolStats(
+            version=int(item.get("version") or 0),
+            section_counts={str(k): int(v) for k, v in (item.get("section_counts") or {}).items()},
+            total_items=int(item.get("total_items") or 0),
+        )
+        for tool_id, item in raw.items()
+    }
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import weakref
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class SqliteConnectionPool:
+    """SQLite 长连接池：每线程一个读连接 + 全局唯一写连接。
+
+    - 数据库使用 WAL，读连接不会被写事务阻塞；
+    - 写连接由锁串行化，`writer()` 内部以 `BEGIN IMMEDIATE` 开启事务；
+    - 连接只在首次使用时建立，之后复用，避免每次请求重复握手与加载 schema。
+    """
+
+    def __init__(
+        self,
+        *,
+        db_path: str,
+        timeout_s: float = 30.0,
+        cache_size_kib: int = 16 * 1024,
+        mmap_size_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        self._db_path = db_path
+        self._timeout_s = float(timeout_s)
+        self._cache_size_kib = int(cache_size_kib)
+        self._mmap_size_bytes = int(mmap_size_bytes)
+
+        self._local = threading.local()
+        self._registry_lock = threading.Lock()
+        self._readers: list[tuple[weakref.ref[threading.Thread], sqlite3.Connection]] = []
+
+        self._writer_lock = threading.RLock()
+        self._writer_conn: sqlite3.Connection | None = None
+        self._closed = False
+
+    @property
+    def db_path(self) -> str:
+        return self._db_path
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._db_path,
+            timeout=self._timeout_s,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self._cache_size_kib}")
+        conn.execute(f"PRAGMA mmap_size={self._mmap_size_bytes}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={int(self._timeout_s * 1000)}")
+        return conn
+
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        if self._closed:
+            raise sqlite3.ProgrammingError("connection pool is closed")
+
+        conn = self._open()
+        self._local.conn = conn
+        with self._registry_lock:
+            self._prune_dead_readers_locked()
+            self._readers.append((weakref.ref(threading.current_thread()), conn))
+        return conn
+
+    def _prune_dead_readers_locked(self) -> None:
+        # 线程池里的工作线程会被回收，这里顺手关闭已退出线程遗留的读连接。
+        alive: list[tuple[weakref.ref[threading.Thread], sqlite3.Connection]] = []
+        for thread_ref, conn in self._readers:
+            thread = thread_ref()
+            if thread is None or not thread.is_alive():
+                conn.close()
+            else:
+                alive.append((thread_ref, conn))
+        self._readers = alive
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """借出当前线程的读连接（autocommit，每条语句各自一个读快照）。"""
+
+        yield self._reader_conn()
+
+    @contextmanager
+    def read_transaction(self) -> Iterator[sqlite3.Connection]:
+        """在当前线程的读连接上开启读事务：块内多条语句看到同一个一致快照，退出时回滚。"""
+
+        conn = self._reader_conn()
+        if conn.in_transaction:
+            # 外层已开启读事务：直接复用，由外层结束。
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """独占写连接并开启 `BEGIN IMMEDIATE` 事务；正常退出提交，异常回滚。"""
+
+        with self._writer_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("connection pool is closed")
+            if self._writer_conn is None:
+                self._writer_conn = self._open()
+            conn = self._writer_conn
+            if conn.in_transaction:
+                # 同一线程内的嵌套 writer()：复用外层事务，由外层负责提交。
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self) -> None:
+        with self._writer_lock:
+            self._closed = True
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+        with self._registry_lock:
+            for _thread_ref, conn in self._readers:
+                conn.close()
+            self._readers = []
+        self._local = threading.local()
@@ -1,19 +1,168 @@
 from __future__ import annotations
 
-from contextlib import closing
 import json
 import os
 import sqlite3
-from dataclasses import dataclass
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from functools import cached_property
 from typing import Any
 
+from .json_patch import JsonPatch, apply_patch, escape_pointer_token, make_patch
+from .merkle_index import ToolMerkleIndex, merkle_index_from_json, merkle_index_to_json
+from .snapshot_metadata import (
+    SnapshotAnalysis,
+    SnapshotMetadata,
+    analyze_tool_snapshot,
+    analyze_tools_data,
+    build_snapshot_metadata,
+    tool_stats_from_json,
+    tool_stats_summary,
+    tool_stats_to_json,
+)
+from .snapshot_cache import DEFAULT_SNAPSHOT_CACHE_BYTES, SnapshotCache, SnapshotCacheStats
+from .sqlite_pool import SqliteConnectionPool
+from .storage_codec import DEFAULT_DICTIONARY_BYTES, StorageCodec, train_dictionary
+from .sync_diff import hash_tool_snapshot
+from .user_locks import UserLockManager
+
+# 历史快照默认每 16 个 revision 保留一个全量关键帧，其余存反向增量。
+DEFAULT_HISTORY_KEYFRAME_INTERVAL = 16
+# 幂等键的结果保留 24 小时，覆盖移动端的重试窗口。
+DEFAULT_IDEMPOTENCY_TTL_MS = 24 * 60 * 60 * 1000
+# 批量 IN 查询每条语句的参数个数上限（低于旧版 SQLite 的 999）
+_MAX_SQL_VARIABLES = 500
+
+# 同步记录 diff 的计算状态：pending 表示记录已提交、diff 尚在后台计算。
+DIFF_STATUS_PENDING = "pending"
+DIFF_STATUS_READY = "ready"
+DIFF_STATUS_FAILED = "failed"
+
+# 提交后再计算的 diff：(记录 id, 计算函数)
+DeferredDiffHandler = Callable[[int, Callable[[], dict[str, Any]]], None]
+# 提交后通知新 revision：(user_id, revision)
+RevisionListener = Callable[[str, int], None]
+
+_DASHBOARD_ENTRY_SELECT = """
+SELECT
+  u.user_id,
+  u.display_name,
+  u.notes,
+  u.is_enabled,
+  u.created_at_ms,
+  u.updated_at_ms,
+  u.last_seen_at_ms,
+  s.user_id,
+  s.server_revision,
+  s.updated_at_ms,
+  s.tool_count,
+  s.total_item_count,
+  s.tool_ids_json,
+  s.tool_summaries_json
+FROM sync_users u
+LEFT JOIN sync_user_summaries s ON s.user_id = u.user_id
+"""
+
+_SNAPSHOT_COLUMNS = """
+  user_id,
+  server_revision,
+  updated_at_ms,
+  tools_data_json,
+  tools_manifest_json,
+  is_empty,
+  max_updated_at_ms,
+  tool_stats_json
+"""
+
 
 @dataclass(frozen=True)
 class UserSnapshot:
+    """用户快照；`tools_data` 在首次访问时才解析 JSON。
+
+    只关心 revision/是否为空/摘要的调用方应读取 `metadata`：最新快照的元数据在写入时
+    已落库，读取时无需解析正文；历史快照等缺少预计算值的场景才回退为现算。
+    """
+
     user_id: str
     server_revision: int
     updated_at_ms: int
-    tools_data: dict[str, Any]
+    # 紧凑 JSON 文本，响应时可直接拼接输出，无需再序列化。
+    tools_data_json: str = field(default="{}", repr=False)
+    stored_metadata: SnapshotMetadata | None = field(default=None, repr=False, compare=False)
+
+    @cached_property
+    def tools_data(self) -> dict[str, Any]:
+        return json.loads(self.tools_data_json)
+
+    @cached_property
+    def metadata(self) -> SnapshotMetadata:
+        if self.stored_metadata is not None:
+            return self.stored_metadata
+        return build_snapshot_metadata(self.tools_data)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.metadata.is_empty
+
+
+@dataclass(frozen=True)
+class UserSnapshotSummary:
+    """`sync_user_summaries` 中随写入维护的 Dashboard 摘要；列表字段保留 JSON 文本以便直接拼接。"""
+
+    user_id: str
+    server_revision: int
+    updated_at_ms: int
+    tool_count: int
+    total_item_count: int
+    tool_ids_json: str
+    tool_summaries_json: str
+
+
+@dataclass(frozen=True)
+class ToolSyncState:
+    """单个工具的同步状态。
+
+    `revision` 为该工具最近一次发生变化时的 server_revision，因此客户端只需一个全局
+    `last_server_revision` 就能判断每个工具在它上次同步后是否被别的设备改过。
+    `content_hash` 为空表示工具已在服务端被删除（墓碑）。
+    """
+
+    tool_id: str
+    revision: int
+    updated_at_ms: int
+    content_hash: str | None
+    is_empty: bool
+
+
+@dataclass(frozen=True)
+class DashboardUserCursor:
+    """用户目录分页游标：上一页最后一行在 `idx_sync_users_last_seen` 上的排序键。"""
+
+    last_seen_at_ms: int | None
+    updated_at_ms: int
+    user_id: str
+
+
+@dataclass(frozen=True)
+class DashboardUserVersion:
+    """`GET /dashboard/users/{user_id}` 响应所依赖的版本信息，读取时不触碰快照正文。"""
+
+    server_revision: int
+    profile: DashboardUser | None
+    latest_record_id: int
+    # 最近 `recent_records` 条记录中 diff 仍在后台计算的条数；回填完成后版本随之变化
+    pending_diffs: int
+
+
+@dataclass(frozen=True)
+class IdempotentResponse:
+    """幂等键对应的已提交响应；`tools_data` 不落库，重放时按 `tools_data_revision` 取历史快照。"""
+
+    fingerprint: str
+    response_json: str
+    tools_data_revision: int | None
 
 
 @dataclass(frozen=True)
@@ -30,6 +179,7 @@ class SyncRecord:
     server_revision_before: int
     server_revision_after: int
     diff: dict[str, Any]
+    diff_status: str = DIFF_STATUS_READY
 
 
 @dataclass(frozen=True)
@@ -43,11 +193,250 @@ class DashboardUser:
     last_seen_at_ms: int | None
 
 
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class RevisionConflictError(Exception):
+    """乐观并发冲突：提交时快照 revision 已不是决策时读到的版本。
+
+    写入不会发生；调用方应在新的工作单元里重新读取、决策后重试。
+    """
+
+    def __init__(self, *, user_id: str, expected_revision: int, actual_revision: int) -> None:
+        super().__init__(f"用户 {user_id} 的快照已从 revision {expected_revision} 变为 {actual_revision}")
+        self.user_id = user_id
+        self.expected_revision = expected_revision
+        self.actual_revision = actual_revision
+
+
+class SyncUnitOfWork:
+    """一次同步的读-决策-写单元（乐观并发）。
+
+    由 `SqliteSnapshotStore.unit_of_work()` 创建：
+    - 读取与决策阶段只用本线程读连接上的一个读事务，不占用全局写连接，不同用户可以并行；
+    - 第一次写入时才开启 `BEGIN IMMEDIATE`，并校验本单元读到的快照 revision（以及未命中的幂等键）
+      仍是最新的，否则抛出 `RevisionConflictError`；
+    - 退出上下文时统一提交（一次落盘），任何异常都会整体回滚，
+      不会留下“有新 revision 却没有同步记录”的中间状态。
+    """
+
+    def __init__(self, store: SqliteSnapshotStore, stack: ExitStack) -> None:
+        self._store = store
+        self._stack = stack
+        self._read_stack = ExitStack()
+        self._read_conn = self._read_stack.enter_context(store._pool.read_transaction())
+        self._writer_conn: sqlite3.Connection | None = None
+        # 决策依据：user_id -> 读到的 revision（无快照为 0）；以及读时尚不存在的幂等键
+        self._observed_revisions: dict[str, int] = {}
+        self._observed_missing_keys: dict[tuple[str, str], int] = {}
+        # last_seen 只是记账，推迟到写事务里执行，不让只读的决策阶段占用写连接
+        self._pending_touches: dict[str, int] = {}
+        # 本事务内写过的用户读到的是未提交数据，不能经过/写入进程缓存。
+        self._written_user_ids: set[str] = set()
+        # 提交成功后才交给后台计算的同步记录 diff；回滚或冲突重试时随本单元一起丢弃
+        self._deferred_diffs: list[tuple[int, Callable[[], dict[str, Any]]]] = []
+        # 本单元写入的新 revision，提交成功后才通知等待者
+        self._saved_revisions: dict[str, int] = {}
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._read_conn if self._writer_conn is None else self._writer_conn
+
+    def _write_conn(self) -> sqlite3.Connection:
+        if self._writer_conn is not None:
+            return self._writer_conn
+        self._read_stack.close()
+        conn = self._stack.enter_context(self._store._pool.writer())
+        self._writer_conn = conn
+        for user_id, expected_revision in self._observed_revisions.items():
+            actual_revision = self._store._fetch_snapshot_revision(conn, user_id)
+            if actual_revision != expected_revision:
+                raise RevisionConflictError(
+                    user_id=user_id,
+                    expected_revision=expected_revision,
+                    actual_revision=actual_revision,
+                )
+        for (user_id, key), now_ms in self._observed_missing_keys.items():
+            if self._store._fetch_idempotent_response(conn, user_id=user_id, key=key, now_ms=now_ms) is not None:
+                raise RevisionConflictError(
+                    user_id=user_id,
+                    expected_revision=self._observed_revisions.get(user_id, 0),
+                    actual_revision=self._store._fetch_snapshot_revision(conn, user_id),
+                )
+        for user_id, now_ms in self._pending_touches.items():
+            self._store._touch_user(conn, user_id=user_id, now_ms=now_ms)
+        self._pending_touches.clear()
+        return conn
+
+    def _flush(self) -> None:
+        if self._pending_touches:
+            self._write_conn()
+
+    def _close(self) -> None:
+        self._read_stack.close()
+
+    def touch_user(self, *, user_id: str, now_ms: int) -> None:
+        """记录用户最近活跃时间，随本单元的写事务一起提交。"""
+
+        if self._writer_conn is not None:
+            self._store._touch_user(self._writer_conn, user_id=user_id, now_ms=now_ms)
+        else:
+            self._pending_touches[user_id] = max(now_ms, self._pending_touches.get(user_id, now_ms))
+
+    def get_user_profile(self, user_id: str) -> DashboardUser | None:
+        return self._store._fetch_user_profile(self._conn, user_id)
+
+    def get_snapshot(self, user_id: str) -> UserSnapshot | None:
+        snapshot = self._store._fetch_snapshot(
+            self._conn,
+            user_id,
+            use_cache=user_id not in self._written_user_ids,
+        )
+        if self._writer_conn is None:
+            self._observed_revisions.setdefault(user_id, 0 if snapshot is None else snapshot.server_revision)
+        return snapshot
+
+    def get_snapshot_by_revision(self, user_id: str, revision: int) -> UserSnapshot | None:
+        return self._store._fetch_snapshot_by_revision(self._conn, user_id, revision)
+
+    def get_tool_json(self, snapshot: UserSnapshot, tool_ids: Iterable[str]) -> dict[str, str]:
+        return self._store._load_tool_json(self._conn, snapshot, tool_ids)
+
+    def get_tool_states(self, snapshot: UserSnapshot | None) -> dict[str, ToolSyncState]:
+        return self._store._fetch_tool_states(self._conn, snapshot)
+
+    def get_merkle_indexes(self, snapshot: UserSnapshot | None) -> dict[str, ToolMerkleIndex]:
+        return {} if snapshot is None else self._store._load_merkle_indexes(self._conn, snapshot)
+
+    def save_client_snapshot(
+        self,
+        *,
+        user_id: str,
+        tools_data: dict[str, Any],
+        updated_at_ms: int,
+        server_time_ms: int,
+        client_time_ms: int | None,
+        expected_revision: int | None = None,
+        analysis: SnapshotAnalysis | None = None,
+    ) -> int:
+        """写入新 revision；`expected_revision` 缺省为本单元读到的 revision（未读过则不校验）。
+
+        `analysis` 为调用方决策时已算好的 `analyze_tools_data(tools_data)`，传入后不再重新遍历与序列化。
+        """
+
+        if expected_revision is None:
+            expected_revision = self._observed_revisions.get(user_id)
+        conn = self._write_conn()
+        self._written_user_ids.add(user_id)
+        revision = self._store._save_client_snapshot(
+            conn,
+            user_id=user_id,
+            tools_data=tools_data,
+            updated_at_ms=updated_at_ms,
+            server_time_ms=server_time_ms,
+            client_time_ms=client_time_ms,
+            expected_revision=expected_revision,
+            analysis=analysis,
+        )
+        self._saved_revisions[user_id] = revision
+        return revision
+
+    def get_idempotent_response(self, *, user_id: str, key: str, now_ms: int) -> IdempotentResponse | None:
+        cached = self._store._fetch_idempotent_response(self._conn, user_id=user_id, key=key, now_ms=now_ms)
+        if cached is None and self._writer_conn is None:
+            self._observed_missing_keys[(user_id, key)] = now_ms
+        return cached
+
+    def save_idempotent_response(
+        self,
+        *,
+        user_id: str,
+        key: str,
+        fingerprint: str,
+        response_json: str,
+        tools_data_revision: int | None,
+        now_ms: int,
+    ) -> None:
+        self._store._save_idempotent_response(
+            self._write_conn(),
+            user_id=user_id,
+            key=key,
+            fingerprint=fingerprint,
+            response_json=response_json,
+            tools_data_revision=tools_data_revision,
+            now_ms=now_ms,
+        )
+
+    def add_sync_record(
+        self,
+        *,
+        user_id: str,
+        protocol_version: int,
+        decision: str,
+        server_time_ms: int,
+        client_time_ms: int | None,
+        client_updated_at_ms: int,
+        server_updated_at_ms_before: int,
+        server_updated_at_ms_after: int,
+        server_revision_before: int,
+        server_revision_after: int,
+        diff: dict[str, Any] | None = None,
+        compute_diff: Callable[[], dict[str, Any]] | None = None,
+    ) -> int:
+        """写入同步记录。
+
+        给出 `compute_diff` 时记录以 pending 状态提交（`diff` 作为占位内容），
+        提交成功后再计算 diff 并回填，不占用请求的写事务与响应时间。
+        """
+
+        record_id = self._store._insert_sync_record(
+            self._write_conn(),
+            user_id=user_id,
+            protocol_version=protocol_version,
+            decision=decision,
+            server_time_ms=server_time_ms,
+            client_time_ms=client_time_ms,
+            client_updated_at_ms=client_updated_at_ms,
+            server_updated_at_ms_before=server_updated_at_ms_before,
+            server_updated_at_ms_after=server_updated_at_ms_after,
+            server_revision_before=server_revision_before,
+            server_revision_after=server_revision_after,
+            diff=diff or {},
+            diff_status=DIFF_STATUS_READY if compute_diff is None else DIFF_STATUS_PENDING,
+        )
+        if compute_diff is not None:
+            self._deferred_diffs.append((record_id, compute_diff))
+        return record_id
+
+
 class SqliteSnapshotStore:
-    def __init__(self, *, db_path: str) -> None:
+    def __init__(
+        self,
+        *,
+        db_path: str,
+        history_keyframe_interval: int = DEFAULT_HISTORY_KEYFRAME_INTERVAL,
+        compression: str | None = None,
+        snapshot_cache_bytes: int = DEFAULT_SNAPSHOT_CACHE_BYTES,
+        idempotency_ttl_ms: int = DEFAULT_IDEMPOTENCY_TTL_MS,
+    ) -> None:
         self._db_path = db_path
+        self._idempotency_ttl_ms = max(0, int(idempotency_ttl_ms))
+        self._snapshot_cache = SnapshotCache(max_bytes=snapshot_cache_bytes)
+        self._history_keyframe_interval = max(1, int(history_keyframe_interval))
         self._ensure_parent_dir()
+        self._pool = SqliteConnectionPool(db_path=db_path)
+        self._user_locks = UserLockManager()
+        self._deferred_diff_handler: DeferredDiffHandler | None = None
+        self._revision_listener: RevisionListener | None = None
         self._init_db()
+        self._codec = StorageCodec(
+            algorithm=compression,
+            dictionary_loader=self._load_codec_dictionary,
+            active_dictionary_id=self._latest_codec_dictionary_id(compression),
+        )
+        self._backfill_user_profiles()
+        self._backfill_user_summaries()
 
     @property
     def db_path(self) -> str:
@@ -58,11 +447,60 @@ class SqliteSnapshotStore:
         if parent and not os.path.exists(parent):
             os.makedirs(parent, exist_ok=True)
 
-    def _connect(self) -> sqlite3.Connection:
-        return sqlite3.connect(self._db_path, timeout=30)
+    def close(self) -> None:
+        self._pool.close()
+        self._snapshot_cache.clear()
+
+    def snapshot_cache_stats(self) -> SnapshotCacheStats:
+        return self._snapshot_cache.stats()
+
+    @contextmanager
+    def unit_of_work(self, user_id: str | None = None) -> Iterator[SyncUnitOfWork]:
+        """开启一个同步工作单元；给出 `user_id` 时先取得该用户的进程内锁，同一用户的工作单元串行执行。"""
+
+        with self._user_locks.hold(user_id) if user_id is not None else nullcontext(), ExitStack() as stack:
+            uow = SyncUnitOfWork(self, stack)
+            try:
+                yield uow
+                uow._flush()
+            finally:
+                uow._close()
+        # 写事务已提交，记录 id 与新 revision 才对其它连接可见
+        for user_id, revision in uow._saved_revisions.items():
+            self._notify_revision(user_id, revision)
+        for record_id, compute_diff in uow._deferred_diffs:
+            if self._deferred_diff_handler is None:
+                self.run_deferred_diff(record_id, compute_diff)
+            else:
+                self._deferred_diff_handler(record_id, compute_diff)
+
+    def set_deferred_diff_handler(self, handler: DeferredDiffHandler | None) -> None:
+        """设置提交后 diff 的调度方式（如后台线程池）；未设置时在提交后同步计算。"""
+
+        self._deferred_diff_handler = handler
+
+    def set_revision_listener(self, listener: RevisionListener | None) -> None:
+        """设置快照写入提交后的通知（如长轮询的 `RevisionWatcher.publish`）；只覆盖本进程内的写入。"""
+
+        self._revision_listener = listener
+
+    def _notify_revision(self, user_id: str, revision: int) -> None:
+        if self._revision_listener is not None:
+            self._revision_listener(user_id, revision)
+
+    def run_deferred_diff(self, record_id: int, compute_diff: Callable[[], dict[str, Any]]) -> None:
+        """计算并回填 pending 记录的 diff；计算失败时记为 failed 并保留错误类型。"""
+
+        try:
+            diff = compute_diff()
+            status = DIFF_STATUS_READY
+        except Exception as exc:
+            diff = {"error": type(exc).__name__, "message": str(exc)}
+            status = DIFF_STATUS_FAILED
+        self.complete_sync_record_diff(record_id, diff=diff, status=status)
 
     def _init_db(self) -> None:
-        with closing(self._connect()) as conn:
+        with self._pool.writer() as conn:
             conn.execute(
                 """
 CREATE TABLE IF NOT EXISTS sync_snapshots (
@@ -71,10 +509,26 @@ CREATE TABLE IF NOT EXISTS sync_snapshots (
   updated_at_ms INTEGER NOT NULL,
   tools_data_json TEXT NOT NULL,
   updated_server_time_ms INTEGER NOT NULL,
-  last_client_time_ms INTEGER
+  last_client_time_ms INTEGER,
+  tools_manifest_json TEXT,
+  is_empty INTEGER,
+  max_updated_at_ms INTEGER,
+  tool_stats_json TEXT
 );
 """,
             )
+            # is_empty / max_updated_at_ms / tool_stats_json 为写入时预计算的元数据，
+            # 旧库升级后为 NULL，读取时回退为解析正文现算。
+            self._ensure_columns(
+                conn,
+                "sync_snapshots",
+                {
+                    "tools_manifest_json": "TEXT",
+                    "is_empty": "INTEGER",
+                    "max_updated_at_ms": "INTEGER",
+                    "tool_stats_json": "TEXT",
+                },
+            )
             conn.execute(
                 """
 CREATE TABLE IF NOT EXISTS sync_snapshot_history (
@@ -84,8 +538,62 @@ CREATE TABLE IF NOT EXISTS sync_snapshot_history (
   tools_data_json TEXT NOT NULL,
   updated_server_time_ms INTEGER NOT NULL,
   last_client_time_ms INTEGER,
+  payload_kind TEXT NOT NULL DEFAULT 'full',
+  base_revision INTEGER,
+  delta_json TEXT,
+  tools_manifest_json TEXT,
   PRIMARY KEY (user_id, server_revision)
 );
+""",
+            )
+            self._ensure_columns(
+                conn,
+                "sync_snapshot_history",
+                {
+                    "payload_kind": "TEXT NOT NULL DEFAULT 'full'",
+                    "base_revision": "INTEGER",
+                    "delta_json": "TEXT",
+                    "tools_manifest_json": "TEXT",
+                    "delta_codec": "TEXT",
+                },
+            )
+            # 按工具内容寻址的 JSON 块：hash 与 sync_diff 的工具 hash 同口径；
+            # ref_count 统计 sync_snapshots 与全量历史行中的引用数，归零即删除。
+            # merkle_json 为写入时算好的分段/行 hash（见 merkle_index），旧数据为 NULL。
+            conn.execute(
+                """
+CREATE TABLE IF NOT EXISTS sync_tool_blobs (
+  hash TEXT PRIMARY KEY,
+  body TEXT NOT NULL,
+  ref_count INTEGER NOT NULL,
+  codec TEXT
+);
+""",
+            )
+            self._ensure_columns(conn, "sync_tool_blobs", {"codec": "TEXT", "merkle_json": "TEXT"})
+            conn.execute(
+                """
+CREATE TABLE IF NOT EXISTS sync_tool_states (
+  user_id TEXT NOT NULL,
+  tool_id TEXT NOT NULL,
+  revision INTEGER NOT NULL,
+  updated_at_ms INTEGER NOT NULL,
+  content_hash TEXT,
+  is_empty INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, tool_id)
+);
+""",
+            )
+            # 压缩字典：行上的编码标签引用 dict_id，字典只增不改，保证旧行可解码。
+            conn.execute(
+                """
+CREATE TABLE IF NOT EXISTS sync_codec_dictionaries (
+  dict_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  algorithm TEXT NOT NULL,
+  body BLOB NOT NULL,
+  sample_count INTEGER NOT NULL,
+  created_at_ms INTEGER NOT NULL
+);
 """,
             )
             conn.execute(
@@ -102,7 +610,40 @@ CREATE TABLE IF NOT EXISTS sync_records (
   server_updated_at_ms_after INTEGER NOT NULL,
   server_revision_before INTEGER NOT NULL,
   server_revision_after INTEGER NOT NULL,
-  diff_json TEXT NOT NULL
+  diff_json TEXT NOT NULL,
+  diff_codec TEXT,
+  diff_status TEXT NOT NULL DEFAULT 'ready',
+  diff_claimed_at_ms INTEGER
+);
+""",
+            )
+            self._ensure_columns(
+                conn,
+                "sync_records",
+                {
+                    "diff_codec": "TEXT",
+                    "diff_status": "TEXT NOT NULL DEFAULT 'ready'",
+                    # pending 记录最近一次被认领计算的时间；写入记录的进程即初始认领方
+                    "diff_claimed_at_ms": "INTEGER",
+                },
+            )
+            conn.execute(
+                """
+CREATE INDEX IF NOT EXISTS idx_sync_records_pending_diff
+ON sync_records (id) WHERE diff_status = 'pending';
+""",
+            )
+            # Dashboard 用户列表的物化摘要，与 sync_snapshots 在同一事务中更新。
+            conn.execute(
+                """
+CREATE TABLE IF NOT EXISTS sync_user_summaries (
+  user_id TEXT PRIMARY KEY,
+  server_revision INTEGER NOT NULL,
+  updated_at_ms INTEGER NOT NULL,
+  tool_count INTEGER NOT NULL,
+  total_item_count INTEGER NOT NULL,
+  tool_ids_json TEXT NOT NULL,
+  tool_summaries_json TEXT NOT NULL
 );
 """,
             )
@@ -137,73 +678,209 @@ CREATE INDEX IF NOT EXISTS idx_sync_users_last_seen
 ON sync_users (last_seen_at_ms DESC, updated_at_ms DESC, user_id ASC);
 """,
             )
-            conn.commit()
-
-    def get_snapshot(self, user_id: str) -> UserSnapshot | None:
-        with closing(self._connect()) as conn:
-            row = conn.execute(
+            conn.execute(
                 """
-SELECT user_id, server_revision, updated_at_ms, tools_data_json
-FROM sync_snapshots
-WHERE user_id = ?
+CREATE TABLE IF NOT EXISTS sync_idempotency_keys (
+  user_id TEXT NOT NULL,
+  idempotency_key TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  response_json TEXT NOT NULL,
+  tools_data_revision INTEGER,
+  created_at_ms INTEGER NOT NULL,
+  PRIMARY KEY (user_id, idempotency_key)
+);
 """,
-                (user_id,),
-            ).fetchone()
-            if row is None:
-                return None
-            return self._row_to_snapshot(row)
+            )
+            conn.execute(
+                """
+CREATE INDEX IF NOT EXISTS idx_sync_idempotency_keys_created
+ON sync_idempotency_keys (created_at_ms);
+""",
+            )
+
+    @staticmethod
+    def _ensure_columns(
+        conn: sqlite3.Connection,
+        table: str,
+        columns: dict[str, str],
+    ) -> None:
+        # 旧库升级：只追加缺失列，不改动已有数据。
+        existing = {str(row[1]) for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+    def get_snapshot(self, user_id: str) -> UserSnapshot | None:
+        # 快照行、清单与内容块须出自同一读快照：并发写入会把旧清单引用的块删掉
+        with self._pool.read_transaction() as conn:
+            return self._fetch_snapshot(conn, user_id)
 
     def list_snapshots(self) -> list[UserSnapshot]:
-        with closing(self._connect()) as conn:
+        with self._pool.read_transaction() as conn:
             rows = conn.execute(
-                """
-SELECT user_id, server_revision, updated_at_ms, tools_data_json
+                f"""
+SELECT {_SNAPSHOT_COLUMNS}
 FROM sync_snapshots
 ORDER BY updated_at_ms DESC, user_id ASC
 """,
             ).fetchall()
-        return [self._row_to_snapshot(row) for row in rows]
+            return [self._row_to_snapshot(conn, row) for row in rows]
 
     def get_snapshot_by_revision(self, user_id: str, revision: int) -> UserSnapshot | None:
-        with closing(self._connect()) as conn:
+        """读取历史版本；增量行会从最近的更高全量行起逐个回放反向补丁。"""
+
+        with self._pool.read_transaction() as conn:
+            return self._fetch_snapshot_by_revision(conn, user_id, revision)
+
+    def _fetch_snapshot_by_revision(
+        self,
+        conn: sqlite3.Connection,
+        user_id: str,
+        revision: int,
+    ) -> UserSnapshot | None:
+        target_revision = int(revision)
+        rows = conn.execute(
+            """
+SELECT
+  server_revision,
+  updated_at_ms,
+  tools_data_json,
+  payload_kind,
+  delta_json,
+  tools_manifest_json,
+  delta_codec
+FROM sync_snapshot_history
+WHERE user_id = ?
+  AND server_revision >= ?
+  AND server_revision <= (
+    SELECT MIN(server_revision)
+    FROM sync_snapshot_history
+    WHERE user_id = ? AND server_revision >= ? AND payload_kind = 'full'
+  )
+ORDER BY server_revision DESC
+""",
+            (user_id, target_revision, user_id, target_revision),
+        ).fetchall()
+        if not rows:
+            current = self._fetch_snapshot(conn, user_id, use_cache=False)
+            if current is not None and current.server_revision == target_revision:
+                return current
+            return None
+        if int(rows[-1][0]) != target_revision:
+            return None
+        tools_data_json = self._load_tools_data_json(
+            conn,
+            manifest_json=rows[0][5],
+            tools_data_json=rows[0][2],
+        )
+
+        tools_data: dict[str, Any] = json.loads(tools_data_json)
+        if len(rows) > 1:
+            for row in rows[1:]:
+                delta_text = self._codec.decode(row[6], row[4]) if row[4] else ""
+                tools_data = apply_patch(tools_data, json.loads(delta_text) if delta_text else [])
+            tools_data_json = json.dumps(tools_data, ensure_ascii=False, separators=(",", ":"))
+        return UserSnapshot(
+            user_id=user_id,
+            server_revision=target_revision,
+            updated_at_ms=int(rows[-1][1]),
+            tools_data_json=tools_data_json,
+        )
+
+    def get_snapshot_revision(self, user_id: str) -> int:
+        """当前快照 revision（主键点查，不读取正文）；没有快照时为 0。"""
+
+        with self._pool.reader() as conn:
+            return self._fetch_snapshot_revision(conn, user_id)
+
+    def get_snapshot_revisions(self, user_ids: Sequence[str]) -> dict[str, int]:
+        """批量读取当前快照 revision；没有快照的用户不在结果中。"""
+
+        result: dict[str, int] = {}
+        with self._pool.reader() as conn:
+            for start in range(0, len(user_ids), _MAX_SQL_VARIABLES):
+                chunk = list(user_ids[start : start + _MAX_SQL_VARIABLES])
+                placeholders = ",".join("?" for _ in chunk)
+                rows = conn.execute(
+                    f"SELECT user_id, server_revision FROM sync_snapshots WHERE user_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                result.update((str(row[0]), int(row[1])) for row in rows)
+        return result
+
+    def has_snapshot_revision(self, user_id: str, revision: int) -> bool:
+        """历史版本是否存在（只走索引，不读取正文）。"""
+
+        with self._pool.reader() as conn:
             row = conn.execute(
                 """
-SELECT user_id, server_revision, updated_at_ms, tools_data_json
-FROM sync_snapshot_history
-WHERE user_id = ? AND server_revision = ?
+SELECT
+  EXISTS(SELECT 1 FROM sync_snapshot_history WHERE user_id = ? AND server_revision = ?)
+  OR EXISTS(SELECT 1 FROM sync_snapshots WHERE user_id = ? AND server_revision = ?)
 """,
-                (user_id, int(revision)),
+                (user_id, int(revision), user_id, int(revision)),
             ).fetchone()
-            if row is None:
-                current = self.get_snapshot(user_id)
-                if current is not None and current.server_revision == int(revision):
-                    return current
-                return None
-            return self._row_to_snapshot(row)
+        return bool(row[0])
 
-    def get_user_profile(self, user_id: str) -> DashboardUser | None:
-        with closing(self._connect()) as conn:
+    def get_dashboard_user_version(self, user_id: str, *, recent_records: int) -> DashboardUserVersion | None:
+        """用户不存在（既无资料也无快照）时返回 None。"""
+
+        with self._pool.read_transaction() as conn:
+            profile = self._fetch_user_profile(conn, user_id)
             row = conn.execute(
                 """
 SELECT
-  user_id,
-  display_name,
-  notes,
-  is_enabled,
-  created_at_ms,
-  updated_at_ms,
-  last_seen_at_ms
-FROM sync_users
-WHERE user_id = ?
+  (SELECT server_revision FROM sync_snapshots WHERE user_id = ?),
+  (SELECT MAX(id) FROM sync_records WHERE user_id = ?),
+  (
+    SELECT COUNT(*)
+    FROM (SELECT diff_status FROM sync_records WHERE user_id = ? ORDER BY id DESC LIMIT ?)
+    WHERE diff_status = 'pending'
+  )
 """,
-                (user_id,),
+                (user_id, user_id, user_id, int(recent_records)),
             ).fetchone()
-            if row is None:
-                return None
-            return self._row_to_dashboard_user(row)
+        if profile is None and row[0] is None:
+            return None
+        return DashboardUserVersion(
+            server_revision=int(row[0] or 0),
+            profile=profile,
+            latest_record_id=int(row[1] or 0),
+            pending_diffs=int(row[2] or 0),
+        )
+
+    def get_tool_version(self, user_id: str, tool_id: str) -> tuple[int, str | None] | None:
+        """返回当前快照的 (server_revision, 工具内容 hash)；没有快照时返回 None。
+
+        hash 取自 `sync_tool_states`，旧数据或工具不存在时为 None（revision 已足以区分内容）。
+        """
+
+        with self._pool.reader() as conn:
+            row = conn.execute(
+                """
+SELECT s.server_revision, t.content_hash
+FROM sync_snapshots AS s
+LEFT JOIN sync_tool_states AS t ON t.user_id = s.user_id AND t.tool_id = ?
+WHERE s.user_id = ?
+""",
+                (tool_id, user_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return int(row[0]), row[1]
+
+    def get_merkle_indexes(self, snapshot: UserSnapshot) -> dict[str, ToolMerkleIndex]:
+        """快照各工具写入时存下的 Merkle 索引；旧数据缺失的工具不在结果里。"""
+
+        with self._pool.read_transaction() as conn:
+            return self._load_merkle_indexes(conn, snapshot)
+
+    def get_user_profile(self, user_id: str) -> DashboardUser | None:
+        with self._pool.reader() as conn:
+            return self._fetch_user_profile(conn, user_id)
 
     def list_user_profiles(self) -> list[DashboardUser]:
-        with closing(self._connect()) as conn:
+        with self._pool.reader() as conn:
             rows = conn.execute(
                 """
 SELECT
@@ -220,37 +897,96 @@ ORDER BY COALESCE(last_seen_at_ms, 0) DESC, updated_at_ms DESC, user_id ASC
             ).fetchall()
         return [self._row_to_dashboard_user(row) for row in rows]
 
-    def touch_user(self, *, user_id: str, now_ms: int) -> DashboardUser:
-        with closing(self._connect()) as conn:
-            row = conn.execute(
-                "SELECT 1 FROM sync_users WHERE user_id = ?",
-                (user_id,),
-            ).fetchone()
-            if row is None:
-                conn.execute(
-                    """
-INSERT INTO sync_users (
-  user_id,
-  display_name,
-  notes,
-  is_enabled,
-  created_at_ms,
-  updated_at_ms,
-  last_seen_at_ms
-)
-VALUES (?, '', '', 1, ?, ?, ?)
-""",
-                    (user_id, int(now_ms), int(now_ms), int(now_ms)),
-                )
+    def list_dashboard_entries(
+        self,
+        *,
+        limit: int,
+        after: DashboardUserCursor | None = None,
+        is_enabled: bool | None = None,
+        has_snapshot: bool | None = None,
+        last_seen_from_ms: int | None = None,
+        last_seen_to_ms: int | None = None,
+        prefix: str | None = None,
+    ) -> list[tuple[DashboardUser, UserSnapshotSummary | None]]:
+        """按“最近活跃”顺序分页读取用户资料与物化摘要。
+
+        排序与 `idx_sync_users_last_seen` 一致（last_seen 为空的排在最后），
+        `after` 为上一页最后一行的排序键，耗时只与页大小相关。
+        """
+
+        effective_limit = max(1, min(int(limit), 200))
+        filters: list[str] = []
+        filter_args: list[Any] = []
+        if is_enabled is not None:
+            filters.append("u.is_enabled = ?")
+            filter_args.append(1 if is_enabled else 0)
+        if has_snapshot is not None:
+            filters.append("s.user_id IS NOT NULL" if has_snapshot else "s.user_id IS NULL")
+        if last_seen_from_ms is not None:
+            filters.append("u.last_seen_at_ms >= ?")
+            filter_args.append(int(last_seen_from_ms))
+        if last_seen_to_ms is not None:
+            filters.append("u.last_seen_at_ms <= ?")
+            filter_args.append(int(last_seen_to_ms))
+        if prefix:
+            pattern = _escape_like(prefix) + "%"
+            filters.append("(u.user_id LIKE ? ESCAPE '\\' OR u.display_name LIKE ? ESCAPE '\\')")
+            filter_args.extend([pattern, pattern])
+
+        # 两段分别查询：last_seen 非空段与为空段各自按索引顺序定位游标，
+        # 每段的游标条件都以前导列的范围开头，SQLite 可直接在索引上 seek，而不是扫描到游标位置。
+        segments: list[tuple[str, list[Any], str]] = []
+        if after is None or after.last_seen_at_ms is not None:
+            if after is None:
+                seek, seek_args = "u.last_seen_at_ms IS NOT NULL", []
             else:
-                conn.execute(
-                    "UPDATE sync_users SET last_seen_at_ms = ? WHERE user_id = ?",
-                    (int(now_ms), user_id),
+                seek = """u.last_seen_at_ms <= ?
+  AND (
+    u.last_seen_at_ms < ?
+    OR u.updated_at_ms < ?
+    OR (u.updated_at_ms = ? AND u.user_id > ?)
+  )"""
+                seek_args = [
+                    after.last_seen_at_ms,
+                    after.last_seen_at_ms,
+                    after.updated_at_ms,
+                    after.updated_at_ms,
+                    after.user_id,
+                ]
+            segments.append((seek, seek_args, "u.last_seen_at_ms DESC, u.updated_at_ms DESC, u.user_id ASC"))
+        if last_seen_from_ms is None and last_seen_to_ms is None:
+            if after is None or after.last_seen_at_ms is not None:
+                seek, seek_args = "u.last_seen_at_ms IS NULL", []
+            else:
+                seek = """u.last_seen_at_ms IS NULL
+  AND u.updated_at_ms <= ?
+  AND (u.updated_at_ms < ? OR u.user_id > ?)"""
+                seek_args = [after.updated_at_ms, after.updated_at_ms, after.user_id]
+            segments.append((seek, seek_args, "u.updated_at_ms DESC, u.user_id ASC"))
+
+        rows: list[Any] = []
+        with self._pool.read_transaction() as conn:
+            for seek, seek_args, order_by in segments:
+                remaining = effective_limit - len(rows)
+                if remaining <= 0:
+                    break
+                sql = (
+                    f"{_DASHBOARD_ENTRY_SELECT}WHERE "
+                    + "\n  AND ".join([seek, *filters])
+                    + f"\nORDER BY {order_by}\nLIMIT ?"
                 )
-            conn.commit()
-        profile = self.get_user_profile(user_id)
-        assert profile is not None
-        return profile
+                rows.extend(conn.execute(sql, (*seek_args, *filter_args, remaining)).fetchall())
+        return [
+            (
+                self._row_to_dashboard_user(row[0:7]),
+                None if row[7] is None else self._row_to_user_summary(row[7:14]),
+            )
+            for row in rows
+        ]
+
+    def touch_user(self, *, user_id: str, now_ms: int) -> DashboardUser:
+        with self._pool.writer() as conn:
+            return self._touch_user(conn, user_id=user_id, now_ms=now_ms)
 
     def upsert_user_profile(
         self,
@@ -261,50 +997,15 @@ VALUES (?, '', '', 1, ?, ?, ?)
         is_enabled: bool,
         now_ms: int,
     ) -> DashboardUser:
-        existing = self.get_user_profile(user_id)
-        with closing(self._connect()) as conn:
-            if existing is None:
-                conn.execute(
-                    """
-INSERT INTO sync_users (
-  user_id,
-  display_name,
-  notes,
-  is_enabled,
-  created_at_ms,
-  updated_at_ms,
-  last_seen_at_ms
-)
-VALUES (?, ?, ?, ?, ?, ?, NULL)
-""",
-                    (
-                        user_id,
-                        display_name,
-                        notes,
-                        1 if is_enabled else 0,
-                        int(now_ms),
-                        int(now_ms),
-                    ),
-                )
-            else:
-                conn.execute(
-                    """
-UPDATE sync_users
-SET display_name = ?, notes = ?, is_enabled = ?, updated_at_ms = ?
-WHERE user_id = ?
-""",
-                    (
-                        display_name,
-                        notes,
-                        1 if is_enabled else 0,
-                        int(now_ms),
-                        user_id,
-                    ),
-                )
-            conn.commit()
-        profile = self.get_user_profile(user_id)
-        assert profile is not None
-        return profile
+        with self._pool.writer() as conn:
+            return self._upsert_user_profile(
+                conn,
+                user_id=user_id,
+                display_name=display_name,
+                notes=notes,
+                is_enabled=is_enabled,
+                now_ms=now_ms,
+            )
 
     def update_user_profile(
         self,
@@ -315,16 +1016,18 @@ WHERE user_id = ?
         is_enabled: bool | None,
         now_ms: int,
     ) -> DashboardUser | None:
-        existing = self.get_user_profile(user_id)
-        if existing is None:
-            return None
-        return self.upsert_user_profile(
-            user_id=user_id,
-            display_name=existing.display_name if display_name is None else display_name,
-            notes=existing.notes if notes is None else notes,
-            is_enabled=existing.is_enabled if is_enabled is None else is_enabled,
-            now_ms=now_ms,
-        )
+        with self._pool.writer() as conn:
+            existing = self._fetch_user_profile(conn, user_id)
+            if existing is None:
+                return None
+            return self._upsert_user_profile(
+                conn,
+                user_id=user_id,
+                display_name=existing.display_name if display_name is None else display_name,
+                notes=existing.notes if notes is None else notes,
+                is_enabled=existing.is_enabled if is_enabled is None else is_enabled,
+                now_ms=now_ms,
+            )
 
     def save_client_snapshot(
         self,
@@ -334,80 +1037,22 @@ WHERE user_id = ?
         updated_at_ms: int,
         server_time_ms: int,
         client_time_ms: int | None,
+        expected_revision: int | None = None,
     ) -> int:
-        tools_data_json = json.dumps(
-            tools_data,
-            ensure_ascii=False,
-            separators=(",", ":"),
-        )
-
-        with closing(self._connect()) as conn:
-            conn.execute("BEGIN IMMEDIATE")
+        """写入新 revision；给出 `expected_revision` 时当前 revision 不一致会抛出 `RevisionConflictError`。"""
 
-            row = conn.execute(
-                "SELECT server_revision FROM sync_snapshots WHERE user_id = ?",
-                (user_id,),
-            ).fetchone()
-            current_revision = int(row[0]) if row is not None else 0
-            new_revision = current_revision + 1
-
-            conn.execute(
-                """
-INSERT INTO sync_snapshot_history (
-  user_id,
-  server_revision,
-  updated_at_ms,
-  tools_data_json,
-  updated_server_time_ms,
-  last_client_time_ms
-)
-VALUES (?, ?, ?, ?, ?, ?)
-ON CONFLICT(user_id, server_revision) DO UPDATE SET
-  updated_at_ms=excluded.updated_at_ms,
-  tools_data_json=excluded.tools_data_json,
-  updated_server_time_ms=excluded.updated_server_time_ms,
-  last_client_time_ms=excluded.last_client_time_ms
-""",
-                (
-                    user_id,
-                    new_revision,
-                    int(updated_at_ms),
-                    tools_data_json,
-                    int(server_time_ms),
-                    None if client_time_ms is None else int(client_time_ms),
-                ),
+        with self._pool.writer() as conn:
+            revision = self._save_client_snapshot(
+                conn,
+                user_id=user_id,
+                tools_data=tools_data,
+                updated_at_ms=updated_at_ms,
+                server_time_ms=server_time_ms,
+                client_time_ms=client_time_ms,
+                expected_revision=expected_revision,
             )
-
-            conn.execute(
-                """
-INSERT INTO sync_snapshots (
-  user_id,
-  server_revision,
-  updated_at_ms,
-  tools_data_json,
-  updated_server_time_ms,
-  last_client_time_ms
-)
-VALUES (?, ?, ?, ?, ?, ?)
-ON CONFLICT(user_id) DO UPDATE SET
-  server_revision=excluded.server_revision,
-  updated_at_ms=excluded.updated_at_ms,
-  tools_data_json=excluded.tools_data_json,
-  updated_server_time_ms=excluded.updated_server_time_ms,
-  last_client_time_ms=excluded.last_client_time_ms
-""",
-                (
-                    user_id,
-                    new_revision,
-                    int(updated_at_ms),
-                    tools_data_json,
-                    int(server_time_ms),
-                    None if client_time_ms is None else int(client_time_ms),
-                ),
-            )
-            conn.commit()
-
-        return new_revision
+        self._notify_revision(user_id, revision)
+        return revision
 
     def add_sync_record(
         self,
@@ -424,46 +1069,21 @@ ON CONFLICT(user_id) DO UPDATE SET
         server_revision_after: int,
         diff: dict[str, Any],
     ) -> int:
-        diff_json = json.dumps(
-            diff,
-            ensure_ascii=False,
-            separators=(",", ":"),
-        )
-
-        with closing(self._connect()) as conn:
-            cur = conn.execute(
-                """
-INSERT INTO sync_records (
-  user_id,
-  protocol_version,
-  decision,
-  server_time_ms,
-  client_time_ms,
-  client_updated_at_ms,
-  server_updated_at_ms_before,
-  server_updated_at_ms_after,
-  server_revision_before,
-  server_revision_after,
-  diff_json
-)
-VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-""",
-                (
-                    user_id,
-                    int(protocol_version),
-                    decision,
-                    int(server_time_ms),
-                    None if client_time_ms is None else int(client_time_ms),
-                    int(client_updated_at_ms),
-                    int(server_updated_at_ms_before),
-                    int(server_updated_at_ms_after),
-                    int(server_revision_before),
-                    int(server_revision_after),
-                    diff_json,
-                ),
+        with self._pool.writer() as conn:
+            return self._insert_sync_record(
+                conn,
+                user_id=user_id,
+                protocol_version=protocol_version,
+                decision=decision,
+                server_time_ms=server_time_ms,
+                client_time_ms=client_time_ms,
+                client_updated_at_ms=client_updated_at_ms,
+                server_updated_at_ms_before=server_updated_at_ms_before,
+                server_updated_at_ms_after=server_updated_at_ms_after,
+                server_revision_before=server_revision_before,
+                server_revision_after=server_revision_after,
+                diff=diff,
             )
-            conn.commit()
-            return int(cur.lastrowid)
 
     def list_sync_records(
         self,
@@ -486,7 +1106,9 @@ SELECT
   server_updated_at_ms_after,
   server_revision_before,
   server_revision_after,
-  diff_json
+  diff_json,
+  diff_codec,
+  diff_status
 FROM sync_records
 WHERE user_id = ?
 """
@@ -497,13 +1119,103 @@ WHERE user_id = ?
         sql += " ORDER BY id DESC LIMIT ?"
         args.append(effective_limit)
 
-        with closing(self._connect()) as conn:
+        with self._pool.reader() as conn:
             rows = conn.execute(sql, tuple(args)).fetchall()
 
         return [self._row_to_sync_record(row) for row in rows]
 
+    def list_pending_sync_records(self, *, limit: int = 200) -> list[SyncRecord]:
+        """diff 仍为 pending 的记录（进程退出前未算完），按 id 升序。"""
+
+        with self._pool.reader() as conn:
+            rows = conn.execute(
+                """
+SELECT
+  id,
+  user_id,
+  protocol_version,
+  decision,
+  server_time_ms,
+  client_time_ms,
+  client_updated_at_ms,
+  server_updated_at_ms_before,
+  server_updated_at_ms_after,
+  server_revision_before,
+  server_revision_after,
+  diff_json,
+  diff_codec,
+  diff_status
+FROM sync_records
+WHERE diff_status = 'pending'
+ORDER BY id ASC
+LIMIT ?
+""",
+                (max(1, int(limit)),),
+            ).fetchall()
+        return [self._row_to_sync_record(row) for row in rows]
+
+    def claim_stale_sync_record_diffs(self, *, now_ms: int, stale_after_ms: int, limit: int) -> list[SyncRecord]:
+        """认领超过 `stale_after_ms` 未被认领的 pending 记录（原进程已退出），按 id 升序返回。
+
+        认领在写事务里原子完成：多个进程同时启动时每条记录只会被其中一个认领，
+        仍在由写入进程计算的记录（认领时间较新）不会被抢走。
+        """
+
+        with self._pool.writer() as conn:
+            rows = conn.execute(
+                """
+UPDATE sync_records
+SET diff_claimed_at_ms = ?
+WHERE id IN (
+  SELECT id
+  FROM sync_records
+  WHERE diff_status = 'pending' AND COALESCE(diff_claimed_at_ms, 0) <= ?
+  ORDER BY id ASC
+  LIMIT ?
+)
+RETURNING
+  id,
+  user_id,
+  protocol_version,
+  decision,
+  server_time_ms,
+  client_time_ms,
+  client_updated_at_ms,
+  server_updated_at_ms_before,
+  server_updated_at_ms_after,
+  server_revision_before,
+  server_revision_after,
+  diff_json,
+  diff_codec,
+  diff_status
+""",
+                (int(now_ms), int(now_ms) - max(0, int(stale_after_ms)), max(1, int(limit))),
+            ).fetchall()
+        return sorted((self._row_to_sync_record(row) for row in rows), key=lambda record: record.id)
+
+    def complete_sync_record_diff(
+        self,
+        record_id: int,
+        *,
+        diff: dict[str, Any],
+        status: str = DIFF_STATUS_READY,
+    ) -> bool:
+        """回填 pending 记录的 diff；记录已不是 pending（如已被其它进程回填）时不改动并返回 False。"""
+
+        diff_codec, diff_json = self._codec.encode(json.dumps(diff, ensure_ascii=False, separators=(",", ":")))
+        with self._pool.writer() as conn:
+            cur = conn.execute(
+                """
+UPDATE sync_records
+SET diff_json = ?, diff_codec = ?, diff_status = ?
+WHERE id = ? AND diff_status = 'pending'
+""",
+                (diff_json, diff_codec, status, int(record_id)),
+            )
+            return cur.rowcount > 0
+
     def get_sync_record(self, record_id: int) -> SyncRecord | None:
-        with closing(self._connect()) as conn:
+        with self._pool.reader() as conn:
             row = conn.execute(
                 """
 SELECT
@@ -518,7 +1230,9 @@ SELECT
   server_updated_at_ms_after,
   server_revision_before,
   server_revision_after,
-  diff_json
+  diff_json,
+  diff_codec,
+  diff_status
 FROM sync_records
 WHERE id = ?
 """,
@@ -528,13 +1242,899 @@ WHERE id = ?
                 return None
             return self._row_to_sync_record(row)
 
+    @property
+    def compression(self) -> str | None:
+        return self._codec.algorithm
+
+    def train_compression_dictionary(
+        self,
+        *,
+        max_samples: int = 2000,
+        dict_size: int = DEFAULT_DICTIONARY_BYTES,
+        now_ms: int,
+    ) -> int:
+        """用本部署已有的工具快照训练压缩字典，并设为后续写入使用的字典。"""
+
+        algorithm = self._codec.algorithm
+        if algorithm is None:
+            raise ValueError("未开启存储压缩，无法训练字典")
+
+        with self._pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT body, codec FROM sync_tool_blobs ORDER BY rowid DESC LIMIT ?",
+                (max(1, int(max_samples)),),
+            ).fetchall()
+            samples = [self._codec.decode(row[1], row[0]) for row in rows]
+        dictionary = train_dictionary(algorithm, samples, dict_size=dict_size)
+
+        with self._pool.writer() as conn:
+            cur = conn.execute(
+                """
+INSERT INTO sync_codec_dictionaries (algorithm, body, sample_count, created_at_ms)
+VALUES (?, ?, ?, ?)
+""",
+                (algorithm, dictionary, len(samples), int(now_ms)),
+            )
+            dictionary_id = int(cur.lastrowid)
+        self._codec.set_active_dictionary(dictionary_id)
+        return dictionary_id
+
+    def recompress_rows(self, *, batch_size: int = 200) -> dict[str, int]:
+        """按当前编码配置重写已有行（压缩旧的明文行，或在关闭压缩后解压回明文）。
+
+        分批提交，每批一个写事务，避免长时间占住写锁。返回各表改写的行数。
+        """
+
+        targets = (
+            ("sync_tool_blobs", "rowid", "body", "codec", ""),
+            ("sync_snapshot_history", "rowid", "delta_json", "delta_codec", "AND payload_kind = 'delta'"),
+            ("sync_records", "id", "diff_json", "diff_codec", ""),
+        )
+        target_tag = self._codec.target_tag
+        effective_batch = max(1, int(batch_size))
+        rewritten: dict[str, int] = {}
+        for table, key_column, value_column, codec_column, extra_where in targets:
+            count = 0
+            last_key = 0
+            while True:
+                with self._pool.writer() as conn:
+                    rows = conn.execute(
+                        f"""
+SELECT {key_column}, {value_column}, {codec_column}
+FROM {table}
+WHERE {key_column} > ? {extra_where}
+ORDER BY {key_column} ASC
+LIMIT ?
+""",
+                        (last_key, effective_batch),
+                    ).fetchall()
+                    for key, value, tag in rows:
+                        if tag == target_tag or value is None:
+                            continue
+                        new_tag, new_value = self._codec.encode(self._codec.decode(tag, value))
+                        if new_tag == tag:
+                            continue
+                        conn.execute(
+                            f"UPDATE {table} SET {value_column} = ?, {codec_column} = ? WHERE {key_column} = ?",
+                            (new_value, new_tag, key),
+                        )
+                        count += 1
+                if len(rows) < effective_batch:
+                    break
+                last_key = int(rows[-1][0])
+            rewritten[table] = count
+        return rewritten
+
+    def _load_codec_dictionary(self, dictionary_id: int) -> bytes | None:
+        with self._pool.reader() as conn:
+            row = conn.execute(
+                "SELECT body FROM sync_codec_dictionaries WHERE dict_id = ?",
+                (int(dictionary_id),),
+            ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def _latest_codec_dictionary_id(self, algorithm: str | None) -> int | None:
+        if algorithm is None:
+            return None
+        with self._pool.reader() as conn:
+            row = conn.execute(
+                "SELECT MAX(dict_id) FROM sync_codec_dictionaries WHERE algorithm = ?",
+                (algorithm,),
+            ).fetchone()
+        return None if row is None or row[0] is None else int(row[0])
+
+    # ---- 以下为基于已借出连接的内部实现，供公开方法与事务复用 ----
+
+    def _fetch_snapshot(
+        self,
+        conn: sqlite3.Connection,
+        user_id: str,
+        *,
+        use_cache: bool = True,
+    ) -> UserSnapshot | None:
+        use_cache = use_cache and self._snapshot_cache.enabled
+        if use_cache:
+            # 先取当前 revision（主键点查）再查缓存：其它 worker 写入后 revision 前进，缓存自动失配。
+            revision_row = conn.execute(
+                "SELECT server_revision FROM sync_snapshots WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if revision_row is None:
+                return None
+            cached = self._snapshot_cache.get(user_id, int(revision_row[0]))
+            if cached is not None:
+                return cached
+
+        row = conn.execute(
+            f"""
+SELECT {_SNAPSHOT_COLUMNS}
+FROM sync_snapshots
+WHERE user_id = ?
+""",
+            (user_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        snapshot = self._row_to_snapshot(conn, row)
+        if use_cache:
+            self._snapshot_cache.put(snapshot)
+        return snapshot
+
     @staticmethod
-    def _row_to_snapshot(row: sqlite3.Row | tuple[Any, ...]) -> UserSnapshot:
+    def _fetch_snapshot_revision(conn: sqlite3.Connection, user_id: str) -> int:
+        row = conn.execute(
+            "SELECT server_revision FROM sync_snapshots WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        return 0 if row is None else int(row[0])
+
+    def _fetch_user_profile(self, conn: sqlite3.Connection, user_id: str) -> DashboardUser | None:
+        row = conn.execute(
+            """
+SELECT
+  user_id,
+  display_name,
+  notes,
+  is_enabled,
+  created_at_ms,
+  updated_at_ms,
+  last_seen_at_ms
+FROM sync_users
+WHERE user_id = ?
+""",
+            (user_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_dashboard_user(row)
+
+    def _touch_user(self, conn: sqlite3.Connection, *, user_id: str, now_ms: int) -> DashboardUser:
+        row = conn.execute(
+            """
+INSERT INTO sync_users (
+  user_id,
+  display_name,
+  notes,
+  is_enabled,
+  created_at_ms,
+  updated_at_ms,
+  last_seen_at_ms
+)
+VALUES (?, '', '', 1, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+  last_seen_at_ms=excluded.last_seen_at_ms
+RETURNING
+  user_id,
+  display_name,
+  notes,
+  is_enabled,
+  created_at_ms,
+  updated_at_ms,
+  last_seen_at_ms
+""",
+            (user_id, int(now_ms), int(now_ms), int(now_ms)),
+        ).fetchone()
+        return self._row_to_dashboard_user(row)
+
+    def _upsert_user_profile(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        display_name: str,
+        notes: str,
+        is_enabled: bool,
+        now_ms: int,
+    ) -> DashboardUser:
+        existing = self._fetch_user_profile(conn, user_id)
+        if existing is None:
+            conn.execute(
+                """
+INSERT INTO sync_users (
+  user_id,
+  display_name,
+  notes,
+  is_enabled,
+  created_at_ms,
+  updated_at_ms,
+  last_seen_at_ms
+)
+VALUES (?, ?, ?, ?, ?, ?, NULL)
+""",
+                (
+                    user_id,
+                    display_name,
+                    notes,
+                    1 if is_enabled else 0,
+                    int(now_ms),
+                    int(now_ms),
+                ),
+            )
+        else:
+            conn.execute(
+                """
+UPDATE sync_users
+SET display_name = ?, notes = ?, is_enabled = ?, updated_at_ms = ?
+WHERE user_id = ?
+""",
+                (
+                    display_name,
+                    notes,
+                    1 if is_enabled else 0,
+                    int(now_ms),
+                    user_id,
+                ),
+            )
+        profile = self._fetch_user_profile(conn, user_id)
+        assert profile is not None
+        return profile
+
+    def _save_client_snapshot(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        tools_data: dict[str, Any],
+        updated_at_ms: int,
+        server_time_ms: int,
+        client_time_ms: int | None,
+        expected_revision: int | None = None,
+        analysis: SnapshotAnalysis | None = None,
+    ) -> int:
+        if analysis is None:
+            analysis = analyze_tools_data(tools_data)
+        blob_bodies: dict[str, str] = {}
+        merkle_indexes: dict[str, ToolMerkleIndex] = {}
+        manifest: dict[str, str] = {}
+        for tool_id in tools_data:
+            # 序列化与分段/行 hash 一次完成，内容块与索引一起落库
+            body, merkle = analysis.tools[tool_id].indexed
+            digest = merkle.tool_hash
+            blob_bodies[digest] = body
+            merkle_indexes[digest] = merkle
+            manifest[tool_id] = digest
+        manifest_json = json.dumps(manifest, ensure_ascii=False, separators=(",", ":"))
+        metadata = analysis.to_metadata(tool_hashes=manifest)
+
+        row = conn.execute(
+            """
+SELECT server_revision, tools_data_json, tools_manifest_json
+FROM sync_snapshots
+WHERE user_id = ?
+""",
+            (user_id,),
+        ).fetchone()
+        current_revision = int(row[0]) if row is not None else 0
+        if expected_revision is not None and current_revision != int(expected_revision):
+            raise RevisionConflictError(
+                user_id=user_id,
+                expected_revision=int(expected_revision),
+                actual_revision=current_revision,
+            )
+        self._snapshot_cache.invalidate(user_id)
+        new_revision = current_revision + 1
+
+        # 新头版本同时被 sync_snapshots 与历史全量行引用；未变化的工具正负抵消，不产生写入。
+        ref_deltas: Counter[str] = Counter()
+        for digest in manifest.values():
+            ref_deltas[digest] += 2
+
+        if row is not None:
+            previous_manifest: dict[str, str] | None = json.loads(row[2]) if row[2] else None
+            if previous_manifest is not None:
+                for digest in previous_manifest.values():
+                    ref_deltas[digest] -= 1
+
+            head = conn.execute(
+                """
+SELECT tools_manifest_json
+FROM sync_snapshot_history
+WHERE user_id = ? AND server_revision = ? AND payload_kind = 'full'
+""",
+                (user_id, current_revision),
+            ).fetchone()
+            if head is not None and current_revision % self._history_keyframe_interval != 0:
+                # 上一个头版本降级为“相对新版本”的反向增量；关键帧保持全量，限制回放链长度。
+                reverse_delta = self._build_reverse_delta(
+                    conn,
+                    next_tools_data=tools_data,
+                    next_manifest=manifest,
+                    previous_manifest=previous_manifest,
+                    previous_tools_data_json=row[1],
+                )
+                delta_codec, delta_value = self._codec.encode(
+                    json.dumps(reverse_delta, ensure_ascii=False, separators=(",", ":"))
+                )
+                conn.execute(
+                    """
+UPDATE sync_snapshot_history
+SET
+  payload_kind = 'delta',
+  base_revision = ?,
+  delta_json = ?,
+  delta_codec = ?,
+  tools_data_json = '',
+  tools_manifest_json = NULL
+WHERE user_id = ? AND server_revision = ?
+""",
+                    (new_revision, delta_value, delta_codec, user_id, current_revision),
+                )
+                if head[0]:
+                    for digest in json.loads(head[0]).values():
+                        ref_deltas[digest] -= 1
+
+        self._apply_blob_ref_deltas(conn, ref_deltas, blob_bodies, merkle_indexes)
+
+        conn.execute(
+            """
+INSERT INTO sync_snapshot_history (
+  user_id,
+  server_revision,
+  updated_at_ms,
+  tools_data_json,
+  updated_server_time_ms,
+  last_client_time_ms,
+  tools_manifest_json
+)
+VALUES (?, ?, ?, '', ?, ?, ?)
+ON CONFLICT(user_id, server_revision) DO UPDATE SET
+  updated_at_ms=excluded.updated_at_ms,
+  tools_data_json=excluded.tools_data_json,
+  updated_server_time_ms=excluded.updated_server_time_ms,
+  last_client_time_ms=excluded.last_client_time_ms,
+  payload_kind='full',
+  base_revision=NULL,
+  delta_json=NULL,
+  delta_codec=NULL,
+  tools_manifest_json=excluded.tools_manifest_json
+""",
+            (
+                user_id,
+                new_revision,
+                int(updated_at_ms),
+                int(server_time_ms),
+                None if client_time_ms is None else int(client_time_ms),
+                manifest_json,
+            ),
+        )
+
+        conn.execute(
+            """
+INSERT INTO sync_snapshots (
+  user_id,
+  server_revision,
+  updated_at_ms,
+  tools_data_json,
+  updated_server_time_ms,
+  last_client_time_ms,
+  tools_manifest_json,
+  is_empty,
+  max_updated_at_ms,
+  tool_stats_json
+)
+VALUES (?, ?, ?, '', ?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+  server_revision=excluded.server_revision,
+  updated_at_ms=excluded.updated_at_ms,
+  tools_data_json=excluded.tools_data_json,
+  updated_server_time_ms=excluded.updated_server_time_ms,
+  last_client_time_ms=excluded.last_client_time_ms,
+  tools_manifest_json=excluded.tools_manifest_json,
+  is_empty=excluded.is_empty,
+  max_updated_at_ms=excluded.max_updated_at_ms,
+  tool_stats_json=excluded.tool_stats_json
+""",
+            (
+                user_id,
+                new_revision,
+                int(updated_at_ms),
+                int(server_time_ms),
+                None if client_time_ms is None else int(client_time_ms),
+                manifest_json,
+                1 if metadata.is_empty else 0,
+                metadata.max_updated_at_ms,
+                tool_stats_to_json(metadata.tool_stats),
+            ),
+        )
+        self._upsert_user_summary(
+            conn,
+            user_id=user_id,
+            server_revision=new_revision,
+            updated_at_ms=int(updated_at_ms),
+            metadata=metadata,
+        )
+        self._update_tool_states(
+            conn,
+            user_id=user_id,
+            analysis=analysis,
+            manifest=manifest,
+            new_revision=new_revision,
+            server_time_ms=int(server_time_ms),
+        )
+        return new_revision
+
+    def _update_tool_states(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        analysis: SnapshotAnalysis,
+        manifest: dict[str, str],
+        new_revision: int,
+        server_time_ms: int,
+    ) -> None:
+        # 只有内容变化（或新出现、被删除）的工具推进自己的 revision。
+        existing = {
+            str(row[0]): row[1]
+            for row in conn.execute(
+                "SELECT tool_id, content_hash FROM sync_tool_states WHERE user_id = ?",
+                (user_id,),
+            ).fetchall()
+        }
+        rows: list[tuple[Any, ...]] = []
+        for tool_id, digest in manifest.items():
+            if tool_id in existing and existing[tool_id] == digest:
+                continue
+            tool = analysis.tools[tool_id]
+            rows.append((user_id, tool_id, new_revision, tool.max_updated_at_ms, digest, 1 if tool.is_empty else 0))
+        for tool_id, digest in existing.items():
+            if digest is not None and tool_id not in manifest:
+                rows.append((user_id, tool_id, new_revision, server_time_ms, None, 1))
+        conn.executemany(
+            """
+INSERT INTO sync_tool_states (user_id, tool_id, revision, updated_at_ms, content_hash, is_empty)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id, tool_id) DO UPDATE SET
+  revision=excluded.revision,
+  updated_at_ms=excluded.updated_at_ms,
+  content_hash=excluded.content_hash,
+  is_empty=excluded.is_empty
+""",
+            rows,
+        )
+
+    def _fetch_tool_states(
+        self,
+        conn: sqlite3.Connection,
+        snapshot: UserSnapshot | None,
+    ) -> dict[str, ToolSyncState]:
+        if snapshot is None:
+            return {}
+        states = {
+            str(row[0]): ToolSyncState(
+                tool_id=str(row[0]),
+                revision=int(row[1]),
+                updated_at_ms=int(row[2]),
+                content_hash=None if row[3] is None else str(row[3]),
+                is_empty=int(row[4]) == 1,
+            )
+            for row in conn.execute(
+                """
+SELECT tool_id, revision, updated_at_ms, content_hash, is_empty
+FROM sync_tool_states
+WHERE user_id = ?
+""",
+                (snapshot.user_id,),
+            ).fetchall()
+        }
+        # 旧库升级前写入的工具没有状态行：视为在当前快照版本发生变化。
+        for tool_id, digest in snapshot.metadata.tool_hashes.items():
+            if tool_id not in states:
+                tool = analyze_tool_snapshot(snapshot.tools_data[tool_id])
+                states[tool_id] = ToolSyncState(
+                    tool_id=tool_id,
+                    revision=snapshot.server_revision,
+                    updated_at_ms=tool.max_updated_at_ms,
+                    content_hash=digest,
+                    is_empty=tool.is_empty,
+                )
+        return states
+
+    def _upsert_user_summary(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        server_revision: int,
+        updated_at_ms: int,
+        metadata: SnapshotMetadata,
+    ) -> None:
+        tool_ids = sorted(metadata.tool_stats.keys())
+        tool_summaries = [tool_stats_summary(tool_id, metadata.tool_stats[tool_id]) for tool_id in tool_ids]
+        conn.execute(
+            """
+INSERT INTO sync_user_summaries (
+  user_id,
+  server_revision,
+  updated_at_ms,
+  tool_count,
+  total_item_count,
+  tool_ids_json,
+  tool_summaries_json
+)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+  server_revision=excluded.server_revision,
+  updated_at_ms=excluded.updated_at_ms,
+  tool_count=excluded.tool_count,
+  total_item_count=excluded.total_item_count,
+  tool_ids_json=excluded.tool_ids_json,
+  tool_summaries_json=excluded.tool_summaries_json
+""",
+            (
+                user_id,
+                int(server_revision),
+                int(updated_at_ms),
+                len(tool_ids),
+                sum(item["total_items"] for item in tool_summaries),
+                json.dumps(tool_ids, ensure_ascii=False, separators=(",", ":")),
+                json.dumps(tool_summaries, ensure_ascii=False, separators=(",", ":")),
+            ),
+        )
+
+    def _backfill_user_profiles(self) -> None:
+        # 旧库中只有快照没有资料的用户补一条默认资料（与接口的兜底资料一致），
+        # 用户目录因此可以只按 sync_users 的索引分页。
+        with self._pool.writer() as conn:
+            conn.execute(
+                """
+INSERT INTO sync_users (
+  user_id,
+  display_name,
+  notes,
+  is_enabled,
+  created_at_ms,
+  updated_at_ms,
+  last_seen_at_ms
+)
+SELECT
+  snap.user_id,
+  '',
+  '',
+  1,
+  snap.updated_at_ms,
+  snap.updated_at_ms,
+  CASE WHEN snap.updated_at_ms > 0 THEN snap.updated_at_ms ELSE NULL END
+FROM sync_snapshots snap
+WHERE NOT EXISTS (SELECT 1 FROM sync_users u WHERE u.user_id = snap.user_id)
+""",
+            )
+
+    def _backfill_user_summaries(self) -> None:
+        # 旧库升级：为缺少摘要（或摘要落后于快照）的用户补齐，之后只随写入增量维护。
+        with self._pool.writer() as conn:
+            user_ids = [
+                str(row[0])
+                for row in conn.execute(
+                    """
+SELECT snap.user_id
+FROM sync_snapshots snap
+LEFT JOIN sync_user_summaries s ON s.user_id = snap.user_id
+WHERE s.user_id IS NULL OR s.server_revision != snap.server_revision
+""",
+                ).fetchall()
+            ]
+            for user_id in user_ids:
+                snapshot = self._fetch_snapshot(conn, user_id, use_cache=False)
+                assert snapshot is not None
+                self._upsert_user_summary(
+                    conn,
+                    user_id=user_id,
+                    server_revision=snapshot.server_revision,
+                    updated_at_ms=snapshot.updated_at_ms,
+                    metadata=snapshot.metadata,
+                )
+
+    def _build_reverse_delta(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        next_tools_data: dict[str, Any],
+        next_manifest: dict[str, str],
+        previous_manifest: dict[str, str] | None,
+        previous_tools_data_json: str,
+    ) -> JsonPatch:
+        if previous_manifest is None:
+            # 旧库遗留的整段 JSON 行：直接整体比较。
+            previous_tools_data = json.loads(previous_tools_data_json) if previous_tools_data_json else {}
+            return make_patch(next_tools_data, previous_tools_data)
+
+        changed = [
+            tool_id
+            for tool_id, digest in previous_manifest.items()
+            if next_manifest.get(tool_id) != digest
+        ]
+        bodies = self._load_blob_bodies(conn, (previous_manifest[tool_id] for tool_id in changed))
+
+        ops: JsonPatch = []
+        for tool_id in next_manifest:
+            if tool_id not in previous_manifest:
+                ops.append({"op": "remove", "path": f"/{escape_pointer_token(tool_id)}"})
+        for tool_id in changed:
+            path = f"/{escape_pointer_token(tool_id)}"
+            previous_tool = json.loads(bodies[previous_manifest[tool_id]])
+            if tool_id in next_tools_data:
+                ops.extend(make_patch(next_tools_data[tool_id], previous_tool, base_path=path))
+            else:
+                ops.append({"op": "add", "path": path, "value": previous_tool})
+        return ops
+
+    def _apply_blob_ref_deltas(
+        self,
+        conn: sqlite3.Connection,
+        ref_deltas: Counter[str],
+        blob_bodies: dict[str, str],
+        merkle_indexes: dict[str, ToolMerkleIndex],
+    ) -> None:
+        released: list[str] = []
+        for digest, delta in ref_deltas.items():
+            if delta > 0:
+                merkle_json = merkle_index_to_json(merkle_indexes[digest])
+                # 旧内容块没有索引时顺带补上
+                exists = conn.execute(
+                    """
+UPDATE sync_tool_blobs
+SET ref_count = ref_count + ?, merkle_json = COALESCE(merkle_json, ?)
+WHERE hash = ?
+""",
+                    (delta, merkle_json, digest),
+                ).rowcount
+                if not exists:
+                    codec, body = self._codec.encode(blob_bodies[digest])
+                    conn.execute(
+                        """
+INSERT INTO sync_tool_blobs (hash, body, ref_count, codec, merkle_json)
+VALUES (?, ?, ?, ?, ?)
+""",
+                        (digest, body, delta, codec, merkle_json),
+                    )
+            elif delta < 0:
+                conn.execute(
+                    "UPDATE sync_tool_blobs SET ref_count = ref_count + ? WHERE hash = ?",
+                    (delta, digest),
+                )
+                released.append(digest)
+        if released:
+            placeholders = ",".join("?" for _ in released)
+            conn.execute(
+                f"DELETE FROM sync_tool_blobs WHERE ref_count <= 0 AND hash IN ({placeholders})",
+                tuple(released),
+            )
+
+    def _load_merkle_indexes(self, conn: sqlite3.Connection, snapshot: UserSnapshot) -> dict[str, ToolMerkleIndex]:
+        tool_hashes = snapshot.metadata.tool_hashes
+        wanted = sorted(set(tool_hashes.values()))
+        if not wanted:
+            return {}
+        placeholders = ",".join("?" for _ in wanted)
+        rows = conn.execute(
+            f"SELECT hash, merkle_json FROM sync_tool_blobs WHERE merkle_json IS NOT NULL AND hash IN ({placeholders})",
+            tuple(wanted),
+        ).fetchall()
+        by_digest: dict[str, ToolMerkleIndex] = {}
+        for digest, merkle_json in rows:
+            index = merkle_index_from_json(merkle_json)
+            if index is not None:
+                by_digest[str(digest)] = index
+        return {tool_id: by_digest[digest] for tool_id, digest in tool_hashes.items() if digest in by_digest}
+
+    def _load_blob_bodies(self, conn: sqlite3.Connection, digests: Iterable[str]) -> dict[str, str]:
+        wanted = sorted(set(digests))
+        if not wanted:
+            return {}
+        placeholders = ",".join("?" for _ in wanted)
+        rows = conn.execute(
+            f"SELECT hash, body, codec FROM sync_tool_blobs WHERE hash IN ({placeholders})",
+            tuple(wanted),
+        ).fetchall()
+        bodies = {str(row[0]): self._codec.decode(row[2], row[1]) for row in rows}
+        missing = [digest for digest in wanted if digest not in bodies]
+        if missing:
+            raise sqlite3.DatabaseError(f"sync_tool_blobs 缺少内容块：{missing[0]}")
+        return bodies
+
+    def _load_tools_data_json(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        manifest_json: str | None,
+        tools_data_json: str | None,
+    ) -> str:
+        """返回整份 tools_data 的 JSON 文本；清单行直接拼接各工具块，不做解析。"""
+
+        if not manifest_json:
+            return tools_data_json or "{}"
+        manifest: dict[str, str] = json.loads(manifest_json)
+        bodies = self._load_blob_bodies(conn, manifest.values())
+        return "{" + ",".join(
+            f"{json.dumps(tool_id, ensure_ascii=False)}:{bodies[digest]}"
+            for tool_id, digest in manifest.items()
+        ) + "}"
+
+    def _load_tool_json(
+        self,
+        conn: sqlite3.Connection,
+        snapshot: UserSnapshot,
+        tool_ids: Iterable[str],
+    ) -> dict[str, str]:
+        """按工具返回规范化 JSON 文本；优先直接取内容块，旧库整段 JSON 行回退为现场序列化。"""
+
+        hashes = snapshot.metadata.tool_hashes
+        wanted = [tool_id for tool_id in tool_ids if tool_id in hashes]
+        digests = sorted({hashes[tool_id] for tool_id in wanted})
+        bodies: dict[str, str] = {}
+        if digests:
+            placeholders = ",".join("?" for _ in digests)
+            rows = conn.execute(
+                f"SELECT hash, body, codec FROM sync_tool_blobs WHERE hash IN ({placeholders})",
+                tuple(digests),
+            ).fetchall()
+            bodies = {str(row[0]): self._codec.decode(row[2], row[1]) for row in rows}
+        result: dict[str, str] = {}
+        for tool_id in wanted:
+            body = bodies.get(hashes[tool_id])
+            result[tool_id] = body if body is not None else hash_tool_snapshot(snapshot.tools_data[tool_id])[0]
+        return result
+
+    def _fetch_idempotent_response(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        key: str,
+        now_ms: int,
+    ) -> IdempotentResponse | None:
+        row = conn.execute(
+            """
+SELECT fingerprint, response_json, tools_data_revision
+FROM sync_idempotency_keys
+WHERE user_id = ? AND idempotency_key = ? AND created_at_ms > ?
+""",
+            (user_id, key, now_ms - self._idempotency_ttl_ms),
+        ).fetchone()
+        if row is None:
+            return None
+        return IdempotentResponse(
+            fingerprint=str(row[0]),
+            response_json=str(row[1]),
+            tools_data_revision=None if row[2] is None else int(row[2]),
+        )
+
+    def _save_idempotent_response(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        key: str,
+        fingerprint: str,
+        response_json: str,
+        tools_data_revision: int | None,
+        now_ms: int,
+    ) -> None:
+        # 顺带清理过期键（走 created_at 索引，通常为空操作）
+        conn.execute(
+            "DELETE FROM sync_idempotency_keys WHERE created_at_ms <= ?",
+            (now_ms - self._idempotency_ttl_ms,),
+        )
+        conn.execute(
+            """
+INSERT INTO sync_idempotency_keys (
+  user_id, idempotency_key, fingerprint, response_json, tools_data_revision, created_at_ms
+)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id, idempotency_key) DO UPDATE SET
+  fingerprint = excluded.fingerprint,
+  response_json = excluded.response_json,
+  tools_data_revision = excluded.tools_data_revision,
+  created_at_ms = excluded.created_at_ms
+""",
+            (user_id, key, fingerprint, response_json, tools_data_revision, now_ms),
+        )
+
+    def _insert_sync_record(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        user_id: str,
+        protocol_version: int,
+        decision: str,
+        server_time_ms: int,
+        client_time_ms: int | None,
+        client_updated_at_ms: int,
+        server_updated_at_ms_before: int,
+        server_updated_at_ms_after: int,
+        server_revision_before: int,
+        server_revision_after: int,
+        diff: dict[str, Any],
+        diff_status: str = DIFF_STATUS_READY,
+    ) -> int:
+        diff_codec, diff_json = self._codec.encode(
+            json.dumps(
+                diff,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        )
+
+        cur = conn.execute(
+            """
+INSERT INTO sync_records (
+  user_id,
+  protocol_version,
+  decision,
+  server_time_ms,
+  client_time_ms,
+  client_updated_at_ms,
+  server_updated_at_ms_before,
+  server_updated_at_ms_after,
+  server_revision_before,
+  server_revision_after,
+  diff_json,
+  diff_codec,
+  diff_status,
+  diff_claimed_at_ms
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+""",
+            (
+                user_id,
+                int(protocol_version),
+                decision,
+                int(server_time_ms),
+                None if client_time_ms is None else int(client_time_ms),
+                int(client_updated_at_ms),
+                int(server_updated_at_ms_before),
+                int(server_updated_at_ms_after),
+                int(server_revision_before),
+                int(server_revision_after),
+                diff_json,
+                diff_codec,
+                diff_status,
+                int(server_time_ms) if diff_status == DIFF_STATUS_PENDING else None,
+            ),
+        )
+        return int(cur.lastrowid)
+
+    def _row_to_snapshot(
+        self,
+        conn: sqlite3.Connection,
+        row: sqlite3.Row | tuple[Any, ...],
+    ) -> UserSnapshot:
+        tools_data_json = self._load_tools_data_json(conn, manifest_json=row[4], tools_data_json=row[3])
+        stored_metadata = None
+        if row[4] and row[5] is not None and row[7] is not None:
+            stored_metadata = SnapshotMetadata(
+                is_empty=int(row[5]) == 1,
+                max_updated_at_ms=int(row[6] or 0),
+                tool_hashes=json.loads(row[4]),
+                tool_stats=tool_stats_from_json(row[7]),
+            )
         return UserSnapshot(
             user_id=str(row[0]),
             server_revision=int(row[1]),
             updated_at_ms=int(row[2]),
-            tools_data=json.loads(row[3]) if row[3] else {},
+            tools_data_json=tools_data_json,
+            stored_metadata=stored_metadata,
         )
 
     @staticmethod
@@ -550,8 +2150,20 @@ WHERE id = ?
         )
 
     @staticmethod
-    def _row_to_sync_record(row: sqlite3.Row | tuple[Any, ...]) -> SyncRecord:
-        diff = json.loads(row[11]) if row[11] else {}
+    def _row_to_user_summary(row: sqlite3.Row | tuple[Any, ...]) -> UserSnapshotSummary:
+        return UserSnapshotSummary(
+            user_id=str(row[0]),
+            server_revision=int(row[1]),
+            updated_at_ms=int(row[2]),
+            tool_count=int(row[3]),
+            total_item_count=int(row[4]),
+            tool_ids_json=str(row[5]),
+            tool_summaries_json=str(row[6]),
+        )
+
+    def _row_to_sync_record(self, row: sqlite3.Row | tuple[Any, ...]) -> SyncRecord:
+        diff_text = self._codec.decode(row[12], row[11]) if row[11] else ""
+        diff = json.loads(diff_text) if diff_text else {}
         return SyncRecord(
             id=int(row[0]),
             user_id=str(row[1]),
@@ -565,4 +2177,5 @@ WHERE id = ?
             server_revision_before=int(row[9]),
             server_revision_after=int(row[10]),
             diff=diff,
+            diff_status=str(row[13]),
         )
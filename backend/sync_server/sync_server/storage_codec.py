@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import re
+import threading
+import zlib
+from collections import Counter
+from collections.abc import Callable, Iterable
+from typing import Any
+
+try:  # zstd 为可选依赖：未安装时只提供 zlib（同样支持预置字典）。
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SUPPORTED_ALGORITHMS = ("zlib", "zstd")
+
+# 太短的内容压缩后反而更大，直接存原文。
+MIN_COMPRESS_BYTES = 96
+DEFAULT_DICTIONARY_BYTES = 32 * 1024
+
+_ZLIB_LEVEL = 6
+_ZSTD_LEVEL = 6
+_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.){1,48}"[:,]?')
+
+DictionaryLoader = Callable[[int], bytes | None]
+
+
+class StorageCodecError(ValueError):
+    """编码标签无法识别，或依赖的压缩字典/算法不可用。"""
+
+
+def is_algorithm_available(algorithm: str) -> bool:
+    if algorithm == "zlib":
+        return True
+    if algorithm == "zstd":
+        return zstandard is not None
+    return False
+
+
+class StorageCodec:
+    """快照 JSON 列的透明压缩编解码。
+
+    每行额外保存一个编码标签，解码只依赖标签，因此开启/关闭/更换字典后旧行始终可读：
+
+    - `None`：原始 UTF-8 文本（未压缩，兼容历史数据）
+    - `"zlib"` / `"zstd"`：无字典压缩
+    - `"zlib:<dict_id>"` / `"zstd:<dict_id>"`：使用 `sync_codec_dictionaries` 中对应字典压缩
+    """
+
+    def __init__(
+        self,
+        *,
+        algorithm: str | None,
+        dictionary_loader: DictionaryLoader,
+        active_dictionary_id: int | None = None,
+    ) -> None:
+        if algorithm is not None and not is_algorithm_available(algorithm):
+            raise StorageCodecError(f"压缩算法不可用：{algorithm}")
+        self._algorithm = algorithm
+        self._dictionary_loader = dictionary_loader
+        self._active_dictionary_id = active_dictionary_id
+        self._dictionaries: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def algorithm(self) -> str | None:
+        return self._algorithm
+
+    @property
+    def active_dictionary_id(self) -> int | None:
+        return self._active_dictionary_id
+
+    def set_active_dictionary(self, dictionary_id: int | None) -> None:
+        self._active_dictionary_id = dictionary_id
+
+    @property
+    def target_tag(self) -> str | None:
+        """当前配置下新写入（足够大的）内容会使用的编码标签。"""
+
+        if self._algorithm is None:
+            return None
+        if self._active_dictionary_id is None:
+            return self._algorithm
+        return f"{self._algorithm}:{self._active_dictionary_id}"
+
+    def encode(self, text: str) -> tuple[str | None, str | bytes]:
+        if self._algorithm is None:
+            return None, text
+        raw = text.encode("utf-8")
+        if len(raw) < MIN_COMPRESS_BYTES:
+            return None, text
+
+        dictionary_id = self._active_dictionary_id
+        dictionary = None if dictionary_id is None else self._dictionary(dictionary_id)
+        tag = self._algorithm if dictionary is None else f"{self._algorithm}:{dictionary_id}"
+        return tag, _compress(self._algorithm, raw, dictionary)
+
+    def decode(self, tag: str | None, value: Any) -> str:
+        if not tag:
+            if isinstance(value, bytes):
+                return value.decode("utf-8")
+            return "" if value is None else str(value)
+
+        algorithm, _, dictionary_part = str(tag).partition(":")
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise StorageCodecError(f"未知的编码标签：{tag}")
+        dictionary = None
+        if dictionary_part:
+            if not (dictionary_part.isascii() and dictionary_part.isdigit()):
+                raise StorageCodecError(f"未知的编码标签：{tag}")
+            dictionary = self._dictionary(int(dictionary_part))
+            if dictionary is None:
+                raise StorageCodecError(f"压缩字典不存在：{tag}")
+        return _decompress(algorithm, bytes(value), dictionary).decode("utf-8")
+
+    def _dictionary(self, dictionary_id: int) -> bytes | None:
+        with self._lock:
+            cached = self._dictionaries.get(dictionary_id)
+        if cached is not None:
+            return cached
+        # 其他 worker 可能刚训练出新字典：按需回库加载。
+        loaded = self._dictionary_loader(dictionary_id)
+        if loaded is not None:
+            with self._lock:
+                self._dictionaries[dictionary_id] = loaded
+        return loaded
+
+
+def train_dictionary(
+    algorithm: str,
+    samples: Iterable[str],
+    *,
+    dict_size: int = DEFAULT_DICTIONARY_BYTES,
+) -> bytes:
+    """基于本部署的真实快照训练压缩字典。"""
+
+    encoded = [sample.encode("utf-8") for sample in samples if sample]
+    if not encoded:
+        raise StorageCodecError("没有可用于训练字典的样本")
+
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise StorageCodecError("压缩算法不可用：zstd")
+        return zstandard.train_dictionary(dict_size, encoded).as_bytes()
+    if algorithm == "zlib":
+        return _build_zlib_dictionary(encoded, dict_size=min(dict_size, 32 * 1024))
+    raise StorageCodecError(f"压缩算法不可用：{algorithm}")
+
+
+def _build_zlib_dictionary(samples: list[bytes], *, dict_size: int) -> bytes:
+    # zlib 没有训练器：统计样本中高频出现的 JSON 键/短字符串片段，按“频次 × 长度”
+    # 挑选收益最高的片段拼成预置字典。zlib 对越靠近字典末尾的内容引用距离越短，
+    # 因此收益最高的片段放在最后。
+    scores: Counter[bytes] = Counter()
+    for sample in samples:
+        text = sample.decode("utf-8", errors="ignore")
+        seen = {match.group(0) for match in _TOKEN_RE.finditer(text)}
+        for token in seen:
+            scores[token.encode("utf-8")] += 1
+
+    ranked = sorted(
+        (token for token, count in scores.items() if count > 1),
+        key=lambda token: scores[token] * len(token),
+        reverse=True,
+    )
+    picked: list[bytes] = []
+    total = 0
+    for token in ranked:
+        if total + len(token) > dict_size:
+            continue
+        picked.append(token)
+        total += len(token)
+    if not picked:
+        # 样本太少没有重复片段：退化为直接拿样本尾部作字典。
+        joined = b"".join(samples)
+        return joined[-dict_size:]
+    picked.reverse()
+    return b"".join(picked)
+
+
+def _compress(algorithm: str, raw: bytes, dictionary: bytes | None) -> bytes:
+    if algorithm == "zlib":
+        if dictionary is None:
+            return zlib.compress(raw, _ZLIB_LEVEL)
+        compressor = zlib.compressobj(_ZLIB_LEVEL, zdict=dictionary)
+        return compressor.compress(raw) + compressor.flush()
+    assert zstandard is not None
+    zstd_dict = None if dictionary is None else zstandard.ZstdCompressionDict(dictionary)
+    return zstandard.ZstdCompressor(level=_ZSTD_LEVEL, dict_data=zstd_dict).compress(raw)
+
+
+def _decompress(algorithm: str, payload: bytes, dictionary: bytes | None) -> bytes:
+    if algorithm == "zlib":
+        if dictionary is None:
+            return zlib.decompress(payload)
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        return decompressor.decompress(payload) + decompressor.flush()
+    if zstandard is None:
+        raise StorageCodecError("压缩算法不可用：zstd")
+    zstd_dict = None if dictionary is None else zstandard.ZstdCompressionDict(dictionary)
+    return zstandard.ZstdDecompressor(dict_data=zstd_dict).decompress(payload)
@@ -1,30 +1,28 @@
 from __future__ import annotations
 
-import hashlib
-import json
-from collections.abc import Mapping, Sequence
+from bisect import bisect_left
+from collections.abc import Callable, Mapping, Sequence
 from dataclasses import dataclass
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
+from .canonical_json import row_ids, sha256_hex, stable_dumps
+
+if TYPE_CHECKING:
+    from .merkle_index import SectionNode, ToolMerkleIndex
 
-def _stable_dumps(value: Any) -> str:
-    return json.dumps(
-        value,
-        ensure_ascii=False,
-        separators=(",", ":"),
-        sort_keys=True,
-        default=str,
-    )
 
+def hash_tool_snapshot(tool_snapshot: Any) -> tuple[str, str]:
+    """返回工具快照的规范化 JSON 与其 SHA-256；diff 与内容寻址存储共用同一口径。"""
 
-def _sha256_hex(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    canonical = stable_dumps(tool_snapshot)
+    return canonical, sha256_hex(canonical)
 
 
 @dataclass
 class _DiffState:
     remaining: int
     truncated: bool = False
+    match_rows_by_id: bool = True
 
     def take(self) -> bool:
         if self.remaining <= 0:
@@ -38,13 +36,28 @@ def build_tools_diff(
     *,
     server_tools_data: Mapping[str, Any],
     client_tools_data: Mapping[str, Any],
+    server_tool_hashes: Mapping[str, str] | None = None,
+    client_tool_hashes: Mapping[str, str] | None = None,
+    server_merkle: Mapping[str, ToolMerkleIndex] | None = None,
+    client_merkle: Mapping[str, ToolMerkleIndex] | None = None,
     max_diffs: int = 200,
     max_depth: int = 8,
     max_list_items: int = 20,
+    match_rows_by_id: bool = True,
 ) -> dict[str, Any]:
-    """构建“服务端 vs 客户端”的差异信息（不包含敏感字段值，仅结构化路径）。"""
+    """构建“服务端 vs 客户端”的差异信息（不包含敏感字段值，仅结构化路径）。
+
+    `server_tool_hashes` / `client_tool_hashes` 为已知的工具 hash（写入时预计算或已校验），
+    传入后不再重新序列化对应一侧的快照。两侧都有某工具的 Merkle 索引时，按分段、行的 hash
+    自顶向下比较，只深入 hash 不同的节点；对象列表里未变化的行不再逐字段遍历。
+
+    两侧都是以唯一 `id` 标识的行列表（tasks/time_entries/items 等）时按 id 配对，
+    逐行报告 added/removed/moved 及行内字段变化（路径形如 `data.tasks[id=3].title`），
+    中间插入一行不会让后续各行都显示为变化；`max_list_items` 限制每个列表报告的行数。
+    `match_rows_by_id=False` 恢复按下标逐项比较。
+    """
 
-    state = _DiffState(remaining=max_diffs)
+    state = _DiffState(remaining=max_diffs, match_rows_by_id=match_rows_by_id)
 
     tool_ids = set(server_tools_data.keys()) | set(client_tools_data.keys())
     tools: dict[str, Any] = {}
@@ -55,16 +68,27 @@ def build_tools_diff(
         server_snapshot = server_tools_data.get(tool_id)
         client_snapshot = client_tools_data.get(tool_id)
 
-        server_json = _stable_dumps(server_snapshot) if server_snapshot is not None else ""
-        client_json = _stable_dumps(client_snapshot) if client_snapshot is not None else ""
-
-        server_hash = _sha256_hex(server_json) if server_snapshot is not None else None
-        client_hash = _sha256_hex(client_json) if client_snapshot is not None else None
+        server_index = None if server_merkle is None or server_snapshot is None else server_merkle.get(tool_id)
+        client_index = None if client_merkle is None or client_snapshot is None else client_merkle.get(tool_id)
+        server_hash = _resolve_tool_hash(server_snapshot, tool_id, server_tool_hashes, server_index)
+        client_hash = _resolve_tool_hash(client_snapshot, tool_id, client_tool_hashes, client_index)
 
         same = server_hash == client_hash
 
         diff_items: list[dict[str, Any]] = []
-        if not same:
+        if not same and server_index is not None and client_index is not None:
+            changed_tools += 1
+            _diff_tool_by_merkle(
+                state=state,
+                a=server_snapshot,
+                b=client_snapshot,
+                a_index=server_index,
+                b_index=client_index,
+                out=diff_items,
+                max_depth=max_depth,
+                max_list_items=max_list_items,
+            )
+        elif not same:
             changed_tools += 1
             _diff_value(
                 state=state,
@@ -98,6 +122,55 @@ def build_tools_diff(
     }
 
 
+def _resolve_tool_hash(
+    snapshot: Any,
+    tool_id: str,
+    known_hashes: Mapping[str, str] | None,
+    index: ToolMerkleIndex | None,
+) -> str | None:
+    if snapshot is None:
+        return None
+    if known_hashes is not None and tool_id in known_hashes:
+        return known_hashes[tool_id]
+    if index is not None:
+        return index.tool_hash
+    return hash_tool_snapshot(snapshot)[1]
+
+
+def build_tools_hash_diff(
+    *,
+    server_tool_hashes: Mapping[str, str],
+    client_tool_hashes: Mapping[str, str],
+) -> dict[str, Any]:
+    """只比较工具 hash 的差异信息（结构同 `build_tools_diff`，不含 diff_items）。
+
+    用于 v3 协议中服务端拿不到客户端工具内容的场景。
+    """
+
+    tools: dict[str, Any] = {}
+    changed_tools = 0
+    for tool_id in sorted(set(server_tool_hashes) | set(client_tool_hashes)):
+        server_hash = server_tool_hashes.get(tool_id)
+        client_hash = client_tool_hashes.get(tool_id)
+        same = server_hash == client_hash
+        if not same:
+            changed_tools += 1
+        tools[tool_id] = {
+            "same": same,
+            "server_hash": server_hash,
+            "client_hash": client_hash,
+            "diff_items": [],
+        }
+    return {
+        "summary": {
+            "changed_tools": changed_tools,
+            "diff_items": 0,
+            "truncated": False,
+        },
+        "tools": tools,
+    }
+
+
 def _diff_value(
     *,
     state: _DiffState,
@@ -171,6 +244,24 @@ def _diff_value(
         return
 
     if isinstance(a, Sequence) and not isinstance(a, (str, bytes)):
+        a_ids = row_ids(a) if state.match_rows_by_id else None
+        b_ids = None if a_ids is None else row_ids(b)
+        if a_ids is not None and b_ids is not None and (a_ids or b_ids):
+            _diff_rows_by_id(
+                state=state,
+                a=a,
+                b=b,
+                a_ids=a_ids,
+                b_ids=b_ids,
+                same_row=lambda i, j: a[i] == b[j],
+                path=path,
+                out=out,
+                depth=depth,
+                max_depth=max_depth,
+                max_list_items=max_list_items,
+            )
+            return
+
         len_a = len(a)
         len_b = len(b)
         if len_a != len_b and state.take():
@@ -207,6 +298,257 @@ def _diff_value(
         out.append({"path": path, "change": "value_changed"})
 
 
+def _diff_tool_by_merkle(
+    *,
+    state: _DiffState,
+    a: Any,
+    b: Any,
+    a_index: ToolMerkleIndex,
+    b_index: ToolMerkleIndex,
+    out: list[dict[str, Any]],
+    max_depth: int,
+    max_list_items: int,
+) -> None:
+    if _same_section_layout(a_index, b_index):
+        before = len(out)
+        for path in sorted(set(a_index.sections) | set(b_index.sections)):
+            a_node = a_index.sections.get(path)
+            b_node = b_index.sections.get(path)
+            if a_node is not None and b_node is not None and a_node.hash == b_node.hash:
+                continue
+            _diff_section(
+                state=state,
+                a=_lookup(a, path),
+                b=_lookup(b, path),
+                a_node=a_node,
+                b_node=b_node,
+                path=path,
+                out=out,
+                max_depth=max_depth,
+                max_list_items=max_list_items,
+            )
+            if state.truncated:
+                return
+        if len(out) > before:
+            return
+    # 差异不落在分段上（如空对象与缺失、顶层值类型变化）：退回整体比较
+    _diff_value(
+        state=state,
+        a=a,
+        b=b,
+        path="",
+        out=out,
+        depth=0,
+        max_depth=max_depth,
+        max_list_items=max_list_items,
+    )
+
+
+def _diff_section(
+    *,
+    state: _DiffState,
+    a: Any,
+    b: Any,
+    a_node: SectionNode | None,
+    b_node: SectionNode | None,
+    path: tuple[str, ...],
+    out: list[dict[str, Any]],
+    max_depth: int,
+    max_list_items: int,
+) -> None:
+    label = ".".join(path)
+    if a_node is None or b_node is None:
+        if state.take():
+            out.append({"path": label, "change": "added" if a_node is None else "removed"})
+        return
+    if (
+        a_node.row_hashes is None
+        or b_node.row_hashes is None
+        or len(path) >= max_depth
+    ):
+        _diff_value(
+            state=state,
+            a=a,
+            b=b,
+            path=label,
+            out=out,
+            depth=len(path),
+            max_depth=max_depth,
+            max_list_items=max_list_items,
+        )
+        return
+
+    a_rows = a_node.row_hashes
+    b_rows = b_node.row_hashes
+    if state.match_rows_by_id and a_node.row_ids is not None and b_node.row_ids is not None:
+        _diff_rows_by_id(
+            state=state,
+            a=a,
+            b=b,
+            a_ids=a_node.row_ids,
+            b_ids=b_node.row_ids,
+            same_row=lambda i, j: a_rows[i] == b_rows[j],
+            path=label,
+            out=out,
+            depth=len(path),
+            max_depth=max_depth,
+            max_list_items=max_list_items,
+        )
+        return
+    if len(a_rows) != len(b_rows) and state.take():
+        out.append(
+            {
+                "path": _join(label, "length"),
+                "change": "length_changed",
+                "server": len(a_rows),
+                "client": len(b_rows),
+            }
+        )
+    changed_rows = 0
+    for i in range(min(len(a_rows), len(b_rows))):
+        if a_rows[i] == b_rows[i]:
+            continue
+        if changed_rows >= max_list_items:
+            if state.take():
+                out.append({"path": label, "change": "list_truncated"})
+            return
+        changed_rows += 1
+        _diff_value(
+            state=state,
+            a=a[i],
+            b=b[i],
+            path=_join(label, str(i)),
+            out=out,
+            depth=len(path) + 1,
+            max_depth=max_depth,
+            max_list_items=max_list_items,
+        )
+        if state.truncated:
+            return
+
+
+def _diff_rows_by_id(
+    *,
+    state: _DiffState,
+    a: Sequence[Any],
+    b: Sequence[Any],
+    a_ids: Sequence[Any],
+    b_ids: Sequence[Any],
+    same_row: Callable[[int, int], bool],
+    path: str,
+    out: list[dict[str, Any]],
+    depth: int,
+    max_depth: int,
+    max_list_items: int,
+) -> None:
+    """按 id 配对两侧的行：各建一次 id -> 下标的字典，只展开内容不同的行。
+
+    相对顺序被打乱的行取“保持原顺序的最长行序列”之外的部分报告为 moved，
+    单独插入/删除一行不会让其后的行都被视为移动。
+    """
+
+    a_pos = {row_id: i for i, row_id in enumerate(a_ids)}
+    b_pos = {row_id: j for j, row_id in enumerate(b_ids)}
+    in_order = _in_order_positions([a_pos[row_id] for row_id in b_ids if row_id in a_pos])
+
+    reported_rows = 0
+
+    def report_row() -> bool:
+        nonlocal reported_rows
+        if reported_rows >= max_list_items:
+            if state.take():
+                out.append({"path": path, "change": "list_truncated"})
+            return False
+        reported_rows += 1
+        return True
+
+    for i, row_id in enumerate(a_ids):
+        if row_id in b_pos:
+            continue
+        if not report_row() or not state.take():
+            return
+        out.append({"path": _row_path(path, row_id), "change": "removed", "server_index": i})
+
+    for j, row_id in enumerate(b_ids):
+        i = a_pos.get(row_id)
+        if i is None:
+            if not report_row() or not state.take():
+                return
+            out.append({"path": _row_path(path, row_id), "change": "added", "client_index": j})
+            continue
+        moved = i not in in_order
+        changed = not same_row(i, j)
+        if not moved and not changed:
+            continue
+        if not report_row():
+            return
+        row_path = _row_path(path, row_id)
+        if moved:
+            if not state.take():
+                return
+            out.append({"path": row_path, "change": "moved", "server_index": i, "client_index": j})
+        if changed:
+            _diff_value(
+                state=state,
+                a=a[i],
+                b=b[j],
+                path=row_path,
+                out=out,
+                depth=depth + 1,
+                max_depth=max_depth,
+                max_list_items=max_list_items,
+            )
+            if state.truncated:
+                return
+
+
+def _in_order_positions(positions: list[int]) -> set[int]:
+    """最长递增子序列（耐心排序，O(n log n)）；已有序时直接返回全部。"""
+
+    if all(positions[k] < positions[k + 1] for k in range(len(positions) - 1)):
+        return set(positions)
+    tail_values: list[int] = []
+    tail_indexes: list[int] = []
+    previous = [-1] * len(positions)
+    for k, value in enumerate(positions):
+        slot = bisect_left(tail_values, value)
+        if slot:
+            previous[k] = tail_indexes[slot - 1]
+        if slot == len(tail_values):
+            tail_values.append(value)
+            tail_indexes.append(k)
+        else:
+            tail_values[slot] = value
+            tail_indexes[slot] = k
+    members: set[int] = set()
+    k = tail_indexes[-1] if tail_indexes else -1
+    while k >= 0:
+        members.add(positions[k])
+        k = previous[k]
+    return members
+
+
+def _row_path(path: str, row_id: Any) -> str:
+    return f"{path}[id={row_id}]"
+
+
+def _same_section_layout(a_index: ToolMerkleIndex, b_index: ToolMerkleIndex) -> bool:
+    # 同一个顶层键在一侧是对象（拆成子分段）、另一侧是叶子分段时，分段无法一一对应
+    a_leaves = {path[0] for path in a_index.sections if len(path) == 1}
+    b_leaves = {path[0] for path in b_index.sections if len(path) == 1}
+    a_containers = {path[0] for path in a_index.sections if len(path) > 1}
+    b_containers = {path[0] for path in b_index.sections if len(path) > 1}
+    return not (a_leaves & b_containers or b_leaves & a_containers)
+
+
+def _lookup(value: Any, path: tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(value, Mapping):
+            return None
+        value = value.get(key)
+    return value
+
+
 def _join(prefix: str, key: str) -> str:
     if not prefix:
         return key
@@ -3,6 +3,8 @@ from __future__ import annotations
 from collections.abc import Mapping, Sequence
 from typing import Any
 
+_UPDATED_AT_KEYS = ("updated_at", "updatedAt", "updated_at_ms", "updatedAtMs")
+
 
 def _read_int_ms(value: Any) -> int | None:
     if value is None:
@@ -23,6 +25,16 @@ def _read_int_ms(value: Any) -> int | None:
     return None
 
 
+def read_updated_at_ms(row: Mapping[str, Any]) -> int:
+    """单个实体自身的 `updated_at`：按 `_UPDATED_AT_KEYS` 顺序取第一个有效值，都缺失时为 0。"""
+
+    for key in _UPDATED_AT_KEYS:
+        ms = _read_int_ms(row.get(key))
+        if ms is not None:
+            return ms
+    return 0
+
+
 def compute_latest_updated_at_ms(tools_data: Mapping[str, Any]) -> int:
     """从 tools_data 全量快照里扫描 `updated_at`，取最大毫秒时间戳。
 
@@ -36,7 +48,7 @@ def compute_latest_updated_at_ms(tools_data: Mapping[str, Any]) -> int:
         current = stack.pop()
         if isinstance(current, Mapping):
             for key, value in current.items():
-                if key in ("updated_at", "updatedAt", "updated_at_ms", "updatedAtMs"):
+                if key in _UPDATED_AT_KEYS:
                     ms = _read_int_ms(value)
                     if ms is not None and ms > max_ms:
                         max_ms = ms
@@ -54,6 +66,45 @@ def is_tool_snapshot_empty(snapshot: Mapping[str, Any]) -> bool:
     return _is_deep_empty(data)
 
 
+def scan_tool_snapshot(snapshot: Any) -> tuple[int, bool]:
+    """一轮遍历同时得到单个工具快照的最大 `updated_at` 与是否为空。
+
+    结果分别等同 `compute_latest_updated_at_ms(snapshot)` 与 `is_tool_snapshot_empty(snapshot)`；
+    非对象的工具值按“空”处理，与 `is_all_tools_empty` 跳过它们一致。
+    与前者一样用显式栈遍历，嵌套再深也不会触发递归上限。
+    """
+
+    is_object = isinstance(snapshot, Mapping)
+    has_data = is_object and snapshot.get("data") is not None
+    data_has_content = False
+    max_ms = 0
+    # (值, 是否处在从 `data` 逐层经由对象向下的路径上)：只有这条路径上的值决定 `_is_deep_empty(data)`
+    stack: list[tuple[Any, bool]] = [(snapshot, False)]
+
+    while stack:
+        current, in_data = stack.pop()
+        if isinstance(current, Mapping):
+            for key, value in current.items():
+                if key in _UPDATED_AT_KEYS:
+                    ms = _read_int_ms(value)
+                    if ms is not None and ms > max_ms:
+                        max_ms = ms
+                if current is snapshot:
+                    stack.append((value, key == "data" and value is not None))
+                else:
+                    stack.append((value, in_data))
+        elif isinstance(current, Sequence) and not isinstance(current, (str, bytes)):
+            if in_data and current:
+                data_has_content = True
+            stack.extend((item, False) for item in current)
+        elif in_data and not _is_deep_empty(current):
+            data_has_content = True
+
+    if not is_object:
+        return max_ms, True
+    return max_ms, has_data and not data_has_content
+
+
 def is_all_tools_empty(tools_data: Mapping[str, Any]) -> bool:
     if not tools_data:
         return True
@@ -142,3 +193,40 @@ def decide_sync_v2_by_revision(
         server_is_empty=server_is_empty,
         server_updated_at_ms=server_updated_at_ms,
     )
+
+
+def decide_tool_sync_by_revision(
+    *,
+    same_content: bool,
+    client_has_tool: bool,
+    client_tool_is_empty: bool,
+    client_last_server_revision: int | None,
+    client_tool_updated_at_ms: int,
+    server_has_tool: bool,
+    server_tool_deleted: bool,
+    server_tool_is_empty: bool,
+    server_tool_revision: int,
+    server_tool_updated_at_ms: int,
+) -> str:
+    """单个工具的同步方向，规则与 `decide_sync_v2_by_revision` 一致，只是游标换成工具自己的 revision。
+
+    服务端删除的工具（墓碑）晚于客户端游标时以服务端为准，让客户端同步删除。
+    """
+
+    if same_content:
+        return "noop"
+
+    if server_tool_deleted and client_has_tool:
+        last_revision = int(client_last_server_revision or 0)
+        return "use_server" if server_tool_revision > last_revision else "use_client"
+
+    return decide_sync_v2_by_revision(
+        client_has_snapshot=client_has_tool,
+        client_is_empty=client_tool_is_empty,
+        client_last_server_revision=client_last_server_revision,
+        client_updated_at_ms=client_tool_updated_at_ms,
+        server_has_snapshot=server_has_tool,
+        server_is_empty=server_tool_is_empty,
+        server_revision=server_tool_revision,
+        server_updated_at_ms=server_tool_updated_at_ms,
+    )
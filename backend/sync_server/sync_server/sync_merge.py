@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from .canonical_json import row_ids
+from .json_patch import escape_pointer_token
+from .sync_logic import read_updated_at_ms
+
+# 区分“键/行不存在”与 JSON null
+_MISSING: Any = object()
+
+
+class MergeConflictError(ValueError):
+    """同一个非行字段被两端改成了不同的值，无法自动合并。"""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(f"{path or '/'} 在两端都被修改")
+        self.path = path
+
+
+@dataclass(frozen=True)
+class MergeResult:
+    tools_data: dict[str, Any]
+    # 两端都改过、按 updated_at 取较新一方的行数
+    lww_rows: int
+
+
+def merge_tools_data(
+    *,
+    base: Mapping[str, Any],
+    server: Mapping[str, Any],
+    client: Mapping[str, Any],
+) -> MergeResult:
+    """以 `base`（客户端上次同步的服务端版本）为公共祖先，三方合并服务端与客户端快照。
+
+    - 只有一端改动的值直接取改动方；
+    - 以 `id` 标识的行列表（tasks/time_entries/items 等）按 id 建索引逐行合并：
+      新增、删除各自保留，两端都改过的行按 `updated_at` 取较新者（相同时以服务端为准），
+      一端删除、另一端修改的行保留修改；
+    - 其它两端改成不同值的字段抛出 `MergeConflictError`，由调用方回退到整体决策。
+
+    每个行列表只建一次字典索引，耗时与行数线性相关；返回结果与三个输入共享行对象，不要原地修改。
+    """
+
+    merger = _Merger()
+    merged = merger.merge(base, server, client, "")
+    return MergeResult(tools_data=merged, lww_rows=merger.lww_rows)
+
+
+class _Merger:
+    def __init__(self) -> None:
+        self.lww_rows = 0
+
+    def merge(self, base: Any, server: Any, client: Any, path: str) -> Any:
+        if server == client:
+            return server
+        if client == base:
+            return server
+        if server == base:
+            return client
+        if isinstance(server, Mapping) and isinstance(client, Mapping):
+            return self._merge_objects(base if isinstance(base, Mapping) else {}, server, client, path)
+        server_index = _row_index(server)
+        client_index = _row_index(client)
+        if server_index is not None and client_index is not None:
+            base_index = _row_index(base) if base is not _MISSING else {}
+            if base_index is not None:
+                return self._merge_rows(base_index, server, server_index, client, client_index)
+        raise MergeConflictError(path)
+
+    def _merge_objects(
+        self,
+        base: Mapping[str, Any],
+        server: Mapping[str, Any],
+        client: Mapping[str, Any],
+        path: str,
+    ) -> dict[str, Any]:
+        merged: dict[str, Any] = {}
+        for key in (*server.keys(), *(key for key in client.keys() if key not in server)):
+            value = self.merge(
+                base.get(key, _MISSING),
+                server.get(key, _MISSING),
+                client.get(key, _MISSING),
+                f"{path}/{escape_pointer_token(str(key))}",
+            )
+            if value is not _MISSING:
+                merged[key] = value
+        return merged
+
+    def _merge_rows(
+        self,
+        base_index: dict[Any, Mapping[str, Any]],
+        server_rows: list[Any],
+        server_index: dict[Any, Mapping[str, Any]],
+        client_rows: list[Any],
+        client_index: dict[Any, Mapping[str, Any]],
+    ) -> list[Any]:
+        # 先按服务端顺序输出，再追加只在客户端出现的行
+        merged: list[Any] = []
+        for row in server_rows:
+            row_id = row["id"]
+            chosen = self._merge_row(
+                base_index.get(row_id, _MISSING),
+                row,
+                client_index.get(row_id, _MISSING),
+            )
+            if chosen is not _MISSING:
+                merged.append(chosen)
+        for row in client_rows:
+            row_id = row["id"]
+            if row_id in server_index:
+                continue
+            chosen = self._merge_row(base_index.get(row_id, _MISSING), _MISSING, row)
+            if chosen is not _MISSING:
+                merged.append(chosen)
+        return merged
+
+    def _merge_row(self, base: Any, server: Any, client: Any) -> Any:
+        if server is _MISSING:
+            # 服务端删除而客户端未改 -> 删除；客户端新增或改过 -> 保留
+            return _MISSING if client == base else client
+        if client is _MISSING:
+            return _MISSING if server == base else server
+        if server == client or client == base:
+            return server
+        if server == base:
+            return client
+        self.lww_rows += 1
+        return client if read_updated_at_ms(client) > read_updated_at_ms(server) else server
+
+
+def _row_index(value: Any) -> dict[Any, Mapping[str, Any]] | None:
+    """`value` 是以 `id` 唯一标识的行列表时返回 id -> 行，否则返回 None；判定与 diff 的 `row_ids` 一致。"""
+
+    ids = row_ids(value)
+    if ids is None:
+        return None
+    return dict(zip(ids, value))
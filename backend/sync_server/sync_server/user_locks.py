@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class UserLockManager:
+    """进程内按用户划分的互斥锁。
+
+    同一用户的同步在进程内排队执行，不同用户互不等待；锁对象按引用计数创建与回收，
+    不会随用户数无限增长。跨进程（多 worker）的并发由提交时的 revision 校验兜底。
+    """
+
+    def __init__(self) -> None:
+        self._mutex = threading.Lock()
+        # user_id -> (锁, 持有或等待该锁的调用数)
+        self._locks: dict[str, tuple[threading.Lock, int]] = {}
+
+    @contextmanager
+    def hold(self, user_id: str) -> Iterator[None]:
+        with self._mutex:
+            lock, refs = self._locks.get(user_id, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._locks[user_id] = (lock, refs + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._mutex:
+                _, refs = self._locks[user_id]
+                if refs <= 1:
+                    del self._locks[user_id]
+                else:
+                    self._locks[user_id] = (lock, refs - 1)
+
+    def active_users(self) -> int:
+        with self._mutex:
+            return len(self._locks)
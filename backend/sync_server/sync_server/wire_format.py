@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import copy
+import json
+from collections.abc import Callable, Coroutine, Mapping
+from typing import Any
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+from .json_response import RawJson, RawJsonResponse
+
+try:  # msgpack 为可选依赖：未安装时只提供 JSON。
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def is_msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def is_msgpack_media_type(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    return content_type.split(";", 1)[0].strip().lower() in _MSGPACK_MEDIA_TYPES
+
+
+def wants_msgpack(accept: str | None) -> bool:
+    """`Accept` 里显式列出 MessagePack 且权重高于 JSON 时才切换，缺省/`*/*` 仍返回 JSON。"""
+
+    if not accept or msgpack is None:
+        return False
+    msgpack_weight = 0.0
+    json_weight = 0.0
+    for item in accept.split(","):
+        media_type, _, params = item.strip().partition(";")
+        media_type = media_type.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if media_type in _MSGPACK_MEDIA_TYPES:
+            msgpack_weight = max(msgpack_weight, weight)
+        elif media_type == "application/json":
+            json_weight = max(json_weight, weight)
+    return msgpack_weight > 0 and msgpack_weight >= json_weight
+
+
+def packb(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    # 与 JSON 语义保持一致：键只能是字符串，不接受二进制/扩展类型
+    return msgpack.unpackb(data, raw=False, strict_map_key=True)
+
+
+class _MsgpackRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            try:
+                self._json = unpackb(await self.body())
+            except (ValueError, TypeError, msgpack.UnpackException) as exc:
+                raise HTTPException(status_code=400, detail={"message": "请求体不是合法的 MessagePack"}) from exc
+        return self._json
+
+
+class MsgpackResponse(Response):
+    """直接把（已转为 JSON 兼容对象的）响应内容编码为 MessagePack，不经过 JSON 文本。"""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+
+class NegotiatedRoute(APIRoute):
+    """按 Content-Type/Accept 在 JSON 与 MessagePack 之间切换的路由。
+
+    MessagePack 请求体直接解码为对象交给 Pydantic 校验，不经过 JSON 文本；
+    `Accept: application/msgpack` 时改用以 `MsgpackResponse` 为响应类的处理函数，
+    响应模型/字典直接编码为 MessagePack。接口自己返回的 `RawJsonResponse` 只解析其中
+    预序列化的 `RawJson` 片段（快照以 JSON 文本存储），外层字段直接编码。错误响应始终为 JSON。
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        json_handler = super().get_route_handler()
+        msgpack_handler: Callable[[Request], Coroutine[Any, Any, Response]] | None = None
+        if msgpack is not None:
+            msgpack_route = copy.copy(self)
+            msgpack_route.response_class = MsgpackResponse
+            msgpack_handler = APIRoute.get_route_handler(msgpack_route)
+
+        async def route_handler(request: Request) -> Response:
+            if is_msgpack_media_type(request.headers.get("content-type")):
+                if msgpack_handler is None:
+                    raise HTTPException(status_code=415, detail={"message": "服务端未启用 MessagePack"})
+                request = _MsgpackRequest(_with_json_content_type(request.scope), request.receive)
+            if msgpack_handler is None:
+                return await json_handler(request)
+            if wants_msgpack(request.headers.get("accept")):
+                response = _to_msgpack_response(await msgpack_handler(request))
+            else:
+                response = await json_handler(request)
+            # 同一 URL 按 Accept 返回不同格式，JSON 响应也要声明，避免缓存串用
+            _add_vary_accept(response)
+            return response
+
+        return route_handler
+
+
+def _with_json_content_type(scope: dict[str, Any]) -> dict[str, Any]:
+    # FastAPI 只对 JSON 类型的请求调用 `request.json()`，这里改写头部让它走到 `_MsgpackRequest.json`
+    headers = [(name, value) for name, value in scope["headers"] if name.lower() != b"content-type"]
+    return {**scope, "headers": [*headers, (b"content-type", b"application/json")]}
+
+
+def _to_msgpack_value(value: Any) -> Any:
+    # 只有预序列化的快照片段需要解析，外层元数据原样交给 msgpack
+    if isinstance(value, RawJson):
+        return json.loads(value.text)
+    if isinstance(value, Mapping):
+        return {key: _to_msgpack_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_msgpack_value(item) for item in value]
+    return value
+
+
+def _to_msgpack_response(response: Response) -> Response:
+    # 只有接口直接返回的 `RawJsonResponse` 需要转换；响应模型/字典已由 `MsgpackResponse` 编码
+    if not isinstance(response, RawJsonResponse):
+        return response
+
+    converted = MsgpackResponse(
+        content=_to_msgpack_value(response.content),
+        status_code=response.status_code,
+        background=response.background,
+    )
+    for name, value in response.headers.items():
+        if name in ("content-length", "content-type"):
+            continue
+        if name == "etag" and not value.startswith("W/"):
+            # 表示形式不同，强 ETag 降为弱 ETag，If-None-Match 判定不受影响
+            value = "W/" + value
+        converted.headers.append(name, value)
+    return converted
+
+
+def _add_vary_accept(response: Response) -> None:
+    vary = response.headers.get("vary")
+    if vary is None:
+        response.headers["vary"] = "Accept"
+    elif "accept" not in (item.strip().lower() for item in vary.split(",")):
+        response.headers["vary"] = f"{vary}, Accept"
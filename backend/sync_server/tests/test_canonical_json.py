@@ -0,0 +1,27 @@
+from sync_server.canonical_json import row_ids, sha256_hex, stable_dumps
+from sync_server.merkle_index import index_tool_snapshot
+from sync_server.sync_diff import hash_tool_snapshot
+
+
+def test_stable_dumps_sorts_keys_and_keeps_non_ascii() -> None:
+    assert stable_dumps({"b": 1, "a": ["周报", None]}) == '{"a":["周报",null],"b":1}'
+
+
+def test_snapshot_hash_and_merkle_index_share_canonical_form() -> None:
+    tool = {"version": 1, "data": {"tasks": [{"id": 2, "title": "周报"}, {"id": 1}]}}
+    body, digest = hash_tool_snapshot(tool)
+    assert body == stable_dumps(tool)
+    assert digest == sha256_hex(body)
+    indexed_body, index = index_tool_snapshot(tool)
+    assert indexed_body == body
+    assert index.tool_hash == digest
+
+
+def test_row_ids_requires_unique_scalar_ids() -> None:
+    assert row_ids([]) == ()
+    assert row_ids([{"id": 1}, {"id": "a"}]) == (1, "a")
+    assert row_ids([{"id": 1}, {"id": 1}]) is None
+    assert row_ids([{"id": True}]) is None
+    assert row_ids([{"id": [1]}]) is None
+    assert row_ids([{"title": "x"}]) is None
+    assert row_ids({"id": 1}) is None
@@ -131,6 +131,60 @@ def test_dashboard_can_update_user_profile() -> None:
         assert body["user"]["is_enabled"] is True
 
 
+def test_dashboard_users_list_is_paginated_and_filterable() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        store = app.state.store
+
+        for index in range(5):
+            store.touch_user(user_id=f"user_{index}", now_ms=1000 + index)
+        store.upsert_user_profile(
+            user_id="admin_x",
+            display_name="管理员",
+            notes="",
+            is_enabled=False,
+            now_ms=500,
+        )
+        _seed_work_log_snapshot(client, user_id="user_2")
+
+        seen: list[str] = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            body = client.get("/dashboard/users", params=params).json()
+            seen.extend(item["user_id"] for item in body["users"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+        assert seen[0] == "user_2"
+        assert seen[1:] == ["user_4", "user_3", "user_1", "user_0", "admin_x"]
+
+        disabled = client.get("/dashboard/users", params={"is_enabled": "false"}).json()["users"]
+        assert [item["user_id"] for item in disabled] == ["admin_x"]
+
+        with_snapshot = client.get("/dashboard/users", params={"has_snapshot": "true"}).json()["users"]
+        assert [item["user_id"] for item in with_snapshot] == ["user_2"]
+        assert with_snapshot[0]["snapshot"]["tool_ids"] == ["work_log"]
+
+        ranged = client.get(
+            "/dashboard/users",
+            params={"last_seen_from_ms": 1001, "last_seen_to_ms": 1003},
+        ).json()["users"]
+        assert [item["user_id"] for item in ranged] == ["user_3", "user_1"]
+
+        by_name = client.get("/dashboard/users", params={"q": "管理"}).json()["users"]
+        assert [item["user_id"] for item in by_name] == ["admin_x"]
+        assert client.get("/dashboard/users", params={"q": "user_"}).json()["users"][0]["user_id"] == "user_2"
+        assert client.get("/dashboard/users", params={"q": "user%"}).json()["users"] == []
+
+        bad = client.get("/dashboard/users", params={"cursor": "not-a-cursor"})
+        assert bad.status_code == 400
+        assert bad.json()["message"] == "cursor 无效"
+
+
 def test_dashboard_tool_update_creates_new_revision_and_record() -> None:
     with tempfile.TemporaryDirectory() as tmp:
         app = create_app(db_path=f"{tmp}/sync.db")
@@ -182,6 +236,50 @@ def test_dashboard_tool_update_creates_new_revision_and_record() -> None:
         assert "dashboard_update" in decisions
 
 
+def test_dashboard_detail_supports_conditional_get() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        store = app.state.store
+
+        _seed_work_log_snapshot(client, user_id="u1")
+
+        user_resp = client.get("/dashboard/users/u1")
+        tool_resp = client.get("/dashboard/users/u1/tools/work_log")
+        user_etag = user_resp.headers["etag"]
+        tool_etag = tool_resp.headers["etag"]
+        assert user_resp.headers["cache-control"] == "private, no-cache"
+
+        # 304 不读取快照正文：缓存命中/未命中计数都不变
+        before = store.snapshot_cache_stats()
+        assert client.get("/dashboard/users/u1", headers={"If-None-Match": user_etag}).status_code == 304
+        assert (
+            client.get("/dashboard/users/u1/tools/work_log", headers={"If-None-Match": tool_etag}).status_code
+            == 304
+        )
+        after = store.snapshot_cache_stats()
+        assert (after.hits, after.misses) == (before.hits, before.misses)
+
+        # 修改资料只影响用户详情的 ETag
+        client.patch("/dashboard/users/u1", json={"display_name": "主账号"})
+        changed = client.get("/dashboard/users/u1", headers={"If-None-Match": user_etag})
+        assert changed.status_code == 200
+        assert changed.json()["user"]["display_name"] == "主账号"
+        assert (
+            client.get("/dashboard/users/u1/tools/work_log", headers={"If-None-Match": tool_etag}).status_code
+            == 304
+        )
+
+        # 写入新 revision 后工具 ETag 失效
+        client.put(
+            "/dashboard/users/u1/tools/work_log",
+            json={"version": 1, "data": tool_resp.json()["tool"]["data"], "message": "dashboard 保存"},
+        )
+        refreshed = client.get("/dashboard/users/u1/tools/work_log", headers={"If-None-Match": tool_etag})
+        assert refreshed.status_code == 200
+        assert refreshed.headers["etag"] != tool_etag
+
+
 def test_dashboard_snapshot_update_allows_json_management() -> None:
     with tempfile.TemporaryDirectory() as tmp:
         app = create_app(db_path=f"{tmp}/sync.db")
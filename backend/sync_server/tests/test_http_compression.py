@@ -0,0 +1,84 @@
+import gzip
+import json
+import tempfile
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.http_compression import choose_response_encoding, supported_encodings
+from sync_server.main import create_app
+
+
+def _sync_body(task_count: int = 200) -> dict[str, Any]:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000000,
+        "client_state": {"last_server_revision": None, "client_is_empty": False},
+        "tools_data": {
+            "work_log": {
+                "version": 1,
+                "data": {
+                    "tasks": [
+                        {"id": i, "title": f"整理周报 #{i}", "updated_at": 1730000000000 + i}
+                        for i in range(task_count)
+                    ]
+                },
+            }
+        },
+    }
+
+
+def test_gzip_request_body_is_decoded_and_response_is_negotiated() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        body = _sync_body()
+
+        resp = client.post(
+            "/sync/v2",
+            content=gzip.compress(json.dumps(body).encode("utf-8")),
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+        assert resp.status_code == 200
+        assert resp.json()["decision"] == "use_client"
+        assert app.state.store.get_snapshot("u1").tools_data == body["tools_data"]
+
+        pulled = {**body, "client_state": {"last_server_revision": 0, "client_is_empty": True}, "tools_data": {}}
+        raw = client.post("/sync/v2", json=pulled, headers={"Accept-Encoding": "gzip"})
+        assert raw.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in raw.headers["vary"]
+        assert raw.json()["tools_data"] == body["tools_data"]
+
+        plain = client.post("/sync/v2", json=pulled, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+
+        # 小响应不压缩
+        assert "content-encoding" not in client.get("/healthz", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_compressed_request_body_is_capped_and_validated() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db", max_request_bytes=64 * 1024)
+        client = TestClient(app)
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+        bomb = gzip.compress(b" " * (16 * 1024 * 1024))
+        assert len(bomb) < 64 * 1024
+        resp = client.post("/sync/v2", content=bomb, headers=headers)
+        assert resp.status_code == 413
+        assert resp.json()["message"] == "解压后的请求体超过大小上限"
+
+        broken = client.post("/sync/v2", content=b"not gzip", headers=headers)
+        assert broken.status_code == 400
+
+        unsupported = client.post("/sync/v2", content=b"{}", headers={**headers, "Content-Encoding": "br"})
+        assert unsupported.status_code == 415
+        assert app.state.store.get_snapshot("u1") is None
+
+
+def test_choose_response_encoding_honours_q_values() -> None:
+    assert choose_response_encoding(None) is None
+    assert choose_response_encoding("gzip;q=0, identity") is None
+    assert choose_response_encoding("br, gzip;q=0.5") == "gzip"
+    assert choose_response_encoding("*") == supported_encodings()[0]
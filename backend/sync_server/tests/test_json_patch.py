@@ -0,0 +1,69 @@
+import copy
+
+import pytest
+
+from sync_server.json_patch import JsonPatchError, apply_patch, make_patch, touched_root_keys
+
+
+def test_make_patch_roundtrip_and_list_insert_is_single_op() -> None:
+    source = {
+        "work_log": {
+            "version": 1,
+            "data": {
+                "tasks": [{"id": i, "title": f"t{i}", "updated_at": i} for i in range(50)],
+                "flags": {"a/b": 1, "c~d": True},
+            },
+        }
+    }
+    target = copy.deepcopy(source)
+    target["work_log"]["data"]["tasks"].insert(0, {"id": 99, "title": "new", "updated_at": 99})
+    target["work_log"]["data"]["flags"]["a/b"] = 2
+    target["work_log"]["data"]["flags"]["c~d"] = 1
+
+    patch = make_patch(source, target)
+    assert len(patch) == 3
+    assert {"op": "add", "path": "/work_log/data/tasks/0", "value": target["work_log"]["data"]["tasks"][0]} in patch
+
+    assert apply_patch(copy.deepcopy(source), patch) == target
+    # bool -> int 也必须被识别为变更
+    assert apply_patch(copy.deepcopy(source), patch)["work_log"]["data"]["flags"]["c~d"] is not True
+
+
+def test_apply_patch_supports_rfc6902_ops() -> None:
+    doc = {"a": [1, 2, 3], "b": {"c": "x"}}
+    patched = apply_patch(
+        doc,
+        [
+            {"op": "test", "path": "/b/c", "value": "x"},
+            {"op": "add", "path": "/a/-", "value": 4},
+            {"op": "remove", "path": "/a/0"},
+            {"op": "copy", "from": "/b", "path": "/d"},
+            {"op": "move", "from": "/b/c", "path": "/e"},
+            {"op": "replace", "path": "/d/c", "value": "y"},
+        ],
+    )
+    assert patched == {"a": [2, 3, 4], "b": {}, "d": {"c": "y"}, "e": "x"}
+
+    with pytest.raises(JsonPatchError):
+        apply_patch({"a": 1}, [{"op": "test", "path": "/a", "value": 2}])
+    with pytest.raises(JsonPatchError):
+        apply_patch({"a": []}, [{"op": "remove", "path": "/a/0"}])
+
+
+@pytest.mark.parametrize("token", ["²", "٣", "01", "-1"])
+def test_non_ascii_or_malformed_array_index_is_rejected(token: str) -> None:
+    doc = {"data": {"tasks": [{"id": 1}, {"id": 2}, {"id": 3}]}}
+    with pytest.raises(JsonPatchError):
+        apply_patch(doc, [{"op": "remove", "path": f"/data/tasks/{token}"}])
+
+
+def test_touched_root_keys_covers_path_and_from() -> None:
+    patch = [
+        {"op": "replace", "path": "/work_log/data/tasks/0/title", "value": "x"},
+        {"op": "move", "from": "/tags/data/tags/0", "path": "/work_log/data/tags/0"},
+        {"op": "add", "path": "/a~1b", "value": {}},
+    ]
+    assert touched_root_keys(patch) == {"work_log", "tags", "a/b"}
+
+    with pytest.raises(JsonPatchError):
+        touched_root_keys([{"op": "replace", "path": "", "value": {}}])
@@ -0,0 +1,124 @@
+import tempfile
+from typing import Any
+
+from sync_server.merkle_index import (
+    index_tool_snapshot,
+    index_tools_data,
+    merkle_index_from_json,
+    merkle_index_to_json,
+)
+from sync_server.storage import SqliteSnapshotStore
+from sync_server.sync_diff import build_tools_diff, hash_tool_snapshot
+
+
+def _work_log(rows: int, *, changed: dict[int, str] | None = None) -> dict[str, Any]:
+    changed = changed or {}
+    return {
+        "version": 1,
+        "data": {
+            "tasks": [{"id": i, "title": changed.get(i, f"task {i}")} for i in range(rows)],
+            "settings": {"theme": "dark"},
+            "tags": ["a", "b"],
+        },
+    }
+
+
+def _merkle(tools_data: dict[str, Any]) -> dict[str, Any]:
+    return {tool_id: index for tool_id, (_, index) in index_tools_data(tools_data).items()}
+
+
+def test_index_body_and_hash_match_canonical_tool_hash() -> None:
+    cases: list[Any] = [
+        _work_log(3),
+        {"version": 2, "data": {}, "extra": None},
+        {"data": {"mixed": [{"id": 1}, 2], "无": "中文"}},
+        [1, 2, 3],
+        "plain",
+    ]
+    for tool in cases:
+        body, index = index_tool_snapshot(tool)
+        assert (body, index.tool_hash) == hash_tool_snapshot(tool)
+        assert merkle_index_from_json(merkle_index_to_json(index)) == index
+
+    _, index = index_tool_snapshot(_work_log(3))
+    tasks = index.sections[("data", "tasks")]
+    assert tasks.row_ids == (0, 1, 2)
+    assert len(tasks.row_hashes or ()) == 3
+    assert index.sections[("data", "tags")].row_hashes is None
+    assert set(index.sections) == {("version",), ("data", "tasks"), ("data", "settings"), ("data", "tags")}
+
+
+def test_merkle_diff_only_reports_changed_rows() -> None:
+    before = {"work_log": _work_log(500)}
+    after = {"work_log": _work_log(500, changed={57: "renamed", 480: "renamed"})}
+    diff = build_tools_diff(
+        server_tools_data=before,
+        client_tools_data=after,
+        server_merkle=_merkle(before),
+        client_merkle=_merkle(after),
+    )
+    items = diff["tools"]["work_log"]["diff_items"]
+    assert items == [
+        {"path": "data.tasks[id=57].title", "change": "value_changed"},
+        {"path": "data.tasks[id=480].title", "change": "value_changed"},
+    ]
+    assert diff["summary"] == {"changed_tools": 1, "diff_items": 2, "truncated": False}
+
+
+def test_merkle_diff_reports_sections_and_falls_back_for_layout_changes() -> None:
+    before = {"t": {"version": 1, "data": {"a": 1, "gone": True}}}
+    after = {"t": {"version": 2, "data": {"a": 1, "new": [1]}}}
+    items = build_tools_diff(
+        server_tools_data=before,
+        client_tools_data=after,
+        server_merkle=_merkle(before),
+        client_merkle=_merkle(after),
+    )["tools"]["t"]["diff_items"]
+    assert items == [
+        {"path": "data.gone", "change": "removed"},
+        {"path": "data.new", "change": "added"},
+        {"path": "version", "change": "value_changed"},
+    ]
+
+    # data 从对象变成列表：分段无法对应，退回整体比较
+    reshaped = {"t": {"version": 1, "data": []}}
+    items = build_tools_diff(
+        server_tools_data=before,
+        client_tools_data=reshaped,
+        server_merkle=_merkle(before),
+        client_merkle=_merkle(reshaped),
+    )["tools"]["t"]["diff_items"]
+    assert items == [{"path": "data", "change": "type_changed", "server_type": "dict", "client_type": "list"}]
+
+
+def test_store_persists_merkle_index_with_tool_blob() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            tools_data = {"work_log": _work_log(4)}
+            store.save_client_snapshot(
+                user_id="u1",
+                tools_data=tools_data,
+                updated_at_ms=100,
+                server_time_ms=100,
+                client_time_ms=None,
+            )
+            snapshot = store.get_snapshot("u1")
+            assert snapshot is not None
+            indexes = store.get_merkle_indexes(snapshot)
+            assert indexes == {"work_log": index_tool_snapshot(tools_data["work_log"])[1]}
+
+            # 旧数据没有索引：读取时缺省，下一次引用该内容块时补齐
+            with store._pool.writer() as conn:
+                conn.execute("UPDATE sync_tool_blobs SET merkle_json = NULL")
+            assert store.get_merkle_indexes(snapshot) == {}
+            store.save_client_snapshot(
+                user_id="u2",
+                tools_data=tools_data,
+                updated_at_ms=100,
+                server_time_ms=100,
+                client_time_ms=None,
+            )
+            assert store.get_merkle_indexes(snapshot) == indexes
+        finally:
+            store.close()
@@ -0,0 +1,651 @@
+import json
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from sync_server.snapshot_metadata import analyze_tools_data, build_snapshot_metadata
+from sync_server.storage import DashboardUserCursor, RevisionConflictError, SqliteSnapshotStore
+from sync_server.sync_diff import hash_tool_snapshot
+from sync_server.sync_logic import compute_latest_updated_at_ms, is_all_tools_empty, is_tool_snapshot_empty
+from sync_server.user_locks import UserLockManager
+
+
+def test_store_uses_wal_and_reuses_connections() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            with store._pool.reader() as conn:
+                mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                first_id = id(conn)
+            assert mode == "wal"
+
+            store.touch_user(user_id="u1", now_ms=100)
+            store.get_user_profile("u1")
+            with store._pool.reader() as conn:
+                assert id(conn) == first_id
+        finally:
+            store.close()
+
+
+def test_reader_is_not_blocked_by_open_write_transaction() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            store.save_client_snapshot(
+                user_id="u1",
+                tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 1}]}}},
+                updated_at_ms=100,
+                server_time_ms=100,
+                client_time_ms=None,
+            )
+
+            seen: list[int] = []
+            with store._pool.writer() as conn:
+                conn.execute(
+                    "UPDATE sync_snapshots SET server_revision = 99 WHERE user_id = ?",
+                    ("u1",),
+                )
+
+                def _read() -> None:
+                    snapshot = store.get_snapshot("u1")
+                    assert snapshot is not None
+                    seen.append(snapshot.server_revision)
+
+                reader = threading.Thread(target=_read)
+                reader.start()
+                reader.join(timeout=5)
+                assert not reader.is_alive()
+
+            # 读线程看到的是写事务提交前的已提交版本
+            assert seen == [1]
+            assert store.get_snapshot("u1").server_revision == 99
+        finally:
+            store.close()
+
+
+def test_unit_of_work_commits_snapshot_and_record_together() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            with store.unit_of_work() as uow:
+                uow.touch_user(user_id="u1", now_ms=100)
+                assert uow.get_snapshot("u1") is None
+                revision = uow.save_client_snapshot(
+                    user_id="u1",
+                    tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 1}]}}},
+                    updated_at_ms=100,
+                    server_time_ms=100,
+                    client_time_ms=None,
+                )
+                uow.add_sync_record(
+                    user_id="u1",
+                    protocol_version=2,
+                    decision="use_client",
+                    server_time_ms=100,
+                    client_time_ms=None,
+                    client_updated_at_ms=100,
+                    server_updated_at_ms_before=0,
+                    server_updated_at_ms_after=100,
+                    server_revision_before=0,
+                    server_revision_after=revision,
+                    diff={},
+                )
+                assert uow.get_snapshot("u1").server_revision == 1
+
+            assert store.get_snapshot("u1").server_revision == 1
+            assert store.get_user_profile("u1").last_seen_at_ms == 100
+            assert len(store.list_sync_records(user_id="u1", limit=10, before_id=None)) == 1
+        finally:
+            store.close()
+
+
+def test_unit_of_work_rolls_back_everything_on_error() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            try:
+                with store.unit_of_work() as uow:
+                    uow.touch_user(user_id="u1", now_ms=100)
+                    uow.save_client_snapshot(
+                        user_id="u1",
+                        tools_data={"work_log": {"version": 1, "data": {}}},
+                        updated_at_ms=100,
+                        server_time_ms=100,
+                        client_time_ms=None,
+                    )
+                    raise RuntimeError("crash before audit record")
+            except RuntimeError:
+                pass
+
+            assert store.get_snapshot("u1") is None
+            assert store.get_user_profile("u1") is None
+            assert store.get_snapshot_by_revision("u1", 1) is None
+        finally:
+            store.close()
+
+
+def test_save_client_snapshot_rejects_stale_expected_revision() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            _save_work_log(store, user_id="u1", task_id=1)
+            with pytest.raises(RevisionConflictError) as excinfo:
+                store.save_client_snapshot(
+                    user_id="u1",
+                    tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 2}]}}},
+                    updated_at_ms=200,
+                    server_time_ms=200,
+                    client_time_ms=None,
+                    expected_revision=0,
+                )
+            assert (excinfo.value.expected_revision, excinfo.value.actual_revision) == (0, 1)
+            assert store.get_snapshot("u1").tools_data["work_log"]["data"]["tasks"] == [{"id": 1}]
+        finally:
+            store.close()
+
+
+def test_unit_of_work_detects_commit_from_another_worker() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        worker_a = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        worker_b = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            _save_work_log(worker_a, user_id="u1", task_id=1)
+            with pytest.raises(RevisionConflictError):
+                with worker_a.unit_of_work("u1") as uow:
+                    uow.touch_user(user_id="u1", now_ms=300)
+                    assert uow.get_snapshot("u1").server_revision == 1
+                    # 决策阶段没有占用写连接，另一个 worker 可以先提交
+                    _save_work_log(worker_b, user_id="u1", task_id=2)
+                    uow.add_sync_record(
+                        user_id="u1",
+                        protocol_version=2,
+                        decision="noop",
+                        server_time_ms=300,
+                        client_time_ms=None,
+                        client_updated_at_ms=0,
+                        server_updated_at_ms_before=0,
+                        server_updated_at_ms_after=0,
+                        server_revision_before=1,
+                        server_revision_after=1,
+                        diff={},
+                    )
+
+            assert worker_a.get_snapshot("u1").server_revision == 2
+            assert worker_a.list_sync_records(user_id="u1", limit=10, before_id=None) == []
+            assert worker_a.get_user_profile("u1") is None
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+
+def test_user_lock_manager_serializes_same_user_only() -> None:
+    locks = UserLockManager()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def _hold_u1() -> None:
+        with locks.hold("u1"):
+            entered.set()
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=_hold_u1)
+    holder.start()
+    try:
+        assert entered.wait(timeout=5)
+        # 其它用户不等待
+        with locks.hold("u2"):
+            assert locks.active_users() == 2
+
+        acquired = threading.Event()
+
+        def _wait_u1() -> None:
+            with locks.hold("u1"):
+                acquired.set()
+
+        waiter = threading.Thread(target=_wait_u1)
+        waiter.start()
+        assert not acquired.wait(timeout=0.2)
+        release.set()
+        assert acquired.wait(timeout=5)
+        waiter.join(timeout=5)
+    finally:
+        release.set()
+        holder.join(timeout=5)
+    assert locks.active_users() == 0
+
+
+def test_history_stores_reverse_deltas_with_periodic_keyframes() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db", history_keyframe_interval=4)
+        try:
+            expected: dict[int, dict] = {}
+            tasks: list[dict] = []
+            for i in range(1, 11):
+                tasks = [{"id": i, "title": f"任务{i}", "updated_at": i * 10}] + tasks
+                tools_data = {
+                    "work_log": {"version": 1, "data": {"tasks": list(tasks), "time_entries": []}},
+                    "tag_manager": {"version": 1, "data": {"tags": [{"id": 1, "name": "固定"}]}},
+                }
+                revision = store.save_client_snapshot(
+                    user_id="u1",
+                    tools_data=tools_data,
+                    updated_at_ms=i * 10,
+                    server_time_ms=i,
+                    client_time_ms=None,
+                )
+                expected[revision] = tools_data
+
+            with store._pool.reader() as conn:
+                kinds = dict(
+                    conn.execute(
+                        "SELECT server_revision, payload_kind FROM sync_snapshot_history WHERE user_id = ?",
+                        ("u1",),
+                    ).fetchall()
+                )
+            assert {rev for rev, kind in kinds.items() if kind == "full"} == {4, 8, 10}
+
+            for revision, tools_data in expected.items():
+                snapshot = store.get_snapshot_by_revision("u1", revision)
+                assert snapshot is not None
+                assert snapshot.server_revision == revision
+                assert snapshot.updated_at_ms == revision * 10
+                assert snapshot.tools_data == tools_data
+
+            assert store.get_snapshot_by_revision("u1", 11) is None
+        finally:
+            store.close()
+
+
+def test_tool_blobs_are_shared_across_users_and_revisions() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db", history_keyframe_interval=100)
+        try:
+            shared_tags = {"version": 1, "data": {"tags": [{"id": 1, "name": "家务"}]}}
+            for user_id in ("u1", "u2"):
+                for i in range(1, 4):
+                    store.save_client_snapshot(
+                        user_id=user_id,
+                        tools_data={
+                            "tag_manager": shared_tags,
+                            "work_log": {"version": 1, "data": {"tasks": [{"id": i}]}},
+                        },
+                        updated_at_ms=i,
+                        server_time_ms=i,
+                        client_time_ms=None,
+                    )
+
+            with store._pool.reader() as conn:
+                blobs = dict(conn.execute("SELECT hash, ref_count FROM sync_tool_blobs").fetchall())
+                snapshot_rows = conn.execute("SELECT tools_data_json FROM sync_snapshots").fetchall()
+            # 共享的 tag_manager 只存一份；work_log 只保留两个用户的头版本
+            assert len(blobs) == 2
+            assert sorted(blobs.values()) == [4, 4]
+            assert all(row[0] == "" for row in snapshot_rows)
+
+            for user_id in ("u1", "u2"):
+                for revision in (1, 2, 3):
+                    snapshot = store.get_snapshot_by_revision(user_id, revision)
+                    assert snapshot.tools_data["work_log"]["data"]["tasks"] == [{"id": revision}]
+                    assert snapshot.tools_data["tag_manager"] == shared_tags
+        finally:
+            store.close()
+
+
+def test_snapshot_reads_stay_consistent_while_blobs_are_released() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        # 关闭快照缓存，每次读取都要解析清单并加载内容块
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db", snapshot_cache_bytes=0)
+        try:
+            store.save_client_snapshot(
+                user_id="u1",
+                tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 0}]}}},
+                updated_at_ms=0,
+                server_time_ms=0,
+                client_time_ms=None,
+            )
+            done = threading.Event()
+            errors: list[Exception] = []
+
+            def _write() -> None:
+                try:
+                    for i in range(1, 1500):
+                        # 每一版都换掉 work_log 的内容块，上一版的块随即被删除
+                        store.save_client_snapshot(
+                            user_id="u1",
+                            tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": i}]}}},
+                            updated_at_ms=i,
+                            server_time_ms=i,
+                            client_time_ms=None,
+                        )
+                finally:
+                    done.set()
+
+            def _read() -> None:
+                while not done.is_set():
+                    try:
+                        snapshot = store.get_snapshot("u1")
+                        assert snapshot is not None
+                        assert snapshot.tools_data["work_log"]["data"]["tasks"] == [{"id": snapshot.server_revision - 1}]
+                        store.list_snapshots()
+                    except Exception as exc:  # 收集后在主线程断言
+                        errors.append(exc)
+
+            threads = [threading.Thread(target=_write), threading.Thread(target=_read)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert errors == []
+        finally:
+            store.close()
+
+
+def test_legacy_json_rows_remain_readable_and_upgrade_on_write() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        legacy = sqlite3.connect(db_path)
+        legacy.execute(
+            """
+CREATE TABLE sync_snapshots (
+  user_id TEXT PRIMARY KEY,
+  server_revision INTEGER NOT NULL,
+  updated_at_ms INTEGER NOT NULL,
+  tools_data_json TEXT NOT NULL,
+  updated_server_time_ms INTEGER NOT NULL,
+  last_client_time_ms INTEGER
+)
+""",
+        )
+        legacy.execute(
+            """
+CREATE TABLE sync_snapshot_history (
+  user_id TEXT NOT NULL,
+  server_revision INTEGER NOT NULL,
+  updated_at_ms INTEGER NOT NULL,
+  tools_data_json TEXT NOT NULL,
+  updated_server_time_ms INTEGER NOT NULL,
+  last_client_time_ms INTEGER,
+  PRIMARY KEY (user_id, server_revision)
+)
+""",
+        )
+        legacy_json = json.dumps({"work_log": {"version": 1, "data": {"tasks": [{"id": 1}]}}})
+        legacy.execute("INSERT INTO sync_snapshots VALUES ('u1', 1, 10, ?, 10, NULL)", (legacy_json,))
+        legacy.execute("INSERT INTO sync_snapshot_history VALUES ('u1', 1, 10, ?, 10, NULL)", (legacy_json,))
+        legacy.commit()
+        legacy.close()
+
+        store = SqliteSnapshotStore(db_path=db_path)
+        try:
+            assert store.get_snapshot("u1").tools_data == json.loads(legacy_json)
+            store.save_client_snapshot(
+                user_id="u1",
+                tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 2}]}}},
+                updated_at_ms=20,
+                server_time_ms=20,
+                client_time_ms=None,
+            )
+            assert store.get_snapshot_by_revision("u1", 1).tools_data == json.loads(legacy_json)
+            assert store.get_snapshot("u1").tools_data["work_log"]["data"]["tasks"] == [{"id": 2}]
+        finally:
+            store.close()
+
+
+def test_snapshot_metadata_is_persisted_and_payload_decoded_lazily() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            store.save_client_snapshot(
+                user_id="u1",
+                tools_data={
+                    "work_log": {
+                        "version": 2,
+                        "data": {"tasks": [{"id": 1, "updated_at": 300}, {"id": 2}], "note": None},
+                    },
+                    "tags": {"version": 1, "data": {"tags": []}},
+                },
+                updated_at_ms=300,
+                server_time_ms=400,
+                client_time_ms=None,
+            )
+
+            snapshot = store.get_snapshot("u1")
+            assert snapshot is not None
+            assert snapshot.stored_metadata is not None
+            metadata = snapshot.metadata
+            assert metadata.is_empty is False
+            assert metadata.max_updated_at_ms == 300
+            assert set(metadata.tool_hashes) == {"work_log", "tags"}
+            assert metadata.tool_stats["work_log"].section_counts == {"tasks": 2, "note": 0}
+            assert metadata.tool_stats["work_log"].version == 2
+            # 只读元数据不会触发正文解析
+            assert "tools_data" not in snapshot.__dict__
+            assert snapshot.tools_data["tags"] == {"version": 1, "data": {"tags": []}}
+        finally:
+            store.close()
+
+
+def test_snapshot_analysis_matches_individual_helpers() -> None:
+    tools_data = {
+        "work_log": {
+            "version": 2,
+            "data": {"tasks": [{"id": 1, "updated_at": 300, "title": "中文"}], "note": None},
+        },
+        "tags": {"version": 1, "data": {"tags": []}},
+        "legacy": [1, 2],
+    }
+    analysis = analyze_tools_data(tools_data)
+    assert analysis.max_updated_at_ms == compute_latest_updated_at_ms(tools_data)
+    assert analysis.is_empty is is_all_tools_empty(tools_data)
+    for tool_id, tool_snapshot in tools_data.items():
+        body, digest = hash_tool_snapshot(tool_snapshot)
+        tool = analysis.tools[tool_id]
+        assert tool.hash == digest
+        assert tool.size_bytes == len(body.encode("utf-8"))
+        assert tool.is_empty is (not isinstance(tool_snapshot, dict) or is_tool_snapshot_empty(tool_snapshot))
+    assert analysis.to_metadata() == build_snapshot_metadata(tools_data)
+    assert analysis.tools["work_log"].stats.section_counts == {"tasks": 1, "note": 0}
+
+
+def test_legacy_snapshot_without_metadata_falls_back_to_payload() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            store.save_client_snapshot(
+                user_id="u1",
+                tools_data={"work_log": {"version": 1, "data": {"tasks": []}}},
+                updated_at_ms=100,
+                server_time_ms=100,
+                client_time_ms=None,
+            )
+            with store._pool.writer() as conn:
+                conn.execute(
+                    "UPDATE sync_snapshots SET is_empty = NULL, max_updated_at_ms = NULL, tool_stats_json = NULL",
+                )
+
+            snapshot = store.get_snapshot("u1")
+            assert snapshot is not None
+            assert snapshot.stored_metadata is None
+            assert snapshot.is_empty is True
+            assert snapshot.metadata.tool_stats["work_log"].section_counts == {"tasks": 0}
+        finally:
+            store.close()
+
+
+def _save_work_log(store: SqliteSnapshotStore, *, user_id: str, task_id: int) -> int:
+    return store.save_client_snapshot(
+        user_id=user_id,
+        tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": task_id}]}}},
+        updated_at_ms=100 + task_id,
+        server_time_ms=100 + task_id,
+        client_time_ms=None,
+    )
+
+
+def test_snapshot_cache_hits_and_invalidates_on_save() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            _save_work_log(store, user_id="u1", task_id=1)
+            first = store.get_snapshot("u1")
+            second = store.get_snapshot("u1")
+            assert first is not None and second is not None
+            assert second == first
+            # 调用方改动解析结果不会污染缓存
+            second.tools_data["work_log"]["data"]["tasks"].clear()
+            assert store.get_snapshot("u1").tools_data["work_log"]["data"]["tasks"] == [{"id": 1}]
+
+            stats = store.snapshot_cache_stats()
+            assert (stats.hits, stats.misses, stats.entries) == (2, 1, 1)
+
+            _save_work_log(store, user_id="u1", task_id=2)
+            assert store.snapshot_cache_stats().entries == 0
+            assert store.get_snapshot("u1").tools_data["work_log"]["data"]["tasks"] == [{"id": 2}]
+        finally:
+            store.close()
+
+
+def test_snapshot_cache_revalidates_against_other_workers() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        worker_a = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        worker_b = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            _save_work_log(worker_a, user_id="u1", task_id=1)
+            assert worker_a.get_snapshot("u1").server_revision == 1
+
+            _save_work_log(worker_b, user_id="u1", task_id=2)
+            snapshot = worker_a.get_snapshot("u1")
+            assert snapshot.server_revision == 2
+            assert snapshot.tools_data["work_log"]["data"]["tasks"] == [{"id": 2}]
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+
+def test_snapshot_cache_skips_uncommitted_writes_and_evicts_by_size() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db", snapshot_cache_bytes=80)
+        try:
+            _save_work_log(store, user_id="u1", task_id=1)
+            try:
+                with store.unit_of_work() as uow:
+                    uow.save_client_snapshot(
+                        user_id="u1",
+                        tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 9}]}}},
+                        updated_at_ms=900,
+                        server_time_ms=900,
+                        client_time_ms=None,
+                    )
+                    assert uow.get_snapshot("u1").server_revision == 2
+                    raise RuntimeError("boom")
+            except RuntimeError:
+                pass
+            assert store.snapshot_cache_stats().entries == 0
+
+            _save_work_log(store, user_id="u1", task_id=2)
+            assert store.get_snapshot("u1").tools_data["work_log"]["data"]["tasks"] == [{"id": 2}]
+
+            _save_work_log(store, user_id="u2", task_id=3)
+            store.get_snapshot("u2")
+            stats = store.snapshot_cache_stats()
+            assert stats.evictions == 1
+            assert stats.entries == 1
+            assert stats.size_bytes <= 80
+        finally:
+            store.close()
+
+
+def test_user_summaries_are_maintained_on_write_and_backfilled() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        store = SqliteSnapshotStore(db_path=db_path)
+        try:
+            store.touch_user(user_id="u1", now_ms=50)
+            _save_work_log(store, user_id="u1", task_id=1)
+            _save_work_log(store, user_id="legacy", task_id=2)
+
+            entries = {
+                profile.user_id: (profile, summary)
+                for profile, summary in store.list_dashboard_entries(limit=50)
+            }
+            profile, summary = entries["u1"]
+            assert profile is not None and summary is not None
+            assert summary.server_revision == 1
+            assert summary.tool_count == 1
+            assert summary.total_item_count == 1
+            assert json.loads(summary.tool_ids_json) == ["work_log"]
+            assert json.loads(summary.tool_summaries_json) == [
+                {"tool_id": "work_log", "version": 1, "total_items": 1, "section_counts": {"tasks": 1}}
+            ]
+            # 只有快照没有资料的用户在下次打开库时补资料
+            assert "legacy" not in entries
+
+            with store._pool.writer() as conn:
+                conn.execute("DELETE FROM sync_user_summaries")
+        finally:
+            store.close()
+
+        reopened = SqliteSnapshotStore(db_path=db_path)
+        try:
+            entries = reopened.list_dashboard_entries(limit=50)
+            assert [profile.user_id for profile, _ in entries] == ["legacy", "u1"]
+            assert all(summary is not None for _, summary in entries)
+            legacy_profile = entries[0][0]
+            assert legacy_profile.last_seen_at_ms == legacy_profile.created_at_ms == 102
+        finally:
+            reopened.close()
+
+
+def test_dashboard_entries_keyset_pages_seek_the_index() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        try:
+            with store._pool.writer() as conn:
+                conn.executemany(
+                    """
+INSERT INTO sync_users (user_id, display_name, notes, is_enabled, created_at_ms, updated_at_ms, last_seen_at_ms)
+VALUES (?, '', '', 1, 0, ?, ?)
+""",
+                    # last_seen 与 updated_at 都有重复，且有一段 last_seen 为空
+                    [(f"u{index:02d}", index % 3, None if index % 4 == 0 else index % 5) for index in range(40)],
+                )
+                expected = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT user_id FROM sync_users ORDER BY last_seen_at_ms DESC, updated_at_ms DESC, user_id ASC"
+                    )
+                ]
+
+            statements: list[str] = []
+            seen: list[str] = []
+            after = None
+            with store._pool.reader() as conn:
+                conn.set_trace_callback(statements.append)
+            try:
+                while True:
+                    page = store.list_dashboard_entries(limit=3, after=after)
+                    if not page:
+                        break
+                    seen.extend(profile.user_id for profile, _ in page)
+                    last = page[-1][0]
+                    after = DashboardUserCursor(
+                        last_seen_at_ms=last.last_seen_at_ms,
+                        updated_at_ms=last.updated_at_ms,
+                        user_id=last.user_id,
+                    )
+            finally:
+                with store._pool.reader() as conn:
+                    conn.set_trace_callback(None)
+            assert seen == expected
+
+            # 每段查询都在索引上定位，而不是从头扫描到游标位置
+            with store._pool.reader() as conn:
+                for sql in statements:
+                    if "FROM sync_users u" not in sql:
+                        continue
+                    plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+                    assert "SEARCH u USING INDEX idx_sync_users_last_seen" in plan, plan
+        finally:
+            store.close()
@@ -0,0 +1,112 @@
+import json
+import tempfile
+
+import pytest
+
+from sync_server.storage import SqliteSnapshotStore
+from sync_server.storage_codec import StorageCodec, StorageCodecError, train_dictionary
+
+
+def _work_log_tools_data(task_count: int, *, offset: int = 0) -> dict:
+    return {
+        "work_log": {
+            "version": 1,
+            "data": {
+                "tasks": [
+                    {
+                        "id": offset + i,
+                        "title": f"整理第{offset + i}周的周报",
+                        "description": "补齐项目进度与风险说明",
+                        "status": 1,
+                        "estimated_minutes": 90,
+                        "created_at": 1730000000000 + i,
+                        "updated_at": 1730000000100 + i,
+                    }
+                    for i in range(task_count)
+                ],
+                "time_entries": [],
+            },
+        }
+    }
+
+
+def test_codec_roundtrip_with_trained_dictionary() -> None:
+    samples = [json.dumps(_work_log_tools_data(20, offset=i * 20), ensure_ascii=False) for i in range(10)]
+    dictionary = train_dictionary("zlib", samples)
+    codec = StorageCodec(algorithm="zlib", dictionary_loader={7: dictionary}.get, active_dictionary_id=7)
+
+    text = json.dumps(_work_log_tools_data(5, offset=500), ensure_ascii=False)
+    tag, payload = codec.encode(text)
+    assert tag == "zlib:7"
+    assert isinstance(payload, bytes)
+    assert len(payload) < len(text.encode("utf-8")) // 3
+    assert codec.decode(tag, payload) == text
+
+    # 明文行与短内容保持原样
+    assert codec.decode(None, "{}") == "{}"
+    assert codec.encode("{}") == (None, "{}")
+
+    with pytest.raises(StorageCodecError):
+        codec.decode("zlib:8", payload)
+    with pytest.raises(StorageCodecError):
+        codec.decode("brotli", payload)
+    with pytest.raises(StorageCodecError):
+        codec.decode("zlib:²", payload)
+
+
+def test_store_compression_migration_roundtrip() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        plain = SqliteSnapshotStore(db_path=db_path, history_keyframe_interval=100)
+        try:
+            for i in range(1, 4):
+                plain.save_client_snapshot(
+                    user_id="u1",
+                    tools_data=_work_log_tools_data(10 * i),
+                    updated_at_ms=i,
+                    server_time_ms=i,
+                    client_time_ms=None,
+                )
+                plain.add_sync_record(
+                    user_id="u1",
+                    protocol_version=2,
+                    decision="use_client",
+                    server_time_ms=i,
+                    client_time_ms=None,
+                    client_updated_at_ms=i,
+                    server_updated_at_ms_before=0,
+                    server_updated_at_ms_after=i,
+                    server_revision_before=i - 1,
+                    server_revision_after=i,
+                    diff={"summary": {"changed_tools": 1}, "note": "同步记录" * 40},
+                )
+        finally:
+            plain.close()
+
+        store = SqliteSnapshotStore(db_path=db_path, compression="zlib", history_keyframe_interval=100)
+        try:
+            dictionary_id = store.train_compression_dictionary(now_ms=1)
+            rewritten = store.recompress_rows()
+            assert rewritten == {"sync_tool_blobs": 1, "sync_snapshot_history": 2, "sync_records": 3}
+
+            with store._pool.reader() as conn:
+                tags = {row[0] for row in conn.execute("SELECT codec FROM sync_tool_blobs")}
+                tags |= {row[0] for row in conn.execute("SELECT diff_codec FROM sync_records")}
+            assert tags == {f"zlib:{dictionary_id}"}
+
+            for i in range(1, 4):
+                assert store.get_snapshot_by_revision("u1", i).tools_data == _work_log_tools_data(10 * i)
+            records = store.list_sync_records(user_id="u1", limit=10, before_id=None)
+            assert records[0].diff["note"] == "同步记录" * 40
+
+            # 再次执行是幂等的
+            assert sum(store.recompress_rows().values()) == 0
+        finally:
+            store.close()
+
+        restored = SqliteSnapshotStore(db_path=db_path)
+        try:
+            assert sum(restored.recompress_rows().values()) == 6
+            assert restored.get_snapshot("u1").tools_data == _work_log_tools_data(30)
+        finally:
+            restored.close()
@@ -0,0 +1,114 @@
+import tempfile
+import threading
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import sync_server.main as main_module
+from sync_server.main import create_app
+from sync_server.storage import SqliteSnapshotStore
+
+
+def _req(title: str, *, last_rev: int | None, updated_at: int) -> dict[str, Any]:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000000 + updated_at,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": False},
+        "tools_data": {
+            "work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": title, "updated_at": updated_at}]}}
+        },
+    }
+
+
+def _commit_from_other_worker(db_path: str, title: str, updated_at: int) -> None:
+    other = SqliteSnapshotStore(db_path=db_path)
+    try:
+        other.save_client_snapshot(
+            user_id="u1",
+            tools_data={
+                "work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": title, "updated_at": updated_at}]}}
+            },
+            updated_at_ms=updated_at,
+            server_time_ms=updated_at,
+            client_time_ms=None,
+        )
+    finally:
+        other.close()
+
+
+def test_sync_retries_decision_when_another_worker_commits_first(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        client = TestClient(create_app(db_path=db_path))
+        assert client.post("/sync/v2", json=_req("A", last_rev=None, updated_at=100)).json()["server_revision"] == 1
+
+        original = main_module.analyze_tools_data
+        calls: list[int] = []
+
+        def _racing_analyze(tools_data: Any) -> Any:
+            # 第一次决策完成、提交之前，另一个 worker 抢先写入 revision 2
+            if not calls:
+                _commit_from_other_worker(db_path, "other worker", 150)
+            calls.append(1)
+            return original(tools_data)
+
+        monkeypatch.setattr(main_module, "analyze_tools_data", _racing_analyze)
+        body = client.post("/sync/v2", json=_req("B", last_rev=1, updated_at=200)).json()
+
+        # 重试时看到客户端已落后，改为下发服务端版本，而不是覆盖另一个 worker 的写入
+        assert body["decision"] == "use_server"
+        assert body["server_revision"] == 2
+        assert body["tools_data"]["work_log"]["data"]["tasks"][0]["title"] == "other worker"
+        records = client.get("/sync/records", params={"user_id": "u1", "limit": 10}).json()["records"]
+        assert [record["decision"] for record in records] == ["use_server", "use_client"]
+
+
+def test_sync_returns_conflict_after_repeated_lost_races(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        client = TestClient(create_app(db_path=db_path))
+        client.post("/sync/v2", json=_req("A", last_rev=None, updated_at=100))
+
+        original = main_module.analyze_tools_data
+        commits: list[int] = []
+
+        def _always_racing_analyze(tools_data: Any) -> Any:
+            commits.append(1)
+            _commit_from_other_worker(db_path, f"other {len(commits)}", 100 + len(commits))
+            return original(tools_data)
+
+        monkeypatch.setattr(main_module, "analyze_tools_data", _always_racing_analyze)
+        resp = client.put(
+            "/dashboard/users/u1/tools/work_log",
+            json={"version": 1, "data": {"tasks": []}},
+        )
+        assert resp.status_code == 409
+        assert resp.json() == {"message": "并发写入冲突，请重试", "server_revision": 1 + len(commits)}
+        assert len(commits) == 3
+
+
+def test_concurrent_writes_for_same_user_do_not_overwrite_each_other() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        client = TestClient(create_app(db_path=f"{tmp}/sync.db"))
+        tool_ids = [f"tool_{index}" for index in range(8)]
+        statuses: list[int] = []
+
+        def _put(tool_id: str) -> None:
+            resp = client.put(
+                f"/dashboard/users/u1/tools/{tool_id}",
+                json={"version": 1, "data": {"value": tool_id}},
+            )
+            statuses.append(resp.status_code)
+
+        threads = [threading.Thread(target=_put, args=(tool_id,)) for tool_id in tool_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        assert statuses == [200] * len(tool_ids)
+        snapshot = client.get("/dashboard/users/u1").json()["snapshot"]
+        assert snapshot["server_revision"] == len(tool_ids)
+        assert sorted(snapshot["tools_data"]) == tool_ids
@@ -0,0 +1,62 @@
+from typing import Any
+
+from sync_server.merkle_index import index_tools_data
+from sync_server.sync_diff import build_tools_diff
+
+
+def _tasks(ids: list[int], *, titles: dict[int, str] | None = None) -> dict[str, Any]:
+    titles = titles or {}
+    return {"work_log": {"version": 1, "data": {"tasks": [{"id": i, "title": titles.get(i, f"t{i}")} for i in ids]}}}
+
+
+def _items(server: dict[str, Any], client: dict[str, Any], **kwargs: Any) -> list[dict[str, Any]]:
+    return build_tools_diff(server_tools_data=server, client_tools_data=client, **kwargs)["tools"]["work_log"][
+        "diff_items"
+    ]
+
+
+def _merkle(tools_data: dict[str, Any]) -> dict[str, Any]:
+    return {tool_id: index for tool_id, (_, index) in index_tools_data(tools_data).items()}
+
+
+def test_id_keyed_rows_report_added_removed_modified_and_moved() -> None:
+    server = _tasks([1, 2, 3, 4, 5])
+    client = _tasks([0, 1, 4, 2, 5, 6], titles={5: "renamed"})
+    expected = [
+        {"path": "data.tasks[id=3]", "change": "removed", "server_index": 2},
+        {"path": "data.tasks[id=0]", "change": "added", "client_index": 0},
+        {"path": "data.tasks[id=4]", "change": "moved", "server_index": 3, "client_index": 2},
+        {"path": "data.tasks[id=5].title", "change": "value_changed"},
+        {"path": "data.tasks[id=6]", "change": "added", "client_index": 5},
+    ]
+    assert _items(server, client) == expected
+    # 走 Merkle 行 hash 时结果一致
+    assert _items(server, client, server_merkle=_merkle(server), client_merkle=_merkle(client)) == expected
+
+
+def test_insert_at_top_does_not_shift_every_row() -> None:
+    server = _tasks(list(range(1, 1001)))
+    client = _tasks(list(range(0, 1001)))
+    assert _items(server, client) == [{"path": "data.tasks[id=0]", "change": "added", "client_index": 0}]
+
+    positional = _items(server, client, match_rows_by_id=False)
+    assert positional[0] == {"path": "data.tasks.length", "change": "length_changed", "server": 1000, "client": 1001}
+    assert positional[-1] == {"path": "data.tasks", "change": "list_truncated"}
+
+
+def test_id_diff_caps_reported_rows_and_falls_back_without_ids() -> None:
+    server = _tasks(list(range(50)))
+    client = _tasks(list(range(50)), titles={i: "x" for i in range(50)})
+    items = _items(server, client, max_list_items=3)
+    assert [item["path"] for item in items] == [
+        "data.tasks[id=0].title",
+        "data.tasks[id=1].title",
+        "data.tasks[id=2].title",
+        "data.tasks",
+    ]
+    assert items[-1]["change"] == "list_truncated"
+
+    # 存在重复 id：无法按 id 配对，保持按下标比较
+    duplicated = {"work_log": {"data": {"tasks": [{"id": 1, "v": 1}, {"id": 1, "v": 2}]}}}
+    changed = {"work_log": {"data": {"tasks": [{"id": 1, "v": 1}, {"id": 1, "v": 3}]}}}
+    assert _items(duplicated, changed) == [{"path": "data.tasks.1.v", "change": "value_changed"}]
@@ -0,0 +1,91 @@
+import tempfile
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+from sync_server.revision_diff import RevisionDiff, RevisionDiffCache
+
+
+def _put_tasks(client: TestClient, titles: list[str]) -> None:
+    resp = client.put(
+        "/dashboard/users/u1/tools/work_log",
+        json={"version": 1, "data": {"tasks": [{"id": i, "title": title} for i, title in enumerate(titles)]}},
+    )
+    assert resp.status_code == 200
+
+
+def _diff(client: TestClient, **params: Any) -> Any:
+    return client.get("/sync/diff", params={"user_id": "u1", **params})
+
+
+def test_revision_diff_is_paginated_without_truncation() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        _put_tasks(client, [f"t{i}" for i in range(30)])
+        _put_tasks(client, [f"renamed {i}" for i in range(30)])
+
+        items: list[dict[str, Any]] = []
+        offset: int | None = 0
+        while offset is not None:
+            body = _diff(client, from_revision=1, to_revision=2, offset=offset, limit=7).json()
+            assert len(body["diff_items"]) <= 7
+            items.extend(body["diff_items"])
+            offset = body["next_offset"]
+
+        # 按 id 配对的行列表超过 20 行也不截断
+        assert [item["path"] for item in items] == [f"data.tasks[id={i}].title" for i in range(30)]
+        assert {item["tool_id"] for item in items} == {"work_log"}
+        assert body["summary"] == {"changed_tools": 1, "diff_items": 30, "truncated": False}
+        assert body["tools"]["work_log"]["diff_items"] == 30
+        assert body["tools"]["work_log"]["same"] is False
+
+        stats = client.get("/dashboard/cache-stats").json()["revision_diff_cache"]
+        assert (stats["misses"], stats["hits"], stats["entries"]) == (1, 4, 1)
+
+
+def test_revision_diff_from_empty_snapshot_etag_and_missing_revision() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        client = TestClient(create_app(db_path=f"{tmp}/sync.db"))
+        _put_tasks(client, ["a"])
+
+        resp = _diff(client, from_revision=0, to_revision=1)
+        assert resp.status_code == 200
+        assert resp.json()["diff_items"] == [{"tool_id": "work_log", "path": "", "change": "added"}]
+        etag = resp.headers["ETag"]
+        cached = client.get(
+            "/sync/diff",
+            params={"user_id": "u1", "from_revision": 0, "to_revision": 1},
+            headers={"If-None-Match": etag},
+        )
+        assert cached.status_code == 304
+
+        missing = _diff(client, from_revision=1, to_revision=5)
+        assert missing.status_code == 404
+        assert missing.json() == {"message": "快照不存在"}
+        assert _diff(client, from_revision=-1, to_revision=1).status_code == 422
+
+
+def test_revision_diff_cache_evicts_least_recently_used_by_item_count() -> None:
+    def _entry(to_revision: int, items: int) -> RevisionDiff:
+        return RevisionDiff(
+            user_id="u1",
+            from_revision=1,
+            to_revision=to_revision,
+            summary={},
+            tools={},
+            items=tuple({"path": str(i)} for i in range(items)),
+        )
+
+    cache = RevisionDiffCache(max_items=10)
+    cache.put(_entry(2, 4))
+    cache.put(_entry(3, 4))
+    assert cache.get("u1", 1, 2) is not None
+    cache.put(_entry(4, 4))
+    assert cache.get("u1", 1, 3) is None
+    assert cache.get("u1", 1, 2) is not None
+    cache.put(_entry(5, 11))
+    assert cache.get("u1", 1, 5) is None
+    stats = cache.stats()
+    assert (stats.entries, stats.items, stats.evictions) == (2, 8, 1)
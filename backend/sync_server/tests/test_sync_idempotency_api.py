@@ -0,0 +1,93 @@
+import tempfile
+import threading
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+
+
+def _req(title: str, *, last_rev: int | None, updated_at: int = 100) -> dict[str, Any]:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000000 + updated_at,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": False},
+        "tools_data": {
+            "work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": title, "updated_at": updated_at}]}}
+        },
+    }
+
+
+def _record_count(client: TestClient) -> int:
+    return len(client.get("/sync/records", params={"user_id": "u1", "limit": 50}).json()["records"])
+
+
+def test_retried_sync_with_same_key_replays_first_result() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        headers = {"Idempotency-Key": "retry-1"}
+
+        first = client.post("/sync/v2", json=_req("周报", last_rev=None), headers=headers)
+        retry = client.post("/sync/v2", json=_req("周报", last_rev=None), headers=headers)
+        assert first.json()["decision"] == "use_client"
+        assert retry.json() == first.json()
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert app.state.store.get_snapshot("u1").server_revision == 1
+        assert _record_count(client) == 1
+
+        # 服务端随后又前进了一版，重放的 use_server 仍返回当时的快照
+        client.post("/sync/v2", json=_req("月报", last_rev=1, updated_at=200))
+        pull = _req("", last_rev=0)
+        pull["tools_data"] = {}
+        pull["client_state"]["client_is_empty"] = True
+        client.post("/sync/v2", json=pull, headers={"Idempotency-Key": "pull"})
+        client.post("/sync/v2", json=_req("年报", last_rev=2, updated_at=300))
+        replayed = client.post("/sync/v2", json=pull, headers={"Idempotency-Key": "pull"}).json()
+        assert replayed["decision"] == "use_server"
+        assert replayed["server_revision"] == 2
+        assert replayed["tools_data"]["work_log"]["data"]["tasks"][0]["title"] == "月报"
+
+        reused = client.post("/sync/v2", json=_req("别的内容", last_rev=1, updated_at=400), headers=headers)
+        assert reused.status_code == 422
+
+
+def test_reused_key_with_only_tools_data_changed_is_rejected() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        headers = {"Idempotency-Key": "same-shape"}
+
+        first = client.post("/sync/v2", json=_req("周报", last_rev=None), headers=headers)
+        assert first.status_code == 200
+
+        # 除了工具内容，其余字段（含 client_time、工具 id）都与首次请求相同
+        changed = client.post("/sync/v2", json=_req("月报", last_rev=None), headers=headers)
+        assert changed.status_code == 422
+        assert app.state.store.get_snapshot("u1").server_revision == 1
+
+
+def test_concurrent_retries_with_same_key_commit_once() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        bodies: list[dict[str, Any]] = []
+
+        def _send() -> None:
+            resp = TestClient(app).post(
+                "/sync/v2",
+                json=_req("周报", last_rev=None),
+                headers={"Idempotency-Key": "storm"},
+            )
+            bodies.append(resp.json())
+
+        threads = [threading.Thread(target=_send) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(bodies) == 6
+        assert {body["server_revision"] for body in bodies} == {1}
+        assert {body["decision"] for body in bodies} == {"use_client"}
+        assert _record_count(TestClient(app)) == 1
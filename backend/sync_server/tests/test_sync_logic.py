@@ -1,9 +1,12 @@
+from typing import Any
+
 from sync_server.sync_logic import (
     compute_latest_updated_at_ms,
     decide_sync_v2_by_revision,
     is_all_tools_empty,
     is_tool_snapshot_empty,
     decide_sync_v2,
+    scan_tool_snapshot,
 )
 
 
@@ -47,6 +50,37 @@ def test_is_tool_snapshot_empty_follows_client_deep_empty_rule() -> None:
     )
 
 
+def test_scan_tool_snapshot_matches_separate_helpers() -> None:
+    snapshots = [
+        {"version": 1, "data": {"tasks": [], "logs": []}},
+        {"version": 1, "updatedAt": "70", "data": {"tasks": [[{"updated_at_ms": 90}]], "note": " "}},
+        {"version": 1, "data": {"updated_at": 40, "meta": {"count": 3, "updatedAtMs": 60.5}}},
+        {"version": 1, "data": {"title": "周报", "items": [{"updated_at": -1}, {"updated_at": True}]}},
+        {"version": 1, "data": None, "updated_at": 5},
+        {"version": 1, "data": "", "extra": [{"updated_at": 80}]},
+        {"version": 1},
+    ]
+    for snapshot in snapshots:
+        assert scan_tool_snapshot(snapshot) == (
+            compute_latest_updated_at_ms(snapshot),
+            is_tool_snapshot_empty(snapshot),
+        )
+    assert scan_tool_snapshot([{"updated_at": 9}]) == (9, True)
+
+
+def test_scan_tool_snapshot_handles_deeply_nested_payloads() -> None:
+    # 远超解释器递归上限的嵌套（合法 JSON）也不能让分析抛出 RecursionError
+    nested: Any = {"updated_at": 77}
+    for _ in range(5000):
+        nested = {"child": [nested]}
+    assert scan_tool_snapshot({"version": 1, "data": {"tree": nested}}) == (77, False)
+
+    empty: Any = {}
+    for _ in range(5000):
+        empty = {"child": empty}
+    assert scan_tool_snapshot({"version": 1, "data": empty}) == (0, True)
+
+
 def test_is_all_tools_empty() -> None:
     assert is_all_tools_empty({}) is True
     assert (
@@ -0,0 +1,143 @@
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+from sync_server.sync_merge import MergeConflictError, merge_tools_data
+
+
+def _work_log(tasks: list[dict], entries: list[dict] | None = None) -> dict:
+    return {"work_log": {"version": 1, "data": {"tasks": tasks, "time_entries": entries or []}}}
+
+
+def test_merge_combines_row_edits_from_both_sides() -> None:
+    base = _work_log(
+        [
+            {"id": 1, "title": "周报", "updated_at": 100},
+            {"id": 2, "title": "评审", "updated_at": 100},
+            {"id": 3, "title": "走查", "updated_at": 100},
+            {"id": 4, "title": "回访", "updated_at": 100},
+        ]
+    )
+    server = _work_log(
+        [
+            {"id": 1, "title": "周报（服务端）", "updated_at": 200},
+            {"id": 2, "title": "评审", "updated_at": 100},
+            {"id": 4, "title": "回访", "updated_at": 100},
+            {"id": 5, "title": "服务端新增", "updated_at": 200},
+        ]
+    )
+    client = _work_log(
+        [
+            {"id": 1, "title": "周报", "updated_at": 100},
+            {"id": 2, "title": "评审（客户端）", "updated_at": 150},
+            {"id": 3, "title": "走查", "updated_at": 100},
+            {"id": 6, "title": "客户端新增", "updated_at": 150},
+        ]
+    )
+
+    result = merge_tools_data(base=base, server=server, client=client)
+    assert result.tools_data["work_log"]["data"]["tasks"] == [
+        {"id": 1, "title": "周报（服务端）", "updated_at": 200},
+        {"id": 2, "title": "评审（客户端）", "updated_at": 150},
+        {"id": 5, "title": "服务端新增", "updated_at": 200},
+        {"id": 6, "title": "客户端新增", "updated_at": 150},
+    ]
+    assert result.lww_rows == 0
+
+
+def test_merge_resolves_rows_edited_on_both_sides_by_updated_at() -> None:
+    base = _work_log([{"id": 1, "title": "a", "updated_at": 100}, {"id": 2, "title": "b", "updated_at": 100}])
+    server = _work_log([{"id": 1, "title": "a-s", "updated_at": 300}, {"id": 2, "title": "b-s", "updated_at": 200}])
+    client = _work_log([{"id": 1, "title": "a-c", "updated_at": 250}, {"id": 2, "title": "b-c", "updated_at": "260"}])
+
+    result = merge_tools_data(base=base, server=server, client=client)
+    assert [row["title"] for row in result.tools_data["work_log"]["data"]["tasks"]] == ["a-s", "b-c"]
+    assert result.lww_rows == 2
+
+
+def test_merge_keeps_edit_over_delete_and_adds_new_tools() -> None:
+    base = _work_log([{"id": 1, "title": "a", "updated_at": 100}])
+    server = _work_log([])
+    client = {
+        **_work_log([{"id": 1, "title": "a2", "updated_at": 150}]),
+        "tags": {"version": 1, "data": {"tags": []}},
+    }
+
+    result = merge_tools_data(base=base, server=server, client=client)
+    assert result.tools_data == client
+
+
+def test_merge_rejects_conflicting_plain_fields() -> None:
+    base = {"app_config": {"version": 1, "data": {"settings": {"theme": "light"}}}}
+    server = {"app_config": {"version": 1, "data": {"settings": {"theme": "dark"}}}}
+    client = {"app_config": {"version": 1, "data": {"settings": {"theme": "auto"}}}}
+
+    with pytest.raises(MergeConflictError) as excinfo:
+        merge_tools_data(base=base, server=server, client=client)
+    assert excinfo.value.path == "/app_config/data/settings/theme"
+
+
+def test_merge_treats_rows_like_diff_does() -> None:
+    # 布尔 id 不算行 id（与 diff / Merkle 索引一致），整个列表按普通字段处理
+    base = {"flags": {"version": 1, "data": {"rows": [{"id": True, "on": 0}]}}}
+    server = {"flags": {"version": 1, "data": {"rows": [{"id": True, "on": 1}]}}}
+    client = {"flags": {"version": 1, "data": {"rows": [{"id": True, "on": 2}]}}}
+    with pytest.raises(MergeConflictError) as excinfo:
+        merge_tools_data(base=base, server=server, client=client)
+    assert excinfo.value.path == "/flags/data/rows"
+
+    # 冲突路径按 JSON Pointer 转义
+    base = {"cfg": {"version": 1, "data": {"a/b~c": "x"}}}
+    with pytest.raises(MergeConflictError) as excinfo:
+        merge_tools_data(
+            base=base,
+            server={"cfg": {"version": 1, "data": {"a/b~c": "y"}}},
+            client={"cfg": {"version": 1, "data": {"a/b~c": "z"}}},
+        )
+    assert excinfo.value.path == "/cfg/data/a~1b~0c"
+
+
+def _v2_req(tools_data: dict, *, last_rev: int | None, allow_merge: bool = True) -> dict:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000000,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": False},
+        "allow_merge": allow_merge,
+        "tools_data": tools_data,
+    }
+
+
+def test_sync_v2_merges_concurrent_edits_instead_of_use_server() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        base = _work_log([{"id": 1, "title": "a", "updated_at": 100}, {"id": 2, "title": "b", "updated_at": 100}])
+        client.post("/sync/v2", json=_v2_req(base, last_rev=None))
+
+        device_a = _work_log([{"id": 1, "title": "a-A", "updated_at": 200}, {"id": 2, "title": "b", "updated_at": 100}])
+        assert client.post("/sync/v2", json=_v2_req(device_a, last_rev=1)).json()["server_revision"] == 2
+
+        device_b = _work_log([{"id": 1, "title": "a", "updated_at": 100}, {"id": 2, "title": "b-B", "updated_at": 150}])
+        expected = _work_log([{"id": 1, "title": "a-A", "updated_at": 200}, {"id": 2, "title": "b-B", "updated_at": 150}])
+
+        # 未开启合并时保持原有语义
+        legacy = client.post("/sync/v2", json=_v2_req(device_b, last_rev=1, allow_merge=False)).json()
+        assert legacy["decision"] == "use_server"
+
+        body = client.post("/sync/v2", json=_v2_req(device_b, last_rev=1)).json()
+        assert body["decision"] == "merge"
+        assert body["server_revision"] == 3
+        assert body["tools_data"] == expected
+        assert app.state.store.get_snapshot("u1").tools_data == expected
+
+        record = client.get("/sync/records", params={"user_id": "u1", "limit": 1}).json()["records"][0]
+        assert record["decision"] == "merge"
+
+        # 客户端没有新改动时仍是普通 use_server，不产生新 revision
+        stale = client.post("/sync/v2", json=_v2_req(device_a, last_rev=2)).json()
+        assert stale["decision"] == "use_server"
+        assert stale["server_revision"] == 3
@@ -0,0 +1,105 @@
+import copy
+import json
+import tempfile
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+from sync_server.sync_diff import hash_tool_snapshot
+
+
+def _tools_data() -> dict[str, Any]:
+    return {
+        "work_log": {
+            "version": 1,
+            "data": {
+                "tasks": [{"id": 1, "title": "整理周报", "updated_at": 100}],
+                "time_entries": [
+                    {"id": index, "task_id": 1, "minutes": 30, "content": f"记录 {index}", "updated_at": 100}
+                    for index in range(50)
+                ],
+            },
+        },
+        "tags": {"version": 1, "data": {"tags": [{"id": 1, "name": "工作", "updated_at": 100}]}},
+    }
+
+
+def _seed(client: TestClient, tools_data: dict[str, Any]) -> int:
+    resp = client.post(
+        "/sync/v2",
+        json={
+            "protocol_version": 2,
+            "user_id": "u1",
+            "client_time": 1730000000000,
+            "client_state": {"last_server_revision": None, "client_is_empty": False},
+            "tools_data": tools_data,
+        },
+    )
+    return resp.json()["server_revision"]
+
+
+def _patch_req(patch: list[dict[str, Any]], result: dict[str, Any], *, base: int) -> dict[str, Any]:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000100,
+        "client_state": {"last_server_revision": base, "client_is_empty": False},
+        "patch": patch,
+        "tool_hashes": {tool_id: hash_tool_snapshot(tool)[1] for tool_id, tool in result.items()},
+    }
+
+
+def test_patch_upload_commits_new_revision() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        base = _tools_data()
+        revision = _seed(client, base)
+
+        patch = [
+            {"op": "replace", "path": "/work_log/data/time_entries/7/minutes", "value": 45},
+            {"op": "replace", "path": "/work_log/data/time_entries/7/updated_at", "value": 200},
+        ]
+        result = copy.deepcopy(base)
+        result["work_log"]["data"]["time_entries"][7]["minutes"] = 45
+        result["work_log"]["data"]["time_entries"][7]["updated_at"] = 200
+
+        request = _patch_req(patch, result, base=revision)
+        assert len(json.dumps(request)) < 600
+        resp = client.post("/sync/v2/patch", json=request)
+        assert resp.status_code == 200
+        body = resp.json()
+        assert body["decision"] == "use_client"
+        assert body["server_revision"] == revision + 1
+
+        stored = app.state.store.get_snapshot("u1")
+        assert stored.tools_data == result
+        assert stored.updated_at_ms == 200
+
+
+def test_patch_upload_rejects_stale_base_and_hash_mismatch() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        base = _tools_data()
+        revision = _seed(client, base)
+        patch = [{"op": "remove", "path": "/tags"}]
+        result = {"work_log": base["work_log"]}
+
+        stale = client.post("/sync/v2/patch", json=_patch_req(patch, result, base=revision - 1))
+        assert stale.status_code == 409
+        assert stale.json() == {"message": "补丁基准版本不是服务端最新版本", "server_revision": revision}
+
+        mismatch = client.post("/sync/v2/patch", json=_patch_req(patch, base, base=revision))
+        assert mismatch.status_code == 409
+        assert mismatch.json()["message"] == "应用补丁后的快照 hash 与客户端不一致"
+
+        broken = client.post(
+            "/sync/v2/patch",
+            json=_patch_req([{"op": "remove", "path": "/work_log/data/missing"}], result, base=revision),
+        )
+        assert broken.status_code == 400
+
+        assert app.state.store.get_snapshot("u1").server_revision == revision
+        assert app.state.store.get_snapshot("u1").tools_data == base
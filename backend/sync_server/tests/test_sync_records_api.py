@@ -1,8 +1,15 @@
 import tempfile
+import threading
+import time
+from typing import Any
 
+import pytest
 from fastapi.testclient import TestClient
 
+import sync_server.main as main_module
+from sync_server.audit_diff import AuditDiffWorker
 from sync_server.main import create_app
+from sync_server.storage import SqliteSnapshotStore
 
 
 def test_sync_records_list_and_detail() -> None:
@@ -108,3 +115,158 @@ def test_noop_sync_should_not_create_record() -> None:
         # 仅有首次 use_client 的 1 条记录
         assert len(records) == 1
 
+
+def _work_log_request(*, title: str, last_rev: int | None, client_time: int) -> dict:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": client_time,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": False},
+        "tools_data": {
+            "work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": title, "updated_at": client_time}]}}
+        },
+    }
+
+
+def test_sync_record_diff_is_filled_in_background(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        client.post("/sync/v2", json=_work_log_request(title="A", last_rev=None, client_time=100))
+        assert app.state.audit_diffs.wait_idle(timeout_s=5)
+
+        gate = threading.Event()
+        original = main_module.build_snapshot_diff
+
+        def _gated_diff(*args: Any, **kwargs: Any) -> dict[str, Any]:
+            assert gate.wait(timeout=5)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(main_module, "build_snapshot_diff", _gated_diff)
+        resp = client.post("/sync/v2", json=_work_log_request(title="B", last_rev=1, client_time=200))
+        # 响应不等 diff：记录已提交，diff 仍在后台计算
+        assert resp.json()["server_revision"] == 2
+        latest = client.get("/sync/records", params={"user_id": "u1"}).json()["records"][0]
+        assert latest["server_revision_after"] == 2
+        assert (latest["diff_status"], latest["diff_summary"]) == ("pending", {})
+        pending_view = client.get("/dashboard/users/u1")
+        assert pending_view.json()["recent_records"][0]["diff_status"] == "pending"
+
+        gate.set()
+        assert app.state.audit_diffs.wait_idle(timeout_s=5)
+        # diff 回填后 Dashboard 详情的 ETag 随之变化，旧缓存不会一直停在 pending
+        refreshed = client.get("/dashboard/users/u1", headers={"If-None-Match": pending_view.headers["etag"]})
+        assert refreshed.status_code == 200
+        assert refreshed.json()["recent_records"][0]["diff_status"] == "ready"
+        assert client.get("/dashboard/users/u1", headers={"If-None-Match": refreshed.headers["etag"]}).status_code == 304
+        detail = client.get(f"/sync/records/{latest['id']}", params={"user_id": "u1"}).json()["record"]
+        assert detail["diff_status"] == "ready"
+        assert detail["diff"]["tools"]["work_log"]["diff_items"] == [
+            {"path": "data.tasks[id=1].title", "change": "value_changed"},
+            {"path": "data.tasks[id=1].updated_at", "change": "value_changed"},
+        ]
+
+
+def test_pending_diffs_are_recomputed_from_history_on_startup() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        with TestClient(create_app(db_path=db_path)) as client:
+            client.post("/sync/v2", json=_work_log_request(title="A", last_rev=None, client_time=100))
+
+        # 模拟进程在提交后、diff 算完前退出：后台任务被丢弃，记录停留在 pending
+        store = SqliteSnapshotStore(db_path=db_path)
+        store.set_deferred_diff_handler(lambda _record_id, _compute: None)
+        try:
+            with store.unit_of_work("u1") as uow:
+                before = uow.get_snapshot("u1")
+                assert before is not None
+                revision = uow.save_client_snapshot(
+                    user_id="u1",
+                    tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": "B"}]}}},
+                    updated_at_ms=200,
+                    server_time_ms=200,
+                    client_time_ms=None,
+                )
+                for decision, revision_after in (("dashboard_update", revision), ("use_server", 1)):
+                    uow.add_sync_record(
+                        user_id="u1",
+                        protocol_version=99,
+                        decision=decision,
+                        server_time_ms=200,
+                        client_time_ms=None,
+                        client_updated_at_ms=200,
+                        server_updated_at_ms_before=100,
+                        server_updated_at_ms_after=200,
+                        server_revision_before=1,
+                        server_revision_after=revision_after,
+                        diff={"dashboard_message": "手动修改"},
+                        compute_diff=lambda: {"unreachable": True},
+                    )
+            assert len(store.list_pending_sync_records()) == 2
+        finally:
+            store.close()
+
+        app = create_app(db_path=db_path)
+        with TestClient(app) as client:
+            assert app.state.audit_diffs.wait_idle(timeout_s=5)
+            records = client.get("/sync/records", params={"user_id": "u1"}).json()["records"]
+            by_decision = {record["decision"]: record for record in records}
+
+            recomputed = client.get(
+                f"/sync/records/{by_decision['dashboard_update']['id']}", params={"user_id": "u1"}
+            ).json()["record"]
+            assert recomputed["diff_status"] == "ready"
+            assert recomputed["diff"]["dashboard_message"] == "手动修改"
+            assert recomputed["diff"]["tools"]["work_log"]["diff_items"][0]["path"].startswith("data.tasks[id=1]")
+            # revision 未变化的记录缺少客户端数据，无法重算：保留占位内容并说明原因，不记为失败
+            unavailable = client.get(
+                f"/sync/records/{by_decision['use_server']['id']}", params={"user_id": "u1"}
+            ).json()["record"]
+            assert unavailable["diff_status"] == "ready"
+            assert unavailable["diff"]["dashboard_message"] == "手动修改"
+            assert "unavailable" in unavailable["diff"]
+
+
+def _add_pending_record(store: SqliteSnapshotStore, *, server_time_ms: int) -> int:
+    with store.unit_of_work("u1") as uow:
+        return uow.add_sync_record(
+            user_id="u1",
+            protocol_version=99,
+            decision="use_server",
+            server_time_ms=server_time_ms,
+            client_time_ms=None,
+            client_updated_at_ms=server_time_ms,
+            server_updated_at_ms_before=0,
+            server_updated_at_ms_after=0,
+            server_revision_before=0,
+            server_revision_after=0,
+            compute_diff=lambda: {"unreachable": True},
+        )
+
+
+def test_resume_claims_only_stale_pending_records_until_none_are_left() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSnapshotStore(db_path=f"{tmp}/sync.db")
+        # 模拟写入后进程退出：提交后的 diff 任务被丢弃
+        store.set_deferred_diff_handler(lambda _record_id, _compute: None)
+        try:
+            stale_ids = [_add_pending_record(store, server_time_ms=200 + i) for i in range(5)]
+            # 仍在运行的兄弟进程刚写入、正在计算的记录
+            live_id = _add_pending_record(store, server_time_ms=int(time.time() * 1000))
+
+            worker = AuditDiffWorker(store=store, max_pending=2)
+            try:
+                # 多于一批（max_pending）的遗留记录也在一次启动里全部处理完
+                assert worker.resume_pending()
+                assert worker.wait_idle(timeout_s=5)
+                assert [record.id for record in store.list_pending_sync_records()] == [live_id]
+                assert {store.get_sync_record(record_id).diff_status for record_id in stale_ids} == {"ready"}
+            finally:
+                worker.close()
+
+            # 关闭后的提交退化为在调用方线程计算，不会因线程池已关闭而让已提交的请求失败
+            worker.submit(live_id, lambda: {"tools": {}})
+            assert store.get_sync_record(live_id).diff_status == "ready"
+            assert not worker.resume_pending()
+        finally:
+            store.close()
@@ -72,6 +72,17 @@ def test_snapshot_by_revision_api() -> None:
         missing = client.get("/sync/snapshots/999", params={"user_id": "u1"})
         assert missing.status_code == 404
 
+        # 历史版本不可变：带 ETag 重新请求直接 304
+        assert "immutable" in snap1.headers["cache-control"]
+        cached = client.get(
+            "/sync/snapshots/1",
+            params={"user_id": "u1"},
+            headers={"If-None-Match": snap1.headers["etag"]},
+        )
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert snap1.headers["etag"] != snap2.headers["etag"]
+
 
 def test_rollback_should_create_new_revision_and_record() -> None:
     with tempfile.TemporaryDirectory() as tmp:
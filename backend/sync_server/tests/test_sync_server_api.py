@@ -346,3 +346,55 @@ def test_sync_v2_preview_server_update_should_not_create_record() -> None:
         items = records.json()["records"]
         assert len(items) == 1
         assert items[0]["decision"] == "use_client"
+
+
+def test_sync_v2_use_server_splices_stored_json_verbatim() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        tools_data = {
+            "work_log": {
+                "version": 1,
+                "data": {"tasks": [{"id": 1, "title": "整理周报", "updated_at": 100}], "time_entries": []},
+            }
+        }
+        resp1 = client.post(
+            "/sync/v2",
+            json={
+                "protocol_version": 2,
+                "user_id": "u_raw",
+                "client_time": 1730000000000,
+                "client_state": {"last_server_revision": None, "client_is_empty": False},
+                "tools_data": tools_data,
+            },
+        )
+        assert resp1.json()["decision"] == "use_client"
+
+        resp2 = client.post(
+            "/sync/v2",
+            json={
+                "protocol_version": 2,
+                "user_id": "u_raw",
+                "client_time": 1730000000100,
+                "client_state": {"last_server_revision": None, "client_is_empty": True},
+                "tools_data": {},
+            },
+        )
+        assert resp2.status_code == 200
+        assert resp2.headers["content-type"].startswith("application/json")
+        body = resp2.json()
+        assert body == {
+            "success": True,
+            "decision": "use_server",
+            "message": "server newer than client",
+            "tools_data": tools_data,
+            "server_time": body["server_time"],
+            "server_revision": 1,
+        }
+        stored = app.state.store.get_snapshot("u_raw").tools_data_json
+        assert f'"tools_data":{stored},'.encode("utf-8") in resp2.content
+
+        stats = client.get("/dashboard/cache-stats").json()["snapshot_cache"]
+        assert stats["hits"] >= 1
+        assert stats["entries"] == 1
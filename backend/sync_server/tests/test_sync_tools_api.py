@@ -0,0 +1,101 @@
+import tempfile
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+from sync_server.sync_logic import decide_tool_sync_by_revision
+
+
+def _work_log(title: str, updated_at: int) -> dict[str, Any]:
+    return {"version": 1, "data": {"tasks": [{"id": 1, "title": title, "updated_at": updated_at}]}}
+
+
+def _stockpile(name: str, updated_at: int) -> dict[str, Any]:
+    return {"version": 1, "data": {"items": [{"id": 1, "name": name, "updated_at": updated_at}]}}
+
+
+def _req(tools_data: dict[str, Any], *, last_rev: int | None) -> dict[str, Any]:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000000,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": not tools_data},
+        "tools_data": tools_data,
+    }
+
+
+def test_per_tool_sync_merges_edits_from_two_devices() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        base = {"work_log": _work_log("周报", 100), "stockpile_assistant": _stockpile("大米", 100)}
+        first = client.post("/sync/v2/tools", json=_req(base, last_rev=None)).json()
+        assert first["decision"] == "use_client"
+        assert first["tool_decisions"] == {"stockpile_assistant": "use_client", "work_log": "use_client"}
+        assert first["server_revision"] == 1
+
+        # 设备 A 只改了囤货
+        device_a = {**base, "stockpile_assistant": _stockpile("面粉", 200)}
+        resp_a = client.post("/sync/v2/tools", json=_req(device_a, last_rev=1)).json()
+        assert resp_a["tool_decisions"] == {"stockpile_assistant": "use_client", "work_log": "noop"}
+        assert resp_a["server_revision"] == 2
+
+        # 设备 B 基于 rev=1 改了工作记录：工作记录以 B 为准，囤货以服务端为准
+        device_b = {**base, "work_log": _work_log("月报", 150)}
+        resp_b = client.post("/sync/v2/tools", json=_req(device_b, last_rev=1)).json()
+        assert resp_b["decision"] == "mixed"
+        assert resp_b["tool_decisions"] == {"stockpile_assistant": "use_server", "work_log": "use_client"}
+        assert resp_b["tools_data"] == {"stockpile_assistant": device_a["stockpile_assistant"]}
+        assert resp_b["server_revision"] == 3
+
+        # 审计 diff 对比的是实际提交的合并快照：沿用服务端的囤货不算变更
+        assert app.state.audit_diffs.wait_idle(timeout_s=5)
+        record_id = client.get("/sync/records", params={"user_id": "u1"}).json()["records"][0]["id"]
+        diff = client.get(f"/sync/records/{record_id}", params={"user_id": "u1"}).json()["record"]["diff"]
+        assert diff["summary"]["changed_tools"] == 1
+        assert diff["tools"]["work_log"]["same"] is False
+        assert diff["tools"]["stockpile_assistant"]["same"] is True
+
+        stored = app.state.store.get_snapshot("u1")
+        assert stored.tools_data == {
+            "work_log": device_b["work_log"],
+            "stockpile_assistant": device_a["stockpile_assistant"],
+        }
+
+        noop = client.post("/sync/v2/tools", json=_req(stored.tools_data, last_rev=3)).json()
+        assert noop["decision"] == "noop"
+        assert noop["server_revision"] == 3
+
+
+def test_per_tool_sync_propagates_server_side_tool_removal() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        base = {"tags": _stockpile("工作", 100), "stockpile_assistant": _stockpile("大米", 100)}
+        client.post("/sync/v2/tools", json=_req(base, last_rev=None))
+        client.put("/dashboard/users/u1/snapshot", json={"tools_data": {"tags": base["tags"]}})
+
+        resp = client.post("/sync/v2/tools", json=_req(base, last_rev=1)).json()
+        assert resp["tool_decisions"] == {"stockpile_assistant": "use_server", "tags": "noop"}
+        assert resp["removed_tool_ids"] == ["stockpile_assistant"]
+        assert resp["tools_data"] == {}
+
+
+def test_decide_tool_sync_follows_tool_revision() -> None:
+    common = {
+        "same_content": False,
+        "client_has_tool": True,
+        "client_tool_is_empty": False,
+        "client_last_server_revision": 5,
+        "client_tool_updated_at_ms": 300,
+        "server_has_tool": True,
+        "server_tool_deleted": False,
+        "server_tool_is_empty": False,
+        "server_tool_updated_at_ms": 100,
+    }
+    assert decide_tool_sync_by_revision(**common, server_tool_revision=3) == "use_client"
+    assert decide_tool_sync_by_revision(**common, server_tool_revision=6) == "use_server"
+    assert decide_tool_sync_by_revision(**{**common, "same_content": True}, server_tool_revision=6) == "noop"
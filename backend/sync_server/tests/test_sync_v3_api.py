@@ -0,0 +1,107 @@
+import tempfile
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+from sync_server.sync_diff import hash_tool_snapshot
+
+
+def _work_log(task_id: int, updated_at: int) -> dict[str, Any]:
+    return {
+        "version": 1,
+        "data": {"tasks": [{"id": task_id, "title": "整理周报", "updated_at": updated_at}], "time_entries": []},
+    }
+
+
+def _tags(tag: str, updated_at: int) -> dict[str, Any]:
+    return {"version": 1, "data": {"tags": [{"id": 1, "name": tag, "updated_at": updated_at}]}}
+
+
+def _v3_req(
+    tools_data: dict[str, Any],
+    *,
+    last_rev: int | None,
+    upload: list[str] | None = None,
+) -> dict[str, Any]:
+    body: dict[str, Any] = {
+        "protocol_version": 3,
+        "user_id": "u1",
+        "client_time": 1730000000000,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": not tools_data},
+        "tools": {
+            tool_id: {
+                "hash": hash_tool_snapshot(tool)[1],
+                "updated_at_ms": max(row["updated_at"] for rows in tool["data"].values() for row in rows),
+            }
+            for tool_id, tool in tools_data.items()
+        },
+    }
+    if upload is not None:
+        body["tools_data"] = {tool_id: tools_data[tool_id] for tool_id in upload}
+    return body
+
+
+def test_sync_v3_uploads_only_tools_the_server_asks_for() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        device_a = {"work_log": _work_log(1, 100), "tags": _tags("工作", 100)}
+        handshake = client.post("/sync/v3", json=_v3_req(device_a, last_rev=None)).json()
+        assert handshake["decision"] == "need_tools"
+        assert sorted(handshake["need_tool_ids"]) == ["tags", "work_log"]
+
+        commit = client.post(
+            "/sync/v3",
+            json=_v3_req(device_a, last_rev=None, upload=handshake["need_tool_ids"]),
+        ).json()
+        assert commit["decision"] == "use_client"
+        assert commit["server_revision"] == 1
+
+        again = client.post("/sync/v3", json=_v3_req(device_a, last_rev=1)).json()
+        assert again["decision"] == "noop"
+
+        # 只改了 work_log：服务端只点名 work_log，tags 沿用服务端已存内容
+        device_a["work_log"] = _work_log(2, 200)
+        handshake = client.post("/sync/v3", json=_v3_req(device_a, last_rev=1)).json()
+        assert handshake["decision"] == "need_tools"
+        assert handshake["need_tool_ids"] == ["work_log"]
+        commit = client.post("/sync/v3", json=_v3_req(device_a, last_rev=1, upload=["work_log"])).json()
+        assert commit["decision"] == "use_client"
+        assert commit["server_revision"] == 2
+
+        stored = app.state.store.get_snapshot("u1")
+        assert stored.tools_data == device_a
+        record = client.get("/sync/records", params={"user_id": "u1", "limit": 1}).json()["records"][0]
+        assert record["protocol_version"] == 3
+
+
+def test_sync_v3_use_server_returns_only_changed_tools() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        server_tools = {"work_log": _work_log(2, 200), "tags": _tags("工作", 100)}
+        client.post("/sync/v3", json=_v3_req(server_tools, last_rev=None, upload=["work_log", "tags"]))
+
+        device_b = {"tags": _tags("工作", 100), "stale": _tags("旧", 50)}
+        resp = client.post("/sync/v3", json=_v3_req(device_b, last_rev=None))
+        body = resp.json()
+        assert body["decision"] == "use_server"
+        assert body["server_revision"] == 1
+        assert body["tools_data"] == {"work_log": server_tools["work_log"]}
+        assert body["removed_tool_ids"] == ["stale"]
+
+
+def test_sync_v3_rejects_tools_that_do_not_match_declared_hash() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+
+        request = _v3_req({"work_log": _work_log(1, 100)}, last_rev=None, upload=["work_log"])
+        request["tools_data"]["work_log"] = _work_log(9, 100)
+        resp = client.post("/sync/v3", json=request)
+        assert resp.status_code == 400
+        assert resp.json()["message"] == "工具 work_log 的内容与声明的 hash 不一致"
+        assert app.state.store.get_snapshot("u1") is None
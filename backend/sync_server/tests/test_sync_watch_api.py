@@ -0,0 +1,124 @@
+import asyncio
+import tempfile
+import threading
+import time
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from sync_server.main import create_app
+from sync_server.revision_watcher import RevisionWatcher
+from sync_server.storage import SqliteSnapshotStore
+
+
+def _sync(client: TestClient, title: str, *, last_rev: int | None, updated_at: int = 100) -> dict[str, Any]:
+    return client.post(
+        "/sync/v2",
+        json={
+            "protocol_version": 2,
+            "user_id": "u1",
+            "client_time": 1730000000000,
+            "client_state": {"last_server_revision": last_rev, "client_is_empty": False},
+            "tools_data": {
+                "work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": title, "updated_at": updated_at}]}}
+            },
+        },
+    ).json()
+
+
+def test_watch_returns_immediately_when_client_is_behind_and_times_out_when_idle() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        client = TestClient(create_app(db_path=f"{tmp}/sync.db"))
+        _sync(client, "周报", last_rev=None)
+
+        behind = client.get("/sync/watch", params={"user_id": "u1", "since_revision": 0}).json()
+        assert behind == {"success": True, "changed": True, "server_revision": 1}
+
+        started = time.monotonic()
+        idle = client.get("/sync/watch", params={"user_id": "u1", "since_revision": 1, "timeout_s": 0.3}).json()
+        assert idle == {"success": True, "changed": False, "server_revision": 1}
+        assert time.monotonic() - started >= 0.3
+
+
+def test_watch_wakes_up_when_another_device_commits() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        _sync(TestClient(app), "周报", last_rev=None)
+
+        result: dict[str, Any] = {}
+
+        def _watch() -> None:
+            started = time.monotonic()
+            result["body"] = (
+                TestClient(app)
+                .get("/sync/watch", params={"user_id": "u1", "since_revision": 1, "timeout_s": 10})
+                .json()
+            )
+            result["elapsed"] = time.monotonic() - started
+
+        watcher = threading.Thread(target=_watch)
+        watcher.start()
+        time.sleep(0.3)
+        assert _sync(TestClient(app), "月报", last_rev=1, updated_at=200)["server_revision"] == 2
+        watcher.join(timeout=10)
+
+        assert result["body"] == {"success": True, "changed": True, "server_revision": 2}
+        assert result["elapsed"] < 5
+
+
+def test_watcher_wakes_only_the_user_whose_revision_advanced() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = f"{tmp}/sync.db"
+        store = SqliteSnapshotStore(db_path=db_path)
+        other_process = SqliteSnapshotStore(db_path=db_path)
+        watcher = RevisionWatcher(db_path=db_path, read_revisions=store.get_snapshot_revisions, poll_interval_s=0.02)
+        store.set_revision_listener(watcher.publish)
+        point_reads: list[str] = []
+
+        def _save(target: SqliteSnapshotStore, user_id: str, updated_at: int) -> None:
+            target.save_client_snapshot(
+                user_id=user_id,
+                tools_data={"work_log": {"version": 1, "data": {"tasks": [{"id": 1, "updated_at": updated_at}]}}},
+                updated_at_ms=updated_at,
+                server_time_ms=updated_at,
+                client_time_ms=None,
+            )
+
+        def _watch(user_id: str, timeout_s: float) -> Any:
+            def _read() -> int:
+                point_reads.append(user_id)
+                return store.get_snapshot_revision(user_id)
+
+            return watcher.wait_for_revision(
+                user_id=user_id,
+                read_revision=_read,
+                since_revision=0,
+                timeout_s=timeout_s,
+            )
+
+        async def _scenario() -> tuple[int, int]:
+            idle = asyncio.create_task(_watch("u2", 0.5))
+            woken = asyncio.create_task(_watch("u1", 5))
+            await asyncio.sleep(0.1)
+            # 本进程写入经 publish 唤醒 u1；u2 的等待者不会被唤醒，也不会再回库点查
+            _save(store, "u1", 100)
+            assert await asyncio.wait_for(woken, timeout=1) == 1
+            for updated_at in (200, 300):
+                _save(store, "u1", updated_at)
+                await asyncio.sleep(0.05)
+            return await idle, await _other_process_wakes_u3()
+
+        async def _other_process_wakes_u3() -> int:
+            # 其它进程的写入没有 publish，由 data_version 轮询发现
+            waiting = asyncio.create_task(_watch("u3", 5))
+            await asyncio.sleep(0.1)
+            _save(other_process, "u3", 100)
+            return await asyncio.wait_for(waiting, timeout=2)
+
+        try:
+            assert asyncio.run(_scenario()) == (0, 1)
+            assert sorted(point_reads) == ["u1", "u2", "u3"]
+        finally:
+            watcher.close()
+            other_process.close()
+            store.close()
@@ -0,0 +1,89 @@
+import tempfile
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import sync_server.wire_format as wire_format
+from sync_server.main import create_app
+from sync_server.wire_format import wants_msgpack
+
+msgpack = pytest.importorskip("msgpack")
+
+
+def _sync_body(tools_data: dict[str, Any], *, last_rev: int | None) -> dict[str, Any]:
+    return {
+        "protocol_version": 2,
+        "user_id": "u1",
+        "client_time": 1730000000000,
+        "client_state": {"last_server_revision": last_rev, "client_is_empty": not tools_data},
+        "tools_data": tools_data,
+    }
+
+
+def test_sync_v2_accepts_and_returns_msgpack() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=f"{tmp}/sync.db")
+        client = TestClient(app)
+        tools_data = {"work_log": {"version": 1, "data": {"tasks": [{"id": 1, "title": "整理周报", "updated_at": 100}]}}}
+
+        resp = client.post(
+            "/sync/v2",
+            content=msgpack.packb(_sync_body(tools_data, last_rev=None)),
+            headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"},
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(resp.content)["decision"] == "use_client"
+
+        pulled = client.post(
+            "/sync/v2",
+            content=msgpack.packb(_sync_body({}, last_rev=0)),
+            headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"},
+        )
+        body = msgpack.unpackb(pulled.content)
+        assert body["decision"] == "use_server"
+        assert body["tools_data"] == tools_data
+
+        # 默认仍是 JSON
+        snapshot = client.get("/sync/snapshots/1", params={"user_id": "u1"})
+        assert snapshot.headers["content-type"] == "application/json"
+        packed = client.get("/sync/snapshots/1", params={"user_id": "u1"}, headers={"Accept": "application/msgpack"})
+        assert msgpack.unpackb(packed.content)["snapshot"]["tools_data"] == tools_data
+        assert packed.headers["etag"].startswith("W/")
+
+        # 同一 URL 的两种表示都声明按 Accept 变化
+        assert "Accept" in snapshot.headers["vary"].split(", ")
+        assert "Accept" in packed.headers["vary"].split(", ")
+
+        broken = client.post("/sync/v2", content=b"\xc1", headers={"Content-Type": "application/msgpack"})
+        assert broken.status_code == 400
+        assert broken.headers["content-type"] == "application/json"
+
+
+def test_wants_msgpack_requires_explicit_preference() -> None:
+    assert not wants_msgpack(None)
+    assert not wants_msgpack("*/*")
+    assert not wants_msgpack("application/json, application/msgpack;q=0.5")
+    assert wants_msgpack("application/msgpack, application/json;q=0.9")
+
+
+def test_msgpack_response_models_are_encoded_without_json_round_trip(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        client = TestClient(create_app(db_path=f"{tmp}/sync.db"))
+        tools_data = {"work_log": {"version": 1, "data": {"tasks": [{"id": 1, "updated_at": 100}]}}}
+
+        class _NoJson:
+            @staticmethod
+            def loads(_text: str) -> Any:
+                raise AssertionError("响应模型不应先序列化为 JSON 再转换")
+
+        monkeypatch.setattr(wire_format, "json", _NoJson)
+        resp = client.post(
+            "/sync/v2",
+            json=_sync_body(tools_data, last_rev=None),
+            headers={"Accept": "application/msgpack"},
+        )
+        assert resp.status_code == 200
+        assert msgpack.unpackb(resp.content)["decision"] == "use_client"
+        assert "Accept" in resp.headers["vary"].split(", ")
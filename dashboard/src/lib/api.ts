@@ -49,8 +49,23 @@ async function requestJson<T>(path: string, init?: RequestInit): Promise<T> {
 }
 
 export async function fetchDashboardUsers() {
-  const response = await requestJson<{ success: true; users: DashboardUserSummary[] }>('/dashboard/users');
-  return response.users;
+  // 后端按游标分页，这里顺着 next_cursor 取完整列表
+  const users: DashboardUserSummary[] = [];
+  let cursor: string | null = null;
+  do {
+    const query = new URLSearchParams({ limit: '200' });
+    if (cursor) {
+      query.set('cursor', cursor);
+    }
+    const response = await requestJson<{
+      success: true;
+      users: DashboardUserSummary[];
+      next_cursor: string | null;
+    }>(`/dashboard/users?${query.toString()}`);
+    users.push(...response.users);
+    cursor = response.next_cursor;
+  } while (cursor);
+  return users;
 }
 
 export async function fetchDashboardUserDetail(userId: string) {
@@ -55,6 +55,10 @@ class SyncDiffPresenter {
       final index = int.tryParse(match.group(1) ?? '0') ?? 0;
       return ' > 第${index + 1}项';
     });
+    readablePath = readablePath.replaceAllMapped(
+      RegExp(r'\[id=([^\]]*)\]'),
+      (match) => ' > #${match.group(1)}',
+    );
     readablePath = readablePath.replaceAll('.', ' > ');
 
     String label;
@@ -91,6 +95,14 @@ class SyncDiffPresenter {
           details = '内容已变更';
         }
         break;
+      case 'moved':
+        label = '移动';
+        final from = raw['server_index'];
+        final to = raw['client_index'];
+        if (from is int && to is int) {
+          details = '第${from + 1}项 → 第${to + 1}项';
+        }
+        break;
       case 'type_changed':
         label = '类型变更';
         details = '${raw['server_type']} → ${raw['client_type']}';
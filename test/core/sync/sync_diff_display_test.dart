@@ -76,5 +76,19 @@ void main() {
       final display = SyncDiffPresenter.formatDiffItem('tool', rawDiff);
       expect(display.path, 'items > 第1项 > name');
     });
+
+    test('Should format id-keyed row paths and moves', () {
+      final rawDiff = {
+        'change': 'moved',
+        'path': 'data.tasks[id=42]',
+        'server_index': 0,
+        'client_index': 2,
+      };
+
+      final display = SyncDiffPresenter.formatDiffItem('work_log', rawDiff);
+      expect(display.label, '移动');
+      expect(display.path, 'data > tasks > #42');
+      expect(display.details, '第1项 → 第3项');
+    });
   });
 }